@@ -0,0 +1,123 @@
+"""
+إحصائيات الأسئلة للمسابقات
+تُحسب جميع الإحصائيات داخل قاعدة البيانات باستخدام GROUP BY على جدول الإجابات المُصحّحة
+(participation_answer) بدلاً من تحميل بيانات الإجابات لكل مشاركة وتحليلها في Python
+"""
+
+from sqlalchemy import func, case
+from app import db
+from models import ParticipationAnswer
+from answer_key import CHOICE_QUESTION_TYPES
+
+# أنواع الأسئلة التي يُعرض لها توزيع الخيارات (الإجابات النصية الحرة لا تُجمّع)
+DISTRIBUTION_QUESTION_TYPES = CHOICE_QUESTION_TYPES + ('true_false',)
+
+
+def get_question_stats(competition_id):
+    """
+    إحصائيات كل سؤال في المسابقة: عدد المشاركين، عدد من أجابوا، الإجابات الصحيحة،
+    نسبة الإجابة الصحيحة ومتوسط الوقت المستغرق
+
+    Returns:
+        dict: question_id -> قاموس الإحصائيات
+    """
+    rows = db.session.query(
+        ParticipationAnswer.question_id,
+        func.count(ParticipationAnswer.id).label('total'),
+        func.count(ParticipationAnswer.answer).label('answered'),
+        func.sum(case((ParticipationAnswer.is_correct == True, 1), else_=0)).label('correct'),
+        func.avg(ParticipationAnswer.time_spent).label('mean_time')
+    ).filter(
+        ParticipationAnswer.competition_id == competition_id
+    ).group_by(
+        ParticipationAnswer.question_id
+    ).all()
+
+    stats = {}
+    for row in rows:
+        correct = int(row.correct or 0)
+        stats[row.question_id] = {
+            'total': row.total,
+            'answered': row.answered,
+            'correct': correct,
+            'correct_rate': (correct / row.total) * 100 if row.total else 0,
+            'mean_time': float(row.mean_time) if row.mean_time is not None else None,
+        }
+    return stats
+
+
+def get_option_distribution(competition_id, question_ids):
+    """
+    توزيع الإجابات المختارة لكل سؤال
+
+    Args:
+        competition_id: معرف المسابقة
+        question_ids: معرفات الأسئلة المطلوب توزيعها (أسئلة الخيارات فقط)
+
+    Returns:
+        dict: question_id -> {الإجابة الخام: العدد}
+    """
+    if not question_ids:
+        return {}
+
+    rows = db.session.query(
+        ParticipationAnswer.question_id,
+        ParticipationAnswer.answer,
+        func.count(ParticipationAnswer.id).label('count')
+    ).filter(
+        ParticipationAnswer.competition_id == competition_id,
+        ParticipationAnswer.question_id.in_(question_ids),
+        ParticipationAnswer.answer.isnot(None)
+    ).group_by(
+        ParticipationAnswer.question_id,
+        ParticipationAnswer.answer
+    ).all()
+
+    distribution = {}
+    for row in rows:
+        distribution.setdefault(row.question_id, {})[row.answer] = row.count
+    return distribution
+
+
+def get_competition_analytics(competition, questions):
+    """
+    تجميع إحصائيات الأسئلة وتوزيع الخيارات بصيغة جاهزة للعرض في لوحة التحكم
+
+    Args:
+        competition: كائن المسابقة
+        questions: أسئلة المسابقة بالترتيب المطلوب للعرض
+
+    Returns:
+        list: قائمة من القواميس لكل سؤال
+    """
+    stats = get_question_stats(competition.id)
+    distribution = get_option_distribution(competition.id, [
+        question.id for question in questions
+        if question.question_type in DISTRIBUTION_QUESTION_TYPES
+    ])
+
+    analytics = []
+    for question in questions:
+        question_stats = stats.get(question.id, {
+            'total': 0, 'answered': 0, 'correct': 0, 'correct_rate': 0, 'mean_time': None
+        })
+        counts = distribution.get(question.id, {})
+
+        # تحويل الإجابات الخام إلى نصوص الخيارات
+        options = []
+        if question.question_type in CHOICE_QUESTION_TYPES:
+            for index, option_text in enumerate(question.options_list):
+                options.append({'text': option_text, 'count': counts.get(str(index), 0)})
+        elif question.question_type == 'true_false':
+            options.append({'text': 'صواب', 'count': counts.get('true', 0) + counts.get('True', 0)})
+            options.append({'text': 'خطأ', 'count': counts.get('false', 0) + counts.get('False', 0)})
+
+        for option in options:
+            option['percentage'] = (option['count'] / question_stats['answered']) * 100 if question_stats['answered'] else 0
+
+        analytics.append({
+            'question': question,
+            'stats': question_stats,
+            'options': options,
+        })
+    return analytics
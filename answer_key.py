@@ -0,0 +1,224 @@
+"""
+مفتاح الإجابات المُجمّع للمسابقات
+يحوّل أسئلة المسابقة إلى بنية جاهزة للتصحيح (خيارات محللة مسبقًا، مجموعات الإجابات الصحيحة،
+قيم النقاط) ويحتفظ بها في ذاكرة العملية حسب رقم الإصدار، بحيث يصبح تصحيح كل سؤال
+بحثًا في قاموس بدلاً من تحليل JSON والوصول إلى خصائص ORM عند كل تقديم
+"""
+
+import json
+import threading
+from app import app, db
+
+# أنواع الأسئلة حسب طريقة التصحيح
+CHOICE_QUESTION_TYPES = ('multiple_choice', 'image_choice')
+TEXT_QUESTION_TYPES = ('text', 'short_answer')
+
+# ذاكرة العملية لمفاتيح الإجابات: competition_id -> AnswerKey
+_answer_keys = {}
+_answer_keys_lock = threading.Lock()
+
+
+def _parse_options(raw_options):
+    """تحويل خيارات الإجابة من JSON إلى قائمة Python"""
+    if not raw_options:
+        return []
+    try:
+        options = json.loads(raw_options)
+    except (ValueError, TypeError):
+        return []
+    return options if isinstance(options, list) else []
+
+
+def _parse_selections(raw_value):
+    """تحويل إجابة متعددة الاختيارات (قائمة JSON أو نص مفصول بفواصل) إلى مجموعة نصوص"""
+    if raw_value is None:
+        return set()
+    if isinstance(raw_value, (list, tuple, set)):
+        return {str(item) for item in raw_value}
+    try:
+        parsed = json.loads(raw_value)
+        if isinstance(parsed, list):
+            return {str(item) for item in parsed}
+    except (ValueError, TypeError):
+        pass
+    return set(str(raw_value).split(','))
+
+
+class CompiledQuestion:
+    """نسخة مُجمّعة من سؤال جاهزة للتصحيح دون الرجوع إلى قاعدة البيانات"""
+
+    __slots__ = (
+        'id', 'question_type', 'options', 'points', 'partial_credit_enabled',
+        'correct_index', 'correct_value', 'correct_selections', 'correct_text'
+    )
+
+    def __init__(self, question):
+        self.id = question.id
+        self.question_type = question.question_type
+        self.options = _parse_options(question.options)
+        self.points = question.points
+        self.partial_credit_enabled = bool(question.partial_credit_enabled)
+        self.correct_index = -1
+        self.correct_value = None
+        self.correct_selections = frozenset()
+        self.correct_text = ""
+
+        correct_answer = question.correct_answer
+        if self.question_type in CHOICE_QUESTION_TYPES:
+            try:
+                self.correct_index = int(correct_answer)
+            except (ValueError, TypeError):
+                self.correct_index = -1
+            if 0 <= self.correct_index < len(self.options):
+                self.correct_text = self.options[self.correct_index]
+        elif self.question_type == 'true_false':
+            self.correct_value = str(correct_answer).lower()
+            self.correct_text = "صواب" if self.correct_value == "true" else "خطأ"
+        elif self.question_type in TEXT_QUESTION_TYPES:
+            self.correct_value = str(correct_answer).strip().lower()
+            self.correct_text = correct_answer
+        elif self.question_type == 'multiple_answers':
+            self.correct_selections = frozenset(_parse_selections(correct_answer))
+            self.correct_text = ", ".join([
+                self.options[int(i)] for i in self.correct_selections
+                if i.isdigit() and int(i) < len(self.options)
+            ])
+
+    def check(self, user_answer):
+        """التحقق من صحة إجابة المستخدم وحساب النقاط
+
+        Returns:
+            tuple: (صحيح/خطأ, النقاط المكتسبة, نص الإجابة الصحيحة)
+        """
+        is_correct = False
+        points_earned = 0
+
+        if self.question_type in CHOICE_QUESTION_TYPES:
+            try:
+                user_index = int(user_answer)
+            except (ValueError, TypeError):
+                user_index = -1
+            is_correct = user_index == self.correct_index
+
+        elif self.question_type == 'true_false':
+            is_correct = str(user_answer).lower() == self.correct_value
+
+        elif self.question_type in TEXT_QUESTION_TYPES:
+            is_correct = str(user_answer).strip().lower() == self.correct_value
+
+        elif self.question_type == 'multiple_answers':
+            if self.correct_selections:
+                user_selections = _parse_selections(user_answer)
+                if self.partial_credit_enabled:
+                    correct_matches = len(user_selections & self.correct_selections)
+                    partial_score = correct_matches / len(self.correct_selections)
+                    is_correct = partial_score == 1.0
+                    points_earned = self.points * partial_score
+                else:
+                    is_correct = user_selections == self.correct_selections
+
+        if is_correct:
+            points_earned = self.points
+
+        return (is_correct, points_earned, self.correct_text)
+
+    def answer_text(self, user_answer):
+        """نص إجابة المستخدم كما يُعرض في صفحة النتائج"""
+        if self.question_type in CHOICE_QUESTION_TYPES:
+            try:
+                option_index = int(user_answer)
+            except (ValueError, TypeError):
+                return user_answer
+            if 0 <= option_index < len(self.options):
+                return self.options[option_index]
+            return 'لم تتم الإجابة'
+        if self.question_type == 'true_false':
+            return 'صواب' if str(user_answer).lower() == 'true' else 'خطأ'
+        return user_answer
+
+
+class AnswerKey:
+    """مفتاح إجابات مسابقة كاملة لإصدار محدد من أسئلتها النشطة"""
+
+    def __init__(self, competition_id, version, questions):
+        self.competition_id = competition_id
+        self.version = version
+        self.questions = {}
+        self.question_ids = []
+        for question in questions:
+            self.questions[question.id] = CompiledQuestion(question)
+            self.question_ids.append(question.id)
+
+    @property
+    def total_questions(self):
+        """عدد الأسئلة النشطة في المفتاح"""
+        return len(self.question_ids)
+
+    def get(self, question_id):
+        """الحصول على السؤال المُجمّع أو None إذا لم يكن ضمن المفتاح"""
+        return self.questions.get(question_id)
+
+    def grade(self, question_id, user_answer):
+        """تصحيح إجابة سؤال واحد
+
+        Returns:
+            tuple: (صحيح/خطأ, النقاط المكتسبة, نص الإجابة الصحيحة)
+        """
+        return self.questions[question_id].check(user_answer)
+
+    def answer_text(self, question_id, user_answer):
+        """نص إجابة المستخدم للعرض"""
+        return self.questions[question_id].answer_text(user_answer)
+
+
+def get_answer_key(competition):
+    """
+    الحصول على مفتاح الإجابات المُجمّع للمسابقة من ذاكرة العملية
+    يُعاد تجميع المفتاح فقط عند تغير answer_key_version في سجل المسابقة
+
+    Args:
+        competition: كائن المسابقة (محمّل بالفعل في الطلب)
+
+    Returns:
+        AnswerKey: مفتاح الإجابات للإصدار الحالي
+    """
+    from models import Question
+
+    version = competition.answer_key_version or 1
+    answer_key = _answer_keys.get(competition.id)
+    if answer_key is not None and answer_key.version == version:
+        return answer_key
+
+    with _answer_keys_lock:
+        answer_key = _answer_keys.get(competition.id)
+        if answer_key is not None and answer_key.version == version:
+            return answer_key
+
+        questions = Question.query.filter_by(
+            competition_id=competition.id,
+            is_active=True
+        ).order_by(Question.order).all()
+
+        answer_key = AnswerKey(competition.id, version, questions)
+        _answer_keys[competition.id] = answer_key
+        app.logger.info(f"تم تجميع مفتاح الإجابات للمسابقة #{competition.id} (الإصدار {version}، {answer_key.total_questions} سؤال)")
+        return answer_key
+
+
+def invalidate_answer_key(competition_id):
+    """
+    إبطال مفتاح الإجابات للمسابقة بعد تعديل أسئلتها
+    يزيد رقم الإصدار في قاعدة البيانات ضمن المعاملة الحالية (يجب على المستدعي تنفيذ commit)
+    حتى تعيد جميع العمليات تجميع المفتاح عند الطلب التالي
+    """
+    from models import Competition
+
+    db.session.query(Competition).filter(
+        Competition.id == competition_id
+    ).update(
+        {Competition.answer_key_version: db.func.coalesce(Competition.answer_key_version, 1) + 1},
+        synchronize_session=False
+    )
+
+    with _answer_keys_lock:
+        _answer_keys.pop(competition_id, None)
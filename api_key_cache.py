@@ -0,0 +1,84 @@
+"""
+ذاكرة مؤقتة للمفاتيح التي تم التحقق منها في مصادقة API
+التحقق من المفتاح (PBKDF2 عبر APIKey.verify_key) بطيء عمدًا، وكان يُنفذ لكل مفتاح يطابق البادئة
+في كل طلب. هنا يُحفظ ناتج التحقق الناجح في ذاكرة LRU محدودة الحجم في كل عملية، بمفتاح هو
+HMAC-SHA256 سريع للمفتاح المُقدَّم (لا يُحفظ المفتاح نفسه)، فلا يدفع كلفة PBKDF2 إلا أول طلب.
+
+تُفرغ الذاكرة بالكامل عند تغير global_revocation_timestamp (يُحدَّث عند إلغاء أي مفتاح)،
+ويُحذف المفتاح منها مباشرة عند إلغائه أو إلغاء تنشيطه في نفس العملية.
+"""
+
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from app import app
+import config
+
+# نتيجة التحقق المحفوظة لكل مفتاح
+VerifiedKey = namedtuple('VerifiedKey', ['key_id', 'user_id', 'permissions', 'expires_at'])
+
+# المفاتيح التي تم التحقق منها: بصمة المفتاح -> (وقت الحفظ، VerifiedKey)
+_verified_keys = OrderedDict()
+_lock = threading.Lock()
+
+# قيمة global_revocation_timestamp التي بُنيت عليها الذاكرة الحالية
+_revocation_epoch = None
+
+
+def fingerprint(api_key):
+    """بصمة سريعة للمفتاح (HMAC بمفتاح التطبيق السري) تُستخدم كمفتاح للذاكرة"""
+    secret = (app.secret_key or '').encode('utf-8')
+    return hmac.new(secret, api_key.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def sync_revocation_epoch(epoch):
+    """إفراغ الذاكرة إذا تغير طابع الإلغاء العالمي منذ آخر طلب"""
+    global _revocation_epoch
+    if epoch == _revocation_epoch:
+        return
+    with _lock:
+        if epoch != _revocation_epoch:
+            _verified_keys.clear()
+            _revocation_epoch = epoch
+
+
+def get_verified_key(api_key):
+    """نتيجة التحقق المحفوظة للمفتاح، أو None (يجب عندها التحقق عبر PBKDF2)"""
+    key_fingerprint = fingerprint(api_key)
+    with _lock:
+        cached = _verified_keys.get(key_fingerprint)
+        if cached is None:
+            return None
+        cached_at, verified = cached
+        if time.time() - cached_at >= config.API_KEY_CACHE_TTL:
+            del _verified_keys[key_fingerprint]
+            return None
+        _verified_keys.move_to_end(key_fingerprint)
+        return verified
+
+
+def remember_verified_key(api_key, key):
+    """حفظ نتيجة تحقق ناجح (مع حذف الأقدم استخدامًا عند امتلاء الذاكرة)"""
+    verified = VerifiedKey(key.id, key.user_id, key.permissions, key.expires_at)
+    key_fingerprint = fingerprint(api_key)
+    with _lock:
+        _verified_keys[key_fingerprint] = (time.time(), verified)
+        _verified_keys.move_to_end(key_fingerprint)
+        while len(_verified_keys) > config.API_KEY_CACHE_SIZE:
+            _verified_keys.popitem(last=False)
+    return verified
+
+
+def invalidate_api_key(key_id):
+    """حذف جميع النتائج المحفوظة لمفتاح (عند إلغائه أو إلغاء تنشيطه)"""
+    with _lock:
+        for key_fingerprint in [fp for fp, (_, verified) in _verified_keys.items() if verified.key_id == key_id]:
+            del _verified_keys[key_fingerprint]
+
+
+def clear_api_key_cache():
+    """إفراغ الذاكرة بالكامل"""
+    with _lock:
+        _verified_keys.clear()
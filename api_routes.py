@@ -7,12 +7,22 @@ from flask import Blueprint, jsonify, request, g, current_app, make_response
 from flask_cors import CORS
 import time
 import json
-from app import app, db
+from urllib.parse import urlsplit
+import config
+from app import app, db, csrf
 from models import User, Reward, Referral, APIKey, PointsTransaction
 from api_utils import (
     require_api_key, api_rate_limit, log_api_call, 
     handle_api_error, APIError, sanitize_input
 )
+from api_key_cache import invalidate_api_key
+from keyset_pagination import keyset_paginate, decode_cursor
+from streaming_export import EXPORT_MIMETYPES, iter_keyset_rows, merge_sorted_rows, stream_export
+from ledger_archive import iter_archived_transactions, get_user_transactions_page
+from conditional_get import (
+    make_etag, not_modified, with_validators, get_poll_metadata,
+    get_user_version, get_referrals_version, get_reward_catalog_version
+)
 
 # إنشاء Blueprint للـ API
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
@@ -107,6 +117,41 @@ def health_check():
 # نقاط نهاية معلومات المستخدم
 # ============================================================
 
+# أعمدة تصدير سجلي المعاملات والإحالات
+TRANSACTION_EXPORT_COLUMNS = ['id', 'amount', 'balance_after', 'transaction_type', 'description', 'created_at']
+REFERRAL_EXPORT_COLUMNS = [
+    'id', 'referred_user_id', 'referred_username', 'status', 'reward_paid', 'reward_amount', 'created_at'
+]
+
+def _page_args():
+    """معلمات صفحة القائمة: الحد ومؤشرا الصفحة التالية (after) والسابقة (before)"""
+    limit = max(1, min(int(request.args.get('limit', 10)), 50))  # الحد الأقصى 50
+    return limit, request.args.get('after'), request.args.get('before')
+
+
+def _page_metadata(page):
+    """بيانات الصفحة الوصفية مع المؤشرات غير الشفافة للتنقل"""
+    return {
+        'limit': page.per_page,
+        'count': len(page.items),
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }
+
+
+def _export_args():
+    """صيغة التصدير (ndjson افتراضيًا أو csv) ومؤشر الاستئناف since"""
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in EXPORT_MIMETYPES:
+        raise APIError("صيغة التصدير غير مدعومة (ndjson أو csv)", status_code=400)
+    return export_format, request.args.get('since')
+
+
+def _user_last_modified(version):
+    """وقت آخر تغيير معروف لبيانات المستخدم (آخر معاملة أو وقت إنشاء الحساب)"""
+    return version[6] or version[4]
+
+
 @api_bp.route('/user/info', methods=['GET'])
 @require_api_key
 @api_rate_limit("60 per minute")
@@ -115,6 +160,18 @@ def get_user_info():
     try:
         # استخدام معرف المستخدم المُخزن في validate_api_key
         user_id = g.user_id
+        
+        # إرجاع 304 إذا لم تتغير بيانات المستخدم منذ آخر طلب (قبل تحميل كائن المستخدم)
+        version = get_user_version(user_id)
+        if not version:
+            raise APIError("لم يتم العثور على المستخدم", status_code=404)
+        etag = make_etag('user_info', version)
+        last_modified = _user_last_modified(version)
+        cached = not_modified('get_user_info', etag, last_modified)
+        if cached is not None:
+            log_api_call('get_user_info', 304, user_id=user_id)
+            return cached
+        
         user = User.query.get(user_id)
         
         if not user:
@@ -133,10 +190,11 @@ def get_user_info():
         # تسجيل الاستدعاء
         log_api_call('get_user_info', 200, user_id=user_id)
         
-        return jsonify({
+        return with_validators(jsonify({
             'status': 'success',
-            'data': response
-        })
+            'data': response,
+            'metadata': get_poll_metadata('get_user_info')
+        }), 'get_user_info', etag, last_modified)
         
     except APIError as e:
         # سيتم التقاطها بواسطة معالج الأخطاء المحدد أعلاه
@@ -153,23 +211,32 @@ def get_user_points():
     """الحصول على رصيد نقاط المستخدم"""
     try:
         user_id = g.user_id
-        user = User.query.get(user_id)
         
-        if not user:
+        # الرصيد وآخر معاملة في السجل يكفيان لمعرفة ما إذا تغير الرصيد
+        version = get_user_version(user_id)
+        if not version:
             raise APIError("لم يتم العثور على المستخدم", status_code=404)
+        points, last_transaction_id = version[0], version[5]
+        etag = make_etag('user_points', points, last_transaction_id)
+        last_modified = _user_last_modified(version)
+        cached = not_modified('get_user_points', etag, last_modified)
+        if cached is not None:
+            log_api_call('get_user_points', 304, user_id=user_id)
+            return cached
         
         response = {
-            'points': user.points,
+            'points': points,
             'timestamp': int(time.time())
         }
         
         # تسجيل الاستدعاء
         log_api_call('get_user_points', 200, user_id=user_id)
         
-        return jsonify({
+        return with_validators(jsonify({
             'status': 'success',
-            'data': response
-        })
+            'data': response,
+            'metadata': get_poll_metadata('get_user_points')
+        }), 'get_user_points', etag, last_modified)
         
     except APIError as e:
         raise
@@ -185,19 +252,19 @@ def get_user_transactions():
     try:
         user_id = g.user_id
         
-        # معالجة معلمات التصفية
-        limit = min(int(request.args.get('limit', 10)), 50)  # الحد الأقصى 50
-        offset = int(request.args.get('offset', 0))
+        # معالجة معلمات التصفح بالمؤشرات
+        limit, after, before = _page_args()
+        
+        user = db.session.get(User, user_id)
+        if not user:
+            raise APIError("لم يتم العثور على المستخدم", status_code=404)
         
-        transactions = PointsTransaction.query.filter_by(
-            user_id=user_id
-        ).order_by(
-            PointsTransaction.created_at.desc()
-        ).limit(limit).offset(offset).all()
+        # معاملات الأشهر الساخنة من الجدول بدون OFFSET ثم المعاملات المؤرشفة (نفس سجل لوحة التحكم)
+        page = get_user_transactions_page(user, limit, after=after, before=before)
         
         # تحويل النتائج إلى كائنات JSON
         result = []
-        for tx in transactions:
+        for tx in page.items:
             result.append({
                 'id': tx.id,
                 'amount': tx.amount,
@@ -213,11 +280,7 @@ def get_user_transactions():
         return jsonify({
             'status': 'success',
             'data': result,
-            'metadata': {
-                'limit': limit,
-                'offset': offset,
-                'count': len(result)
-            }
+            'metadata': _page_metadata(page)
         })
         
     except APIError as e:
@@ -226,6 +289,36 @@ def get_user_transactions():
         app.logger.error(f"خطأ في الحصول على سجل المعاملات: {str(e)}")
         raise APIError("حدث خطأ أثناء معالجة الطلب", status_code=500)
 
+@api_bp.route('/user/transactions/export', methods=['GET'])
+@require_api_key
+@api_rate_limit("10 per hour")
+def export_user_transactions():
+    """تصدير سجل المعاملات الكامل للمستخدم (بما فيه المؤرشف) بالبث من الأقدم إلى الأحدث"""
+    try:
+        user_id = g.user_id
+        export_format, since = _export_args()
+        
+        # معاملات الجدول عبر مؤشر من جهة الخادم مدموجة مع المؤرشفة بنفس الترتيب
+        query = db.session.query(
+            PointsTransaction.id, PointsTransaction.amount, PointsTransaction.balance_after,
+            PointsTransaction.transaction_type, PointsTransaction.description, PointsTransaction.created_at
+        ).filter(PointsTransaction.user_id == user_id)
+        rows = merge_sorted_rows(
+            iter_keyset_rows(query, PointsTransaction.created_at, PointsTransaction.id, since=since),
+            iter_archived_transactions(user_id, since=decode_cursor(since))
+        )
+        
+        # تسجيل الاستدعاء
+        log_api_call('export_user_transactions', 200, user_id=user_id, details={'format': export_format})
+        
+        return stream_export(rows, TRANSACTION_EXPORT_COLUMNS, export_format, 'transactions')
+        
+    except APIError as e:
+        raise
+    except Exception as e:
+        app.logger.error(f"خطأ في تصدير سجل المعاملات: {str(e)}")
+        raise APIError("حدث خطأ أثناء معالجة الطلب", status_code=500)
+
 # ============================================================
 # نقاط نهاية الإحالات
 # ============================================================
@@ -238,47 +331,51 @@ def get_user_referrals():
     try:
         user_id = g.user_id
         
-        # معالجة معلمات التصفية
-        limit = min(int(request.args.get('limit', 10)), 50)
-        offset = int(request.args.get('offset', 0))
+        # معالجة معلمات التصفح بالمؤشرات
+        limit, after, before = _page_args()
+        
+        # إرجاع 304 إذا لم تتغير إحالات المستخدم منذ آخر طلب
+        referrals_version = get_referrals_version(user_id)
+        etag = make_etag('user_referrals', referrals_version, limit, after, before)
+        cached = not_modified('get_user_referrals', etag)
+        if cached is not None:
+            log_api_call('get_user_referrals', 304, user_id=user_id)
+            return cached
         
-        # الحصول على سجلات الإحالة
-        referrals = Referral.query.filter_by(
-            referrer_id=user_id
-        ).order_by(
-            Referral.created_at.desc()
-        ).limit(limit).offset(offset).all()
+        # سجلات الإحالة مع اسم المستخدم المُحال في استعلام واحد (بدلاً من استعلام لكل إحالة)
+        query = db.session.query(
+            Referral.id, Referral.status, Referral.reward_paid, Referral.reward_amount, Referral.created_at,
+            User.id.label('referred_user_id'), User.username.label('referred_username')
+        ).join(User, User.id == Referral.referred_id).filter(Referral.referrer_id == user_id)
+        page = keyset_paginate(query, Referral.created_at, Referral.id, limit, after=after, before=before)
         
         # تجميع المعلومات المطلوبة
         result = []
-        for referral in referrals:
-            referred_user = User.query.get(referral.referred_id)
-            if referred_user:
-                result.append({
-                    'id': referral.id,
-                    'referred_user': {
-                        'id': referred_user.id,
-                        'username': referred_user.username
-                    },
-                    'status': referral.status,
-                    'reward_paid': referral.reward_paid,
-                    'reward_amount': referral.reward_amount,
-                    'created_at': referral.created_at.isoformat() if referral.created_at else None
-                })
+        for referral in page.items:
+            result.append({
+                'id': referral.id,
+                'referred_user': {
+                    'id': referral.referred_user_id,
+                    'username': referral.referred_username
+                },
+                'status': referral.status,
+                'reward_paid': referral.reward_paid,
+                'reward_amount': referral.reward_amount,
+                'created_at': referral.created_at.isoformat() if referral.created_at else None
+            })
         
         # تسجيل الاستدعاء
         log_api_call('get_user_referrals', 200, user_id=user_id)
         
-        return jsonify({
+        return with_validators(jsonify({
             'status': 'success',
             'data': result,
             'metadata': {
-                'limit': limit,
-                'offset': offset,
-                'count': len(result),
-                'total_referrals': User.query.get(user_id).total_referrals
+                **_page_metadata(page),
+                'total_referrals': referrals_version[-1],
+                **get_poll_metadata('get_user_referrals')
             }
-        })
+        }), 'get_user_referrals', etag)
         
     except APIError as e:
         raise
@@ -286,6 +383,32 @@ def get_user_referrals():
         app.logger.error(f"خطأ في الحصول على قائمة الإحالات: {str(e)}")
         raise APIError("حدث خطأ أثناء معالجة الطلب", status_code=500)
 
+@api_bp.route('/referrals/export', methods=['GET'])
+@require_api_key
+@api_rate_limit("10 per hour")
+def export_user_referrals():
+    """تصدير سجل الإحالات الكامل للمستخدم بالبث من الأقدم إلى الأحدث"""
+    try:
+        user_id = g.user_id
+        export_format, since = _export_args()
+        
+        query = db.session.query(
+            Referral.id, User.id.label('referred_user_id'), User.username.label('referred_username'),
+            Referral.status, Referral.reward_paid, Referral.reward_amount, Referral.created_at
+        ).join(User, User.id == Referral.referred_id).filter(Referral.referrer_id == user_id)
+        rows = iter_keyset_rows(query, Referral.created_at, Referral.id, since=since)
+        
+        # تسجيل الاستدعاء
+        log_api_call('export_user_referrals', 200, user_id=user_id, details={'format': export_format})
+        
+        return stream_export(rows, REFERRAL_EXPORT_COLUMNS, export_format, 'referrals')
+        
+    except APIError as e:
+        raise
+    except Exception as e:
+        app.logger.error(f"خطأ في تصدير سجل الإحالات: {str(e)}")
+        raise APIError("حدث خطأ أثناء معالجة الطلب", status_code=500)
+
 # ============================================================
 # نقاط نهاية المكافآت
 # ============================================================
@@ -296,20 +419,26 @@ def get_user_referrals():
 def get_rewards():
     """الحصول على قائمة المكافآت المتاحة"""
     try:
-        # معالجة معلمات التصفية
-        limit = min(int(request.args.get('limit', 10)), 50)
-        offset = int(request.args.get('offset', 0))
-        
-        # الحصول على المكافآت النشطة فقط
-        rewards = Reward.query.filter_by(
-            is_available=True
-        ).order_by(
-            Reward.points_required
-        ).limit(limit).offset(offset).all()
+        # معالجة معلمات التصفح بالمؤشرات
+        limit, after, before = _page_args()
+        
+        # إرجاع 304 إذا لم يتغير كتالوج المكافآت منذ آخر طلب
+        catalog_version, last_modified = get_reward_catalog_version()
+        etag = make_etag('rewards', catalog_version, limit, after, before)
+        cached = not_modified('get_rewards', etag, last_modified) if catalog_version else None
+        if cached is not None:
+            log_api_call('get_rewards', 304, user_id=getattr(g, 'user_id', None))
+            return cached
+        
+        # المكافآت النشطة فقط (الأعمدة المعروضة فقط، على الفهرس (is_available, created_at, id))
+        query = db.session.query(
+            Reward.id, Reward.name, Reward.description, Reward.points_required, Reward.quantity, Reward.created_at
+        ).filter(Reward.is_available == True)
+        page = keyset_paginate(query, Reward.created_at, Reward.id, limit, after=after, before=before)
         
         # تجميع المعلومات المطلوبة
         result = []
-        for reward in rewards:
+        for reward in page.items:
             result.append({
                 'id': reward.id,
                 'name': reward.name,
@@ -321,15 +450,18 @@ def get_rewards():
         # تسجيل الاستدعاء
         log_api_call('get_rewards', 200, user_id=getattr(g, 'user_id', None))
         
-        return jsonify({
+        response = jsonify({
             'status': 'success',
             'data': result,
             'metadata': {
-                'limit': limit,
-                'offset': offset,
-                'count': len(result)
+                **_page_metadata(page),
+                **get_poll_metadata('get_rewards')
             }
         })
+        if not catalog_version:
+            # لا يوجد إصدار للكتالوج بعد (لم تُعدّل أي مكافأة منذ التحديث): بدون تحقق شرطي
+            return response
+        return with_validators(response, 'get_rewards', etag, last_modified)
         
     except APIError as e:
         raise
@@ -465,6 +597,7 @@ def delete_api_key(key_id):
         # إلغاء تنشيط المفتاح (عدم حذفه فعليًا للحفاظ على سجل الاستخدام)
         api_key.is_active = False
         db.session.commit()
+        invalidate_api_key(api_key.id)
         
         # تسجيل الاستدعاء
         log_api_call('delete_api_key', 200, user_id=user_id, details={'key_id': key_id})
@@ -480,6 +613,104 @@ def delete_api_key(key_id):
         app.logger.error(f"خطأ في إلغاء تنشيط مفتاح API: {str(e)}")
         raise APIError("حدث خطأ أثناء معالجة الطلب", status_code=500)
 
+# ============================================================
+# الطلبات المجمعة
+# ============================================================
+
+# رؤوس الاستجابة الفرعية التي تُعاد للعميل (للتحقق الشرطي وإرشادات الاستعلام)
+BATCH_RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'X-Poll-Interval')
+
+# رؤوس الطلب الفرعي التي يمكن للعميل تحديدها لكل عنصر
+BATCH_REQUEST_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+# نقاط النهاية غير المسموح بها داخل الدفعة (الدفعة نفسها، والتصدير المتدفق الذي لا يُجمع في الذاكرة)
+BATCH_EXCLUDED_ENDPOINTS = ('api.batch_requests', 'api.export_user_transactions', 'api.export_user_referrals')
+
+
+def _run_batch_item(item):
+    """
+    تنفيذ طلب فرعي (GET فقط) على دالة العرض الموجودة في نفس سياق التطبيق
+    (نفس g ونفس جلسة قاعدة البيانات)، ويُرجع (رمز الحالة، الرؤوس، الجسم)
+    """
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        return 400, {}, {'status': 'error', 'error': 'يجب تحديد مسار الطلب الفرعي'}
+    if str(item.get('method', 'GET')).upper() != 'GET':
+        return 405, {}, {'status': 'error', 'error': 'الطلبات المجمعة تدعم GET فقط'}
+
+    url = urlsplit(item['path'])
+    path = url.path if url.path.startswith(api_bp.url_prefix) else api_bp.url_prefix + '/' + url.path.lstrip('/')
+    item_headers = item.get('headers') if isinstance(item.get('headers'), dict) else {}
+    headers = {name: request.headers[name] for name in ('Authorization', 'User-Agent', 'X-Forwarded-For', 'X-Real-IP')
+               if name in request.headers}
+    headers.update({name: str(item_headers[name]) for name in BATCH_REQUEST_HEADERS if name in item_headers})
+
+    with app.test_request_context(
+        path, method='GET', query_string=url.query, headers=headers,
+        environ_base={'REMOTE_ADDR': request.remote_addr}
+    ):
+        rule = request.url_rule
+        if rule is None or not rule.endpoint.startswith(api_bp.name + '.') or rule.endpoint in BATCH_EXCLUDED_ENDPOINTS:
+            return 404, {}, {'status': 'error', 'error': 'نقطة النهاية غير موجودة'}
+
+        try:
+            response = app.make_response(app.view_functions[rule.endpoint](**request.view_args))
+        except Exception as e:
+            response = app.make_response(handle_api_error(e))
+
+        return (
+            response.status_code,
+            {name: response.headers[name] for name in BATCH_RESPONSE_HEADERS if name in response.headers},
+            response.get_json(silent=True) if response.status_code != 304 else None
+        )
+
+
+@api_bp.route('/batch', methods=['POST'])
+@csrf.exempt
+@require_api_key
+@api_rate_limit("30 per minute")
+def batch_requests():
+    """
+    تنفيذ عدة طلبات GET في رحلة واحدة مع مصادقة واحدة (مثل بيانات بدء تشغيل التطبيق)
+    تخضع الطلبات الفرعية لحدود المعدل الخاصة بكل نقطة نهاية وتُسجل في سجل الاستخدام
+
+    الجسم: {"requests": [{"id": "points", "method": "GET", "path": "/user/points", "headers": {...}}]}
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        items = payload.get('requests')
+        if not isinstance(items, list) or not items:
+            raise APIError("يجب إرسال قائمة الطلبات الفرعية في الحقل requests", status_code=400)
+        if len(items) > config.API_BATCH_MAX_REQUESTS:
+            raise APIError(f"الحد الأقصى {config.API_BATCH_MAX_REQUESTS} طلبات في الدفعة الواحدة", status_code=400)
+
+        # تم التحقق من المفتاح مرة واحدة لطلب الدفعة، فلا تعيده الطلبات الفرعية
+        g.api_batch_authenticated = True
+        try:
+            result = []
+            for position, item in enumerate(items):
+                status_code, headers, body = _run_batch_item(item)
+                result.append({
+                    'id': item.get('id', position) if isinstance(item, dict) else position,
+                    'status': status_code,
+                    'headers': headers,
+                    'body': body
+                })
+        finally:
+            g.api_batch_authenticated = False
+
+        log_api_call('batch_requests', 200, user_id=g.user_id, details={'count': len(items)})
+
+        return jsonify({
+            'status': 'success',
+            'data': result
+        })
+
+    except APIError as e:
+        raise
+    except Exception as e:
+        app.logger.error(f"خطأ في تنفيذ الطلبات المجمعة: {str(e)}")
+        raise APIError("حدث خطأ أثناء معالجة الطلب", status_code=500)
+
 # تسجيل Blueprint في التطبيق
 app.register_blueprint(api_bp)
 
@@ -496,11 +727,14 @@ def api_docs():
             {'path': '/user/info', 'method': 'GET', 'description': 'الحصول على معلومات المستخدم'},
             {'path': '/user/points', 'method': 'GET', 'description': 'الحصول على رصيد نقاط المستخدم'},
             {'path': '/user/transactions', 'method': 'GET', 'description': 'الحصول على سجل المعاملات'},
+            {'path': '/user/transactions/export', 'method': 'GET', 'description': 'تصدير سجل المعاملات الكامل (NDJSON أو CSV)'},
             {'path': '/referrals', 'method': 'GET', 'description': 'الحصول على قائمة الإحالات'},
+            {'path': '/referrals/export', 'method': 'GET', 'description': 'تصدير سجل الإحالات الكامل (NDJSON أو CSV)'},
             {'path': '/rewards', 'method': 'GET', 'description': 'الحصول على قائمة المكافآت'},
             {'path': '/keys', 'method': 'GET', 'description': 'الحصول على قائمة مفاتيح API'},
             {'path': '/keys', 'method': 'POST', 'description': 'إنشاء مفتاح API جديد'},
-            {'path': '/keys/<key_id>', 'method': 'DELETE', 'description': 'إلغاء تنشيط مفتاح API'}
+            {'path': '/keys/<key_id>', 'method': 'DELETE', 'description': 'إلغاء تنشيط مفتاح API'},
+            {'path': '/batch', 'method': 'POST', 'description': 'تنفيذ عدة طلبات GET في طلب واحد'}
         ],
         'authentication': 'Bearer Token',
         'rate_limiting': 'نعم - مختلف لكل نقطة نهاية'
@@ -0,0 +1,203 @@
+"""
+تسجيل استخدام API بالكتابة المؤجلة (write-behind)
+كان كل طلب API مصادق عليه يحدّث صف المفتاح (last_used_at و usage_count و last_ip) وينفذ commit،
+فيكلف طلب GET للقراءة فقط عدة عمليات كتابة متزامنة. هنا تُجمع تحديثات المفاتيح في ذاكرة العملية
+(تحديث واحد لكل مفتاح مهما تكرر استخدامه) وتُجمع صفوف APIUsageLog، ثم تُكتب دفعة واحدة
+من خيط خلفي كل API_USAGE_FLUSH_INTERVAL ثانية أو عند بلوغ API_USAGE_FLUSH_SIZE صف،
+وعند إيقاف العملية.
+
+الكتابة تتم على اتصال مستقل (db.engine.begin) وليس على جلسة الطلب، فالتفريغ المباشر من داخل
+طلب لا يلتزم بتغييرات الطلب ولا يتراجع عنها. إذا فشلت الكتابة تُعاد البيانات إلى الذاكرة لتُكتب
+مع الدفعة التالية (بحد أقصى API_USAGE_MAX_PENDING صف).
+
+البيانات المعلقة عند انهيار العملية تُفقد (بحد أقصى فترة تفريغ واحدة)، وهي بيانات إحصائية فقط.
+"""
+
+import atexit
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import bindparam, or_
+from app import app, db
+from models import APIKey, APIUsageLog
+import config
+
+# تحديثات المفاتيح المعلقة: معرف المفتاح -> القيم المجمعة
+_key_touches = {}
+
+# صفوف سجل الاستخدام المعلقة
+_usage_rows = []
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_requested = threading.Event()
+_flusher_thread = None
+
+# معرف العملية التي بدأت الخيط الخلفي (الخيوط لا تنتقل إلى العمليات الفرعية بعد fork)
+_flusher_pid = None
+
+
+def touch_api_key(key_id, ip_address, is_automated=False, suspicious=False):
+    """تسجيل استخدام مفتاح (يُدمج مع الاستخدامات المعلقة الأخرى لنفس المفتاح)"""
+    now = datetime.utcnow()
+    with _lock:
+        touch = _key_touches.get(key_id)
+        if touch is None:
+            touch = _key_touches[key_id] = {
+                'usage': 0, 'last_used_at': now, 'last_ip': ip_address,
+                'automated': False, 'suspicious': False,
+            }
+        touch['usage'] += 1
+        touch['last_used_at'] = now
+        touch['last_ip'] = ip_address
+        touch['automated'] = touch['automated'] or bool(is_automated)
+        touch['suspicious'] = touch['suspicious'] or bool(suspicious)
+
+
+def get_pending_last_ip(key_id):
+    """آخر عنوان IP استُخدم منه المفتاح ولم يُكتب بعد (أو None)"""
+    with _lock:
+        touch = _key_touches.get(key_id)
+        return touch['last_ip'] if touch else None
+
+
+def record_api_usage(**values):
+    """إضافة صف إلى سجل استخدام API (يُكتب مع الدفعة التالية)"""
+    values.setdefault('timestamp', datetime.utcnow())
+    with _lock:
+        _usage_rows.append(values)
+        pending = len(_usage_rows)
+
+    if pending >= config.API_USAGE_FLUSH_SIZE:
+        if _flusher_thread is not None and _flusher_thread.is_alive():
+            _flush_requested.set()
+        else:
+            # لا يوجد خيط خلفي (مثلاً في الاختبارات أو الأدوات): التفريغ مباشرة حتى لا تنمو الذاكرة
+            flush_api_usage()
+
+
+def _write_usage(connection, touches, rows):
+    """تحديث واحد لكل مفتاح وإدراج جماعي لصفوف السجل على الاتصال المعطى"""
+    if touches:
+        table = APIKey.__table__
+        connection.execute(
+            table.update().where(table.c.id == bindparam('b_key_id')).values(
+                usage_count=db.func.coalesce(table.c.usage_count, 0) + bindparam('b_usage'),
+                last_used_at=bindparam('b_last_used_at'),
+                last_ip=bindparam('b_last_ip'),
+                automation_detected=or_(table.c.automation_detected == True, bindparam('b_automated')),
+                suspicious_activity=or_(table.c.suspicious_activity == True, bindparam('b_suspicious'))
+            ),
+            [
+                {
+                    'b_key_id': key_id,
+                    'b_usage': touch['usage'],
+                    'b_last_used_at': touch['last_used_at'],
+                    'b_last_ip': touch['last_ip'],
+                    'b_automated': touch['automated'],
+                    'b_suspicious': touch['suspicious'],
+                }
+                for key_id, touch in touches.items()
+            ]
+        )
+    if rows:
+        connection.execute(APIUsageLog.__table__.insert(), rows)
+
+
+def _requeue(touches, rows):
+    """إعادة بيانات دفعة فشلت كتابتها إلى الذاكرة، مع دمجها بما أُضيف بعدها"""
+    with _lock:
+        for key_id, touch in touches.items():
+            newer = _key_touches.get(key_id)
+            if newer is None:
+                _key_touches[key_id] = touch
+                continue
+            newer['usage'] += touch['usage']
+            newer['automated'] = newer['automated'] or touch['automated']
+            newer['suspicious'] = newer['suspicious'] or touch['suspicious']
+
+        _usage_rows[:0] = rows
+        overflow = len(_usage_rows) - config.API_USAGE_MAX_PENDING
+        if overflow > 0:
+            # قاعدة البيانات غير متاحة لفترة طويلة: حذف الأقدم حتى لا تنمو الذاكرة بلا حد
+            del _usage_rows[:overflow]
+            app.logger.warning(f"تم حذف {overflow} صف من سجل استخدام API المعلق")
+
+
+def flush_api_usage():
+    """
+    كتابة جميع البيانات المعلقة: تحديث واحد لكل مفتاح وإدراج جماعي لصفوف السجل
+    على اتصال مستقل عن جلسة الطلب الحالي
+
+    Returns:
+        tuple: (عدد المفاتيح المحدثة، عدد صفوف السجل المدرجة)
+    """
+    with _flush_lock:
+        with _lock:
+            touches = dict(_key_touches)
+            rows = list(_usage_rows)
+            _key_touches.clear()
+            _usage_rows.clear()
+
+        if not touches and not rows:
+            return 0, 0
+
+        try:
+            with db.engine.begin() as connection:
+                _write_usage(connection, touches, rows)
+        except Exception as e:
+            _requeue(touches, rows)
+            app.logger.error(f"خطأ في كتابة سجل استخدام API ({len(touches)} مفتاح، {len(rows)} صف): {str(e)}")
+            return 0, 0
+
+        return len(touches), len(rows)
+
+
+def _flush_in_context():
+    with app.app_context():
+        flush_api_usage()
+        db.session.remove()
+
+
+def _flush_loop(interval):
+    while True:
+        _flush_requested.wait(interval)
+        _flush_requested.clear()
+        _flush_in_context()
+
+
+def start_api_usage_flusher(interval=None):
+    """
+    بدء خيط خلفي يكتب بيانات الاستخدام المعلقة دوريًا
+    يُستدعى عند استيراد التطبيق وبعد fork في كل عامل gunicorn، ولا يبدأ أكثر من خيط واحد لكل عملية
+    """
+    global _flusher_thread, _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid() and _flusher_thread is not None and _flusher_thread.is_alive():
+            return _flusher_thread
+
+        _flusher_thread = threading.Thread(
+            target=_flush_loop,
+            args=(interval or config.API_USAGE_FLUSH_INTERVAL,),
+            daemon=True
+        )
+        _flusher_thread.start()
+        _flusher_pid = os.getpid()
+    return _flusher_thread
+
+
+def _reset_after_fork():
+    """قد تكون الأقفال محجوزة من خيط في العملية الأم لحظة fork: إنشاؤها من جديد في العملية الفرعية"""
+    global _lock, _flush_lock, _flush_requested, _flusher_thread, _flusher_pid
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _flush_requested = threading.Event()
+    _flusher_thread = None
+    _flusher_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# تفريغ البيانات المعلقة عند إيقاف العملية، سواء بدأ الخيط الخلفي أم لا
+atexit.register(_flush_in_context)
@@ -10,13 +10,18 @@ import string
 import logging
 import ipaddress
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 from functools import wraps
 from flask import request, jsonify, g, current_app, abort
 from flask_cors import cross_origin
+from limits import parse as parse_rate_limit
 from app import app, db, limiter
 from models import User, APIKey, Reward, Referral, SystemConfig, APIFailedAuth, APIUsageLog
 from audit_log import log_audit_event, EVENT_TYPES, SEVERITY_LEVELS
+from api_key_cache import get_verified_key, remember_verified_key, invalidate_api_key, sync_revocation_epoch
+from api_usage_buffer import touch_api_key, get_pending_last_ip
+from config_cache import get_setting
+from sliding_window import SlidingWindowCounter, SlidingWindowSet
 import config
 
 
@@ -50,6 +55,16 @@ if not api_logger.handlers:
     file_handler.setFormatter(formatter)
     api_logger.addHandler(file_handler)
 
+# عتبات كشف إساءة الاستخدام
+HIGH_FREQUENCY_CALLS = 30  # طلبات المفتاح في الدقيقة الواحدة
+MULTIPLE_IPS = 3  # عناوين IP مختلفة للمفتاح في الساعة الواحدة
+FAILED_AUTH_ATTEMPTS = 5  # محاولات مصادقة فاشلة من نفس العنوان في 10 دقائق
+
+# عدادات كشف إساءة الاستخدام في ذاكرة العملية (بدلاً من استعلامات العد في كل طلب)
+api_key_calls = SlidingWindowCounter(60, 1)
+api_key_ips = SlidingWindowSet(3600)
+failed_auth_attempts = SlidingWindowCounter(600, 10)
+
 class APIError(Exception):
     """
     استثناء مخصص للأخطاء المتعلقة بواجهة برمجة التطبيقات
@@ -101,29 +116,38 @@ def validate_api_key():
     # استخراج بادئة المفتاح للبحث السريع
     key_prefix = api_key_value[:12] if len(api_key_value) >= 12 else api_key_value
     
-    # الحصول على قائمة المفاتيح الملغاة من الكاش (إن وجدت)
-    # قراءة من السيستم كونفيج مع تجديد الكاش كل دقيقة
+    # طابع الإلغاء العالمي من إعدادات النظام المخزنة في الذاكرة (بدون استعلام في كل طلب)
     global_revocation_timestamp = SystemConfig.get('global_revocation_timestamp')
+    # إفراغ ذاكرة المفاتيح التي تم التحقق منها إذا أُلغي أي مفتاح منذ آخر طلب
+    sync_revocation_epoch(global_revocation_timestamp)
     
     try:
-        # البحث عن المفاتيح المحتملة باستخدام البادئة
-        potential_keys = APIKey.query.filter_by(key_prefix=key_prefix).all()
-        
-        if not potential_keys:
-            log_failed_auth_attempt(None, "key_not_found", request.remote_addr, key_prefix=key_prefix)
-            raise APIError('مفتاح API غير صالح', status_code=401)
-        
-        # فحص كل مفتاح محتمل للتحقق من تطابقه مع القيمة المشفرة
+        # مفتاح تم التحقق منه سابقًا في هذه العملية: قراءة صفه بالمعرف دون إعادة PBKDF2
         valid_key = None
-        for key in potential_keys:
-            # مقارنة بمقاومة لهجمات التوقيت
-            if APIKey.verify_key(api_key_value, key.key_hash):
-                valid_key = key
-                break
-        
-        if not valid_key:
-            log_failed_auth_attempt(None, "invalid_key_hash", request.remote_addr, key_prefix=key_prefix)
-            raise APIError('مفتاح API غير صالح', status_code=401)
+        verified = get_verified_key(api_key_value)
+        if verified is not None:
+            valid_key = db.session.get(APIKey, verified.key_id)
+            if valid_key is None:
+                invalidate_api_key(verified.key_id)
+        
+        if valid_key is None:
+            # البحث عن المفاتيح المحتملة باستخدام البادئة
+            potential_keys = APIKey.query.filter_by(key_prefix=key_prefix).all()
+            
+            if not potential_keys:
+                log_failed_auth_attempt(None, "key_not_found", request.remote_addr, key_prefix=key_prefix)
+                raise APIError('مفتاح API غير صالح', status_code=401)
+            
+            # فحص كل مفتاح محتمل للتحقق من تطابقه مع القيمة المشفرة
+            for key in potential_keys:
+                # مقارنة بمقاومة لهجمات التوقيت
+                if APIKey.verify_key(api_key_value, key.key_hash):
+                    valid_key = key
+                    break
+            
+            if not valid_key:
+                log_failed_auth_attempt(None, "invalid_key_hash", request.remote_addr, key_prefix=key_prefix)
+                raise APIError('مفتاح API غير صالح', status_code=401)
         
         # تحقق إضافي للإلغاء والنشاط (بعد التعرف على المفتاح)
         # التحقق من أن المفتاح نشط
@@ -134,7 +158,7 @@ def validate_api_key():
         # التحقق من أن المفتاح غير ملغي
         if valid_key.is_revoked:
             reason = valid_key.revocation_reason or "مفتاح ملغي"
-            log_failed_auth_attempt(valid_key.user_id, "revoked_key", request.remote_addr, key_id=valid_key.id, reason=reason)
+            log_failed_auth_attempt(valid_key.user_id, "revoked_key", request.remote_addr, key_id=valid_key.id)
             raise APIError(f'مفتاح API ملغى: {reason}', status_code=401)
         
         # التحقق من تاريخ انتهاء الصلاحية
@@ -143,9 +167,14 @@ def validate_api_key():
             valid_key.is_revoked = True
             valid_key.revocation_reason = "انتهت صلاحية المفتاح"
             db.session.commit()
+            invalidate_api_key(valid_key.id)
             log_failed_auth_attempt(valid_key.user_id, "expired_key", request.remote_addr, key_id=valid_key.id)
             raise APIError('مفتاح API منتهي الصلاحية', status_code=401)
         
+        # حفظ نتيجة التحقق حتى لا تتكرر كلفة PBKDF2 في الطلبات التالية
+        if verified is None:
+            remember_verified_key(api_key_value, valid_key)
+        
         # تخزين معرف المستخدم والمفتاح للاستخدام لاحقًا
         g.user_id = valid_key.user_id
         g.api_key_id = valid_key.id
@@ -157,24 +186,18 @@ def validate_api_key():
         
         # كشف الاستخدام الآلي (على سبيل المثال عبر curl أو أدوات البرمجة)
         is_automated = detect_automation(request_user_agent)
-        if is_automated and valid_key.automation_detected is False:
-            valid_key.automation_detected = True
+        g.api_is_automated = is_automated
             
-        # كشف وتسجيل استخدام المفتاح من عنوان IP جديد
+        # كشف وتسجيل استخدام المفتاح من عنوان IP جديد (مع مراعاة آخر استخدام لم يُكتب بعد)
+        last_ip = get_pending_last_ip(valid_key.id) or valid_key.last_ip
         is_new_ip = False
-        if valid_key.last_ip and valid_key.last_ip != client_ip:
+        if last_ip and last_ip != client_ip:
             is_new_ip = True
-            app.logger.info(f"استخدام مفتاح API من عنوان IP جديد. المفتاح: {valid_key.id}, المستخدم: {valid_key.user_id}, IP: {client_ip}, IP سابق: {valid_key.last_ip}")
-        
-        # تحديث معلومات الاستخدام
-        valid_key.last_used_at = datetime.utcnow()
-        valid_key.usage_count += 1
-        valid_key.last_ip = client_ip
+            app.logger.info(f"استخدام مفتاح API من عنوان IP جديد. المفتاح: {valid_key.id}, المستخدم: {valid_key.user_id}, IP: {client_ip}, IP سابق: {last_ip}")
         
         # تسجيل السلوك المشبوه إذا تم اكتشافه
-        suspicious_behavior = detect_suspicious_usage(valid_key, is_new_ip, is_automated)
+        suspicious_behavior = detect_suspicious_usage(valid_key, is_new_ip, is_automated, client_ip)
         if suspicious_behavior:
-            valid_key.suspicious_activity = True
             app.logger.warning(f"تم اكتشاف نشاط مشبوه. المفتاح: {valid_key.id}, المستخدم: {valid_key.user_id}, السبب: {suspicious_behavior}")
             
             # إنشاء إشعار للمشرف إذا لزم الأمر
@@ -187,10 +210,17 @@ def validate_api_key():
                     related_user_id=valid_key.user_id
                 )
                 db.session.add(notification)
+                db.session.commit()
         
-        db.session.commit()
+        # تحديث معلومات الاستخدام (last_used_at و usage_count و last_ip) بالكتابة المؤجلة
+        # بدلاً من commit في كل طلب
+        touch_api_key(valid_key.id, client_ip, is_automated, suspicious=bool(suspicious_behavior))
         return True
         
+    except APIError:
+        # أخطاء المصادقة المتوقعة تُرجع كما هي (401) بدلاً من تحويلها إلى خطأ عام
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"خطأ أثناء التحقق من مفتاح API: {str(e)}")
@@ -199,11 +229,18 @@ def validate_api_key():
 
 
 def log_failed_auth_attempt(user_id, reason, ip_address, key_id=None, key_prefix=None):
-    """تسجيل محاولات المصادقة الفاشلة للكشف عن هجمات القوة الغاشمة"""
+    """
+    تسجيل محاولات المصادقة الفاشلة للكشف عن هجمات القوة الغاشمة
+    تُعدّ المحاولات لكل عنوان في الذاكرة، ولا تُحفظ في قاعدة البيانات إلا المحاولات
+    التي تتجاوز العتبة (FAILED_AUTH_ATTEMPTS خلال 10 دقائق)
+    """
+    attempts = failed_auth_attempts.add(ip_address)
+    api_logger.info(f"API authentication failed: reason={reason}, ip={ip_address}, key_id={key_id}, prefix={key_prefix}")
+    if attempts < FAILED_AUTH_ATTEMPTS:
+        return
+
     try:
         # تسجيل المحاولة في جدول يمكن استخدامه لتتبع المحاولات المتكررة
-        from models import APIFailedAuth
-        
         failed_attempt = APIFailedAuth(
             user_id=user_id,
             ip_address=ip_address,
@@ -214,16 +251,9 @@ def log_failed_auth_attempt(user_id, reason, ip_address, key_id=None, key_prefix
         db.session.add(failed_attempt)
         db.session.commit()
         
-        # التحقق من وجود محاولات متكررة من نفس العنوان
-        recent_attempts = APIFailedAuth.query.filter_by(
-            ip_address=ip_address
-        ).filter(
-            APIFailedAuth.created_at >= datetime.utcnow() - timedelta(minutes=10)
-        ).count()
-        
-        # إذا تجاوز العتبة، قم بتسجيل تحذير
-        if recent_attempts >= 5:
-            app.logger.warning(f"محاولات مصادقة فاشلة متكررة من العنوان {ip_address}: {recent_attempts} محاولات في 10 دقائق.")
+        # تسجيل تحذير عند تجاوز العتبة لأول مرة
+        if attempts == FAILED_AUTH_ATTEMPTS:
+            app.logger.warning(f"محاولات مصادقة فاشلة متكررة من العنوان {ip_address}: {attempts} محاولات في 10 دقائق.")
             
             # يمكن إضافة تطبيق حظر مؤقت هنا
             
@@ -255,34 +285,21 @@ def detect_automation(user_agent):
     return False
 
 
-def detect_suspicious_usage(api_key, is_new_ip, is_automated):
-    """الكشف عن الاستخدام المشبوه للمفتاح"""
+def detect_suspicious_usage(api_key, is_new_ip, is_automated, ip_address=None):
+    """
+    الكشف عن الاستخدام المشبوه للمفتاح من عدادات الذاكرة (دون استعلامات)
+    يُبلّغ عن تجاوز العتبة مرة واحدة عند حدوثه وليس في كل طلب لاحق
+    """
     try:
-        now = datetime.utcnow()
+        calls = api_key_calls.add(api_key.id)
+        distinct_ips = api_key_ips.add(api_key.id, ip_address) if ip_address else api_key_ips.count(api_key.id)
         
         # 1. استخدام المفتاح من عناوين IP متعددة في فترة قصيرة
-        if is_new_ip:
-            recent_usage = db.session.query(
-                APIUsageLog
-            ).filter(
-                APIUsageLog.api_key_id == api_key.id,
-                APIUsageLog.timestamp >= now - timedelta(hours=1)
-            ).group_by(
-                APIUsageLog.ip_address
-            ).count()
-            
-            if recent_usage >= 3:  # 3 عناوين IP مختلفة في ساعة واحدة
-                return 'multiple_ips'
+        if is_new_ip and distinct_ips > MULTIPLE_IPS:  # أكثر من 3 عناوين IP مختلفة في ساعة واحدة
+            return 'multiple_ips'
         
         # 2. معدل استخدام مرتفع في فترة قصيرة
-        recent_calls = db.session.query(
-            APIUsageLog
-        ).filter(
-            APIUsageLog.api_key_id == api_key.id,
-            APIUsageLog.timestamp >= now - timedelta(minutes=1)
-        ).count()
-        
-        if recent_calls >= 30:  # 30 طلبًا في دقيقة واحدة
+        if calls == HIGH_FREQUENCY_CALLS + 1:  # أكثر من 30 طلبًا في دقيقة واحدة
             return 'high_frequency'
         
         return None
@@ -308,6 +325,7 @@ def revoke_api_key(key_id, reason=None, permanent=False):
             key.is_active = False
             key.is_revoked = True
             key.revocation_reason = reason
+        invalidate_api_key(key_id)
         
         # تحديث طابع زمني عالمي للإلغاء للتحقق الفوري من الإلغاء
         # هذا يسمح بالتحقق السريع من تغييرات الإلغاء الحديثة دون الحاجة إلى استعلام
@@ -364,10 +382,12 @@ def require_api_key(f):
     """
     @wraps(f)
     def decorated(*args, **kwargs):
-        try:
-            validate_api_key()
-        except APIError as e:
-            return jsonify(e.to_dict()), e.status_code
+        # الطلبات الفرعية داخل /batch تشارك سياق التطبيق (g) مع طلب الدفعة الذي تم التحقق منه مرة واحدة
+        if not getattr(g, 'api_batch_authenticated', False):
+            try:
+                validate_api_key()
+            except APIError as e:
+                return jsonify(e.to_dict()), e.status_code
         return f(*args, **kwargs)
     return decorated
 
@@ -477,18 +497,42 @@ def validate_admin_verification_token(user_id, token):
         app.logger.error(f"خطأ في التحقق من رمز التأكيد: {str(e)}")
         return False
 
-def api_rate_limit(limit_string="30 per minute"):
+# حدود معدل طلبات API لكل نقطة نهاية: اسم الدالة -> {الصلاحية: RateLimitItem}
+# تُحلَّل مرة واحدة عند تعريف المسار بدلاً من تسجيل حد جديد في كل طلب
+api_rate_limits = {}
+
+
+def _scale_rate_limit(item, multiplier):
+    return type(item)(max(1, int(item.amount * multiplier)), item.multiples, item.namespace)
+
+
+def api_rate_limit(limit_string="30 per minute", **tier_limits):
     """
-    زخرفة لتطبيق الحد من معدل الطلبات حسب مفتاح API والعنوان IP
+    زخرفة لتطبيق الحد من معدل الطلبات لكل مفتاح API (تُستخدم بعد require_api_key)
+    
+    الحد الأساسي يُضرب في API_RATE_LIMIT_TIER_MULTIPLIERS حسب صلاحية المفتاح (read/write/admin)،
+    ويمكن تحديد حد خاص لصلاحية معينة، مثل: api_rate_limit("60 per minute", admin="600 per minute")
     """
     def decorator(f):
+        base_limit = parse_rate_limit(limit_string)
+        limits_by_tier = {None: base_limit}
+        for tier, multiplier in config.API_RATE_LIMIT_TIER_MULTIPLIERS.items():
+            limits_by_tier[tier] = _scale_rate_limit(base_limit, multiplier)
+        for tier, tier_limit in tier_limits.items():
+            limits_by_tier[tier] = parse_rate_limit(tier_limit)
+        api_rate_limits[f.__name__] = limits_by_tier
+
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            # تطبيق الحد من معدل الطلبات
-            @limiter.limit(limit_string, key_func=lambda: request.headers.get('Authorization', '') + request.remote_addr)
-            def rate_limited_function(*args, **kwargs):
-                return f(*args, **kwargs)
-            return rate_limited_function(*args, **kwargs)
+            if limiter.enabled:
+                # مفتاح العداد هو معرف مفتاح API بعد المصادقة (أو عنوان IP إذا لم يُصادق الطلب)
+                api_key_id = getattr(g, 'api_key_id', None)
+                identity = f"key:{api_key_id}" if api_key_id else f"ip:{get_client_ip()}"
+                limit = limits_by_tier.get(getattr(g, 'api_key_permissions', None), base_limit)
+                if not limiter.limiter.hit(limit, 'api', f.__name__, identity):
+                    api_logger.warning(f"API rate limit exceeded: endpoint={f.__name__}, {identity}, limit={limit}")
+                    raise APIError('تم تجاوز الحد المسموح من الطلبات، يرجى المحاولة لاحقًا', status_code=429)
+            return f(*args, **kwargs)
         return decorated_function
     return decorator
 
@@ -496,16 +540,13 @@ def get_api_config():
     """
     الحصول على إعدادات API من قاعدة البيانات أو ملف الإعدادات
     """
-    # البحث عن إعدادات CORS في قاعدة البيانات
+    # إعدادات CORS من إعدادات النظام المخزنة في الذاكرة، وإلا القيمة الافتراضية من ملف الإعدادات
     allowed_origins = None
     try:
-        config_record = SystemConfig.query.filter_by(key='API_ALLOWED_ORIGINS').first()
-        if config_record and config_record.value:
-            allowed_origins = config_record.value.split(',')
+        allowed_origins = get_setting('API_ALLOWED_ORIGINS')
     except Exception as e:
         api_logger.error(f"خطأ في الحصول على إعدادات API: {str(e)}")
     
-    # إذا لم يتم العثور على قيمة، استخدم القيمة الافتراضية من ملف الإعدادات
     if not allowed_origins:
         allowed_origins = getattr(config, 'API_ALLOWED_ORIGINS', ['*'])
     
@@ -537,6 +578,21 @@ def log_api_call(endpoint, status_code, user_id=None, details=None):
         if details:
             log_details.update(details)
         
+        # إضافة الطلب إلى سجل استخدام المفتاح (يُكتب دفعة واحدة مع الطلبات الأخرى)
+        api_key_id = getattr(g, 'api_key_id', None)
+        if api_key_id and user_id:
+            APIUsageLog.log_request(
+                api_key_id=api_key_id,
+                user_id=user_id,
+                endpoint=path,
+                method=method,
+                status_code=status_code,
+                ip_address=get_client_ip() or ip_address or '',
+                user_agent=user_agent[:255] if user_agent else None,
+                is_automated=getattr(g, 'api_is_automated', False),
+                request_size=request.content_length
+            )
+        
         # تسجيل الحدث في سجل التدقيق
         severity = SEVERITY_LEVELS['INFO'] if 200 <= status_code < 400 else SEVERITY_LEVELS['WARNING']
         log_audit_event(
@@ -663,35 +719,44 @@ def validate_admin_verification_token(user_id, token):
     """
     from werkzeug.security import check_password_hash
     
-    # 1. التحقق من توفر الرمز المخزن
+    # 1. التحقق من توفر الرمز المخزن وتطابقه (من إعدادات النظام في الذاكرة، ثم مرة أخرى بعد
+    # التحقق من الإصدار، فقد يكون الرمز قد أُنشئ أو جُدد للتو في عملية أخرى)
     token_key = f"admin_verification_token_{user_id}"
-    token_config = SystemConfig.query.filter_by(key=token_key).first()
-    if not token_config or not token_config.value:
-        app.logger.warning(f"محاولة استخدام رمز تحقق غير موجود للمستخدم {user_id}")
-        return False
-    
-    # 2. التحقق من تطابق الرمز
-    if not check_password_hash(token_config.value, token):
-        app.logger.warning(f"رمز تحقق غير صحيح للمستخدم {user_id}")
-        return False
+    timestamp_key = f"admin_verification_timestamp_{user_id}"
+    token_hash = SystemConfig.get(token_key)
+    if not token_hash or not check_password_hash(token_hash, token):
+        token_hash = SystemConfig.get(token_key, fresh=True)
+        if not token_hash:
+            app.logger.warning(f"محاولة استخدام رمز تحقق غير موجود للمستخدم {user_id}")
+            return False
+        
+        # 2. التحقق من تطابق الرمز
+        if not check_password_hash(token_hash, token):
+            app.logger.warning(f"رمز تحقق غير صحيح للمستخدم {user_id}")
+            return False
     
     # 3. التحقق من صلاحية وقت الرمز
-    timestamp_key = f"admin_verification_timestamp_{user_id}"
-    timestamp_config = SystemConfig.query.filter_by(key=timestamp_key).first()
-    if not timestamp_config or not timestamp_config.value:
+    token_timestamp = SystemConfig.get(timestamp_key)
+    if not token_timestamp:
         app.logger.error(f"طابع زمني مفقود لرمز تحقق المستخدم {user_id}")
         return False
     
     # التحقق من صلاحية الوقت (10 دقائق)
     try:
-        token_time = datetime.fromisoformat(timestamp_config.value)
+        token_time = datetime.fromisoformat(token_timestamp)
         if (datetime.utcnow() - token_time).total_seconds() >= 600:  # أكثر من 10 دقائق
             app.logger.warning(f"رمز تحقق منتهي الصلاحية للمستخدم {user_id}")
             return False
         
-        # حذف الرمز بعد الاستخدام (للاستخدام مرة واحدة)
-        db.session.delete(token_config)
-        db.session.delete(timestamp_config)
+        # حذف الرمز بعد الاستخدام (للاستخدام مرة واحدة): الحذف مشروط بنفس القيمة حتى لا يُقبل
+        # الرمز مرتين إذا كانت نسخة الإعدادات في عملية أخرى لم تُحدّث بعد
+        consumed = SystemConfig.query.filter_by(key=token_key, value=token_hash).delete(synchronize_session=False)
+        if not consumed:
+            db.session.rollback()
+            app.logger.warning(f"رمز تحقق مستخدم مسبقًا للمستخدم {user_id}")
+            return False
+        SystemConfig.query.filter_by(key=timestamp_key).delete(synchronize_session=False)
+        SystemConfig.bump_version()
         db.session.commit()
         
         # تسجيل الاستخدام الناجح
@@ -812,8 +877,7 @@ def generate_admin_verification_token(user_id):
         token_config = SystemConfig(
             key=token_key,
             value=token_hash,
-            description="رمز التحقق المؤقت للمسؤول",
-            is_public=False
+            description="رمز التحقق المؤقت للمسؤول"
         )
         db.session.add(token_config)
     
@@ -828,13 +892,13 @@ def generate_admin_verification_token(user_id):
         timestamp_config = SystemConfig(
             key=timestamp_key,
             value=datetime.utcnow().isoformat(),
-            description="وقت إنشاء رمز التحقق للمسؤول",
-            is_public=False
+            description="وقت إنشاء رمز التحقق للمسؤول"
         )
         db.session.add(timestamp_config)
     
-    # حفظ التغييرات
+    # حفظ التغييرات (مع زيادة إصدار الإعدادات حتى تراها العمليات الأخرى)
     try:
+        SystemConfig.bump_version()
         db.session.commit()
         
         # تسجيل الحدث
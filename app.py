@@ -13,6 +13,9 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_wtf.csrf import CSRFProtect
 
+import config
+import limiter_storage  # noqa: F401 - تسجيل مخطط sqlite:// لتخزين عدادات تقييد الطلبات
+
 
 # Configure logging - more detailed for development
 logging.basicConfig(
@@ -113,7 +116,8 @@ def add_security_headers(response):
     
     # إضافة رأس Cache-Control للتحكم في تخزين الصفحات الحساسة مؤقتًا
     # منع تخزين المحتوى الديناميكي المقدم من البيانات الحساسة
-    if request.path.startswith('/admin') or request.path.startswith('/api'):
+    # (استجابات API التي تحمل ETag تحدد Cache-Control بنفسها ليعيد العميل التحقق بطلب مشروط)
+    if request.path.startswith('/admin') or (request.path.startswith('/api') and 'ETag' not in response.headers):
         response.headers['Cache-Control'] = 'no-store, max-age=0, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
@@ -192,12 +196,19 @@ def get_real_ip():
             return x_forwarded_for
     return get_remote_address()
 
+# العدادات في ملف SQLite مشترك بين جميع عمال Gunicorn على الخادم (حتى لا يتضاعف الحد بعدد العمال)
+# ويمكن استبدالها بـ Redis عبر المتغير البيئي RATELIMIT_STORAGE_URI
+ratelimit_storage_uri = os.environ.get(
+    "RATELIMIT_STORAGE_URI",
+    "sqlite:///" + os.path.join(app.instance_path, config.RATELIMIT_STORAGE_FILE)
+)
+
 limiter = Limiter(
     key_func=get_real_ip,  # استخدام الدالة المعرفة أعلاه 
     app=app,
     default_limits=["2000 per day", "500 per hour"],
-    storage_uri="memory://",  # يمكن استبدالها بـ Redis في بيئة الإنتاج
-    strategy="fixed-window"  # استراتيجية النافذة الثابتة
+    storage_uri=ratelimit_storage_uri,
+    strategy="sliding-window-counter"  # نافذة منزلقة: لا يتضاعف الحد عند حدود النوافذ
 )
 
 # إضافة قيود خاصة لمسارات معينة
@@ -289,6 +300,17 @@ with app.app_context():
     # Create all tables
     db.create_all()
     
+    # Build the in-memory leaderboard for this worker
+    try:
+        from leaderboard import rebuild_points_leaderboard
+        rebuild_points_leaderboard()
+    except Exception as e:
+        app.logger.error(f"خطأ في بناء لوحة الصدارة: {str(e)}")
+    
+    # Create the admin treasury escrow shards
+    from treasury import ensure_treasury_shards
+    ensure_treasury_shards()
+    
     # Make models available in templates
     app.jinja_env.globals.update(
         ChatRoom=ChatRoom,
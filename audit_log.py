@@ -49,10 +49,12 @@ EVENT_TYPES = {
     'ADMIN_VERIFICATION': 'التحقق من هوية المشرف',
     'ADMIN_VERIFICATION_SUCCESS': 'تحقق ناجح من هوية المشرف',
     'UNAUTHORIZED_ACCESS': 'محاولة وصول غير مصرح به',
+    'DATA_EXPORT': 'تصدير بيانات',
     
     # أحداث نقاط وجوائز
     'POINTS_ADDITION': 'إضافة نقاط كربتو',
     'POINTS_DEDUCTION': 'خصم نقاط كربتو',
+    'POINTS_BULK_ADJUSTMENT': 'تعديل جماعي لأرصدة الكربتو',
     'REWARD_REDEMPTION': 'استبدال جائزة',
     'REWARD_CREATION': 'إنشاء جائزة جديدة',
     'REWARD_MODIFICATION': 'تعديل جائزة',
@@ -0,0 +1,322 @@
+"""
+التعديل الجماعي لأرصدة الكربتو من قبل المشرف
+بدلاً من إدخال كل تعديل عبر نموذج /admin/add-points (طلب ومعاملة وحدث تدقيق لكل مستخدم)،
+يُرفع ملف CSV أو قائمة JSON من الأسطر (المستخدم، المقدار، السبب) فتُتحقق جميعها في مرور واحد
+على أرصدة مقفلة، ثم تُطبّق بتحديث جماعي للأرصدة وإدراج جماعي للمعاملات في معاملة واحدة.
+
+الدفعة تُطبّق كاملة أو لا يُطبّق منها شيء: أي سطر خاطئ يرفض الدفعة بالكامل.
+نتيجة كل سطر تُحفظ في PointsAdjustmentBatch ويمكن تنزيلها كملف CSV.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import or_
+from app import app, db
+from models import PointsAdjustmentBatch, PointsTransaction, User
+from audit_log import log_audit_event
+from leaderboard import record_points_change
+from points_rollup import record_transactions_rollup
+import config
+
+# نوع معاملة النقاط (نفس نوع التعديل الفردي من لوحة التحكم)
+BULK_TRANSACTION_TYPE = 'admin_adjustment'
+
+# أسماء الأعمدة المقبولة في ملف CSV وعناصر JSON
+USER_FIELDS = ('user', 'username', 'user_id')
+AMOUNT_FIELDS = ('amount', 'points')
+REASON_FIELDS = ('reason', 'description')
+
+# حالات أسطر الدفعة
+ROW_APPLIED = 'applied'
+ROW_ERROR = 'error'
+ROW_SKIPPED = 'skipped'  # سطر سليم لم يُطبّق لأن الدفعة رُفضت
+
+# أعمدة ملف النتائج
+RESULT_COLUMNS = ['row', 'user', 'user_id', 'username', 'amount', 'reason', 'status', 'balance_after', 'error']
+
+
+class BulkPointsError(ValueError):
+    """خطأ في بنية الملف أو الطلب (وليس في سطر بعينه)"""
+
+
+def _pick(values, fields):
+    """أول قيمة غير فارغة من الحقول المقبولة"""
+    for field in fields:
+        value = values.get(field)
+        if value is not None and str(value).strip() != '':
+            return value, field
+    return None, None
+
+
+def _make_row(number, values):
+    user, user_field = _pick(values, USER_FIELDS)
+    amount, _ = _pick(values, AMOUNT_FIELDS)
+    reason, _ = _pick(values, REASON_FIELDS)
+    return {
+        'row': number,
+        'user': str(user).strip() if user is not None else '',
+        'user_field': user_field,
+        'amount': amount,
+        'reason': str(reason).strip() if reason is not None else '',
+    }
+
+
+def _check_size(rows):
+    if not rows:
+        raise BulkPointsError('لا توجد أسطر للتعديل')
+    if len(rows) > config.BULK_POINTS_MAX_ROWS:
+        raise BulkPointsError(f'عدد الأسطر ({len(rows)}) يتجاوز الحد الأقصى ({config.BULK_POINTS_MAX_ROWS})')
+    return rows
+
+
+def parse_csv_rows(text):
+    """
+    قراءة أسطر التعديل من نص CSV
+    السطر الأول يجب أن يكون عناوين الأعمدة (user أو username أو user_id، amount، reason)
+    """
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    reader = csv.DictReader(io.StringIO(text))
+    headers = [header.strip().lower() for header in (reader.fieldnames or []) if header]
+    if not any(field in headers for field in USER_FIELDS) or not any(field in headers for field in AMOUNT_FIELDS):
+        raise BulkPointsError('يجب أن يحتوي السطر الأول على عمودي المستخدم (user) والمقدار (amount)')
+
+    rows = []
+    for values in reader:
+        values = {(key or '').strip().lower(): value for key, value in values.items()}
+        if not any((value or '').strip() for value in values.values() if isinstance(value, str)):
+            continue  # تجاهل الأسطر الفارغة
+        # رقم السطر في الملف (بعد سطر العناوين)
+        rows.append(_make_row(reader.line_num, values))
+    return _check_size(rows)
+
+
+def parse_json_rows(payload):
+    """قراءة أسطر التعديل من قائمة JSON من الكائنات (أو نص JSON)"""
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            raise BulkPointsError('نص JSON غير صالح')
+    if isinstance(payload, dict):
+        payload = payload.get('adjustments')
+    if not isinstance(payload, list):
+        raise BulkPointsError('يجب أن تكون البيانات قائمة JSON من الأسطر')
+
+    rows = []
+    for number, values in enumerate(payload, start=1):
+        if not isinstance(values, dict):
+            values = {}
+        rows.append(_make_row(number, {str(key).lower(): value for key, value in values.items()}))
+    return _check_size(rows)
+
+
+def _load_users(rows):
+    """
+    تحميل المستخدمين المذكورين في الأسطر وقفل صفوفهم (استعلام واحد لكل دفعة من المعرفات)
+
+    Returns:
+        tuple: (المستخدمون حسب المعرف، المستخدمون حسب اسم المستخدم)
+    """
+    ids = set()
+    names = set()
+    for row in rows:
+        if not row['user']:
+            continue
+        if row['user_field'] != 'user_id':
+            names.add(row['user'])
+        if row['user'].isdigit():
+            ids.add(int(row['user']))
+
+    by_id = {}
+    by_name = {}
+    chunk_size = config.BULK_POINTS_CHUNK_SIZE
+    ids = list(ids)
+    names = list(names)
+    for start in range(0, max(len(ids), len(names)), chunk_size):
+        id_chunk = ids[start:start + chunk_size]
+        name_chunk = names[start:start + chunk_size]
+        users = db.session.query(User.id, User.username, User.points, User.is_admin).filter(
+            or_(User.id.in_(id_chunk), User.username.in_(name_chunk))
+        ).with_for_update().all()
+        for user in users:
+            by_id[user.id] = user
+            by_name[user.username] = user
+    return by_id, by_name
+
+
+def _resolve_user(row, by_id, by_name):
+    if row['user_field'] != 'user_id' and row['user'] in by_name:
+        return by_name[row['user']]
+    if row['user'].isdigit():
+        return by_id.get(int(row['user']))
+    return None
+
+
+def validate_adjustments(rows):
+    """
+    التحقق من جميع الأسطر في مرور واحد مقابل الأرصدة الحالية (المقفلة حتى نهاية المعاملة)
+    تُحسب الأرصدة تراكميًا بترتيب الأسطر، فيُرفض السطر الذي يجعل رصيد المستخدم سالبًا
+
+    Returns:
+        tuple: (نتائج الأسطر، الأرصدة النهائية حسب معرف المستخدم، معلومات المستخدمين)
+    """
+    by_id, by_name = _load_users(rows)
+    balances = {}
+    results = []
+
+    for row in rows:
+        result = {
+            'row': row['row'],
+            'user': row['user'],
+            'user_id': None,
+            'username': None,
+            'amount': row['amount'],
+            'reason': row['reason'],
+            'status': ROW_SKIPPED,
+            'balance_after': None,
+            'error': None,
+        }
+        results.append(result)
+
+        user = _resolve_user(row, by_id, by_name) if row['user'] else None
+        if user is not None:
+            result['user_id'] = user.id
+            result['username'] = user.username
+
+        try:
+            amount = int(str(row['amount']).strip()) if row['amount'] is not None else None
+        except (ValueError, TypeError):
+            amount = None
+
+        if not row['user']:
+            result['error'] = 'المستخدم غير محدد'
+        elif user is None:
+            result['error'] = f"لم يتم العثور على المستخدم: {row['user']}"
+        elif amount is None:
+            result['error'] = 'المقدار يجب أن يكون عددًا صحيحًا'
+        elif amount == 0:
+            result['error'] = 'المقدار يجب ألا يساوي صفرًا'
+        elif not row['reason']:
+            result['error'] = 'السبب مطلوب'
+        elif len(row['reason']) > 255:
+            result['error'] = 'السبب يجب ألا يتجاوز 255 حرفًا'
+
+        if result['error']:
+            result['status'] = ROW_ERROR
+            continue
+
+        result['amount'] = amount
+        balance = balances.get(user.id, user.points or 0) + amount
+        if balance < 0:
+            result['status'] = ROW_ERROR
+            result['error'] = f"رصيد {user.username} غير كاف. الرصيد المتاح: {balances.get(user.id, user.points or 0)} كربتو"
+            continue
+
+        balances[user.id] = balance
+        result['balance_after'] = balance
+
+    return results, balances, by_id
+
+
+def apply_bulk_adjustments(rows, admin_user, ip_address=None, user_agent=None):
+    """
+    التحقق من أسطر التعديل وتطبيقها في معاملة واحدة
+
+    Args:
+        rows (list): الأسطر من parse_csv_rows أو parse_json_rows
+        admin_user: المشرف الذي ينفذ التعديل
+        ip_address (str): عنوان IP للطلب
+        user_agent (str): معلومات المتصفح
+
+    Returns:
+        PointsAdjustmentBatch: الدفعة المحفوظة مع نتيجة كل سطر
+        (الحالة 'applied' أو 'rejected' إذا وُجد سطر خاطئ)
+    """
+    try:
+        results, balances, users = validate_adjustments(rows)
+        errors = sum(1 for result in results if result['status'] == ROW_ERROR)
+
+        batch = PointsAdjustmentBatch(
+            created_by_id=admin_user.id,
+            status='rejected' if errors else 'applied',
+            row_count=len(results),
+            users_count=0,
+            total_added=0,
+            total_deducted=0,
+            ip_address=ip_address
+        )
+        db.session.add(batch)
+        db.session.flush()
+
+        if not errors:
+            now = datetime.utcnow()
+            transactions = []
+            for result in results:
+                result['status'] = ROW_APPLIED
+                if result['amount'] > 0:
+                    batch.total_added += result['amount']
+                else:
+                    batch.total_deducted -= result['amount']
+                transactions.append({
+                    'user_id': result['user_id'],
+                    'amount': result['amount'],
+                    'balance_after': result['balance_after'],
+                    'transaction_type': BULK_TRANSACTION_TYPE,
+                    'related_id': batch.id,
+                    'description': result['reason'],
+                    'ip_address': ip_address,
+                    'user_agent': user_agent[:255] if user_agent else None,
+                    'created_by_id': admin_user.id,
+                    'created_at': now,
+                })
+
+            db.session.execute(db.update(User), [
+                {'id': user_id, 'points': balance} for user_id, balance in balances.items()
+            ])
+            db.session.execute(db.insert(PointsTransaction), transactions)
+            record_transactions_rollup(transactions)
+            for user_id, balance in balances.items():
+                record_points_change(user_id, balance, users[user_id].username, users[user_id].is_admin)
+            batch.users_count = len(balances)
+
+        batch.results = json.dumps(results, ensure_ascii=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في التعديل الجماعي للأرصدة: {str(e)}")
+        raise
+
+    if batch.status == 'applied':
+        app.logger.info(
+            f"Admin {admin_user.username} applied bulk adjustment #{batch.id}: {batch.row_count} rows, "
+            f"+{batch.total_added} / -{batch.total_deducted} points for {batch.users_count} users"
+        )
+        log_audit_event(
+            event_type='POINTS_BULK_ADJUSTMENT',
+            severity='WARNING',
+            details=(
+                f"تعديل جماعي #{batch.id} بواسطة المشرف {admin_user.username}: {batch.row_count} سطر، "
+                f"{batch.users_count} مستخدم، إضافة {batch.total_added} كربتو وخصم {batch.total_deducted} كربتو"
+            ),
+            user_id=admin_user.id,
+            username=admin_user.username,
+            ip_address=ip_address,
+            notify_admin=True
+        )
+    else:
+        app.logger.warning(f"Bulk adjustment #{batch.id} by {admin_user.username} rejected: {errors} invalid rows")
+
+    return batch
+
+
+def results_to_csv(batch):
+    """نتائج أسطر الدفعة كنص CSV للتنزيل"""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=RESULT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for result in batch.get_results():
+        writer.writerow(result)
+    return output.getvalue()
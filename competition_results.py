@@ -11,13 +11,49 @@ def competition_results(competition_id):
         competition_id=competition.id
     ).first_or_404()
     
+    # التقديم ما زال في طابور التصحيح
+    grading_job = get_pending_job(participation.id)
+    if grading_job is not None:
+        return render_template(
+            'competition_grading.html',
+            competition=competition,
+            grading_job=grading_job
+        )
+    
     # التحقق من أن المستخدم أكمل المسابقة
     if not participation.completed:
         flash('يجب عليك إكمال المسابقة أولاً لرؤية النتائج', 'warning')
         return redirect(url_for('competition_details', competition_id=competition.id))
     
-    # الحصول على أسئلة المسابقة
+    # قراءة النتائج المُصحّحة المحفوظة عند التقديم في استعلام واحد
+    stored_results = ParticipationAnswer.query.filter_by(
+        participation_id=participation.id
+    ).options(
+        db.joinedload(ParticipationAnswer.question)
+    ).order_by(ParticipationAnswer.position).all()
+    
+    if stored_results:
+        results = [{
+            'question': answer_result.question,
+            'is_correct': answer_result.is_correct,
+            'points_earned': answer_result.points_earned,
+            'user_answer': answer_result.answer,
+            'user_answer_text': answer_result.user_answer_text,
+            'correct_answer_text': answer_result.correct_answer_text,
+        } for answer_result in stored_results]
+        questions = [answer_result.question for answer_result in stored_results]
+        
+        return render_template(
+            'competition_results.html',
+            competition=competition,
+            participation=participation,
+            questions=questions,
+            results=results
+        )
+    
+    # المشاركات القديمة (قبل حفظ النتائج المُصحّحة): التصحيح من بيانات الإجابات المخزنة
     questions = competition.get_questions()
+    answer_key = get_answer_key(competition)
     
     # تحليل إجابات المستخدم المخزنة
     results = []
@@ -41,26 +77,14 @@ def competition_results(competition_id):
                     user_answer = user_answers[str(question.id)]
                     result_entry['user_answer'] = user_answer
                     
-                    # الحصول على تفاصيل الإجابة الصحيحة
-                    is_correct, points_earned, correct_text = question.check_answer(user_answer)
+                    # الحصول على تفاصيل الإجابة الصحيحة من المفتاح المُجمّع
+                    compiled_question = answer_key.get(question.id) or CompiledQuestion(question)
+                    is_correct, points_earned, correct_text = compiled_question.check(user_answer)
                     
                     result_entry['is_correct'] = is_correct
                     result_entry['points_earned'] = points_earned
                     result_entry['correct_answer_text'] = correct_text
-                    
-                    # تحديث نص الإجابة للعرض
-                    if question.question_type in ['multiple_choice', 'image_choice']:
-                        try:
-                            option_index = int(user_answer)
-                            options = question.options_list
-                            if 0 <= option_index < len(options):
-                                result_entry['user_answer_text'] = options[option_index]
-                        except (ValueError, TypeError, IndexError):
-                            result_entry['user_answer_text'] = user_answer
-                    elif question.question_type == 'true_false':
-                        result_entry['user_answer_text'] = 'صواب' if user_answer.lower() == 'true' else 'خطأ'
-                    else:
-                        result_entry['user_answer_text'] = user_answer
+                    result_entry['user_answer_text'] = compiled_question.answer_text(user_answer)
                 
                 results.append(result_entry)
     except (json.JSONDecodeError, TypeError) as e:
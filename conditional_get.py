@@ -0,0 +1,116 @@
+"""
+طلبات GET المشروطة (ETag / Last-Modified) لنقاط نهاية API للقراءة فقط
+تطبيقات الجوال تستعلم عن الرصيد باستمرار، وكانت كل استجابة تُبنى وتُسلسل من جديد حتى لو لم
+يتغير شيء. هنا تُشتق ETag من طوابع إصدار رخيصة (رصيد المستخدم وآخر معاملة في سجله، إصدار
+كتالوج المكافآت...) تُقرأ باستعلام أعمدة واحد، وتُرجع 304 قبل تحميل أي كائن ORM.
+
+تتضمن الاستجابات Cache-Control: private, max-age=N ورأس X-Poll-Interval لتوجيه العملاء
+إلى الفترة المناسبة بين الاستعلامات.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from flask import request, make_response
+from sqlalchemy import func
+from app import db
+from models import PointsTransaction, Referral, SystemConfig, User, REWARD_CATALOG_VERSION_KEY
+import config
+
+
+def make_etag(*parts):
+    """ETag من أجزاء طابع الإصدار (مع معاملات الطلب التي تغير محتوى الاستجابة)"""
+    raw = json.dumps(parts, default=str, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def _poll_interval(endpoint):
+    return config.API_POLL_INTERVALS.get(endpoint, config.API_POLL_INTERVALS['default'])
+
+
+def _apply_validators(response, etag, last_modified, endpoint):
+    interval = _poll_interval(endpoint)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = f'private, max-age={interval}, must-revalidate'
+    response.headers['X-Poll-Interval'] = str(interval)
+    return response
+
+
+def not_modified(endpoint, etag, last_modified=None):
+    """
+    استجابة 304 إذا كانت نسخة العميل حديثة (If-None-Match أولاً ثم If-Modified-Since)، وإلا None
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        fresh = False
+
+    if not fresh:
+        return None
+    return _apply_validators(make_response('', 304), etag, last_modified, endpoint)
+
+
+def with_validators(response, endpoint, etag, last_modified=None):
+    """إضافة ETag و Last-Modified وإرشادات الاستعلام إلى استجابة كاملة"""
+    response = make_response(response)
+    return _apply_validators(response, etag, last_modified, endpoint)
+
+
+def get_poll_metadata(endpoint):
+    """بيانات وصفية للاستجابة تخبر العميل بالفترة المقترحة بين الاستعلامات"""
+    return {'poll_interval': _poll_interval(endpoint)}
+
+
+def get_user_version(user_id):
+    """
+    طابع إصدار بيانات المستخدم: (الرصيد، اسم المستخدم، رمز الإحالة، عدد الإحالات، آخر معاملة، وقتها)
+    استعلام أعمدة واحد يستخدم الفهرس (user_id, id) لآخر معاملة
+
+    Returns:
+        tuple أو None إذا لم يوجد المستخدم
+    """
+    last_transaction = db.session.query(
+        PointsTransaction.id, PointsTransaction.created_at
+    ).filter(
+        PointsTransaction.user_id == user_id
+    ).order_by(PointsTransaction.id.desc()).limit(1).subquery()
+
+    row = db.session.query(
+        User.points, User.username, User.referral_code, User.total_referrals,
+        User.created_at, last_transaction.c.id, last_transaction.c.created_at
+    ).outerjoin(last_transaction, db.true()).filter(User.id == user_id).first()
+    return tuple(row) if row else None
+
+
+def get_referrals_version(user_id):
+    """
+    طابع إصدار إحالات المستخدم (العدد وآخر إحالة وحالات التحقق والمكافآت)
+    العنصر الأخير هو total_referrals للمستخدم (يُعرض في البيانات الوصفية دون استعلام إضافي)
+    """
+    total_referrals = db.select(User.total_referrals).where(User.id == user_id).scalar_subquery()
+    row = db.session.query(
+        func.count(Referral.id),
+        func.max(Referral.id),
+        func.max(Referral.created_at),
+        func.max(Referral.verified_at),
+        func.sum(db.case((Referral.reward_paid == True, 1), else_=0)),
+        func.sum(db.case((Referral.status == 'verified', 1), else_=0)),
+        func.sum(db.case((Referral.status == 'rejected', 1), else_=0)),
+        total_referrals
+    ).filter(Referral.referrer_id == user_id).one()
+    return tuple(row)
+
+
+def get_reward_catalog_version():
+    """إصدار كتالوج المكافآت (يتغير مع أي إضافة أو تعديل أو حذف لمكافأة)"""
+    version = SystemConfig.get(REWARD_CATALOG_VERSION_KEY)
+    if not version:
+        return None, None
+    try:
+        return version, datetime.fromisoformat(version)
+    except ValueError:
+        return version, None
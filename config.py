@@ -71,4 +71,140 @@ API_PERMISSIONS = {
     'read': 'صلاحيات القراءة فقط',
     'write': 'صلاحيات القراءة والكتابة',
     'admin': 'صلاحيات كاملة (للمشرفين فقط)'
-}
\ No newline at end of file
+}
+# ==========================================
+# إعدادات طابور تصحيح الإجابات
+# ==========================================
+
+# تصحيح الإجابات في الخلفية بدلاً من طلب التقديم نفسه
+# (يمكن تجاوزه من إعدادات النظام عبر المفتاح GRADING_QUEUE_ENABLED)
+GRADING_QUEUE_ENABLED = False
+
+# عدد عمليات التصحيح المتوازية عند تشغيل grading_worker.py
+GRADING_WORKERS = 2
+
+# عدد المهام التي يحجزها كل عامل في الدفعة الواحدة
+GRADING_BATCH_SIZE = 50
+
+# الفاصل الزمني (بالثواني) لفحص الطابور عندما يكون فارغًا
+GRADING_POLL_INTERVAL = 1
+
+# الحد الأقصى لمحاولات تصحيح المهمة قبل اعتبارها فاشلة
+GRADING_MAX_ATTEMPTS = 3
+
+# المدة (بالثواني) التي تُعتبر بعدها مهمة قيد التصحيح متوقفة ويُعاد حجزها
+GRADING_STALE_AFTER = 300
+
+# ==========================================
+# إعدادات لوحة الصدارة
+# ==========================================
+
+# المدة (بالثواني) التي يُعاد بعدها بناء لوحة الصدارة في ذاكرة العملية من قاعدة البيانات
+# (لالتقاط التغييرات التي تمت في عمليات أخرى)
+LEADERBOARD_REBUILD_INTERVAL = 300
+
+# ==========================================
+# إعدادات خزينة المشرف المركزي
+# ==========================================
+
+# عدد الحسابات الفرعية التي تُوزّع عليها منح الترحيب والإحالة (لتجنب قفل صف المشرف الواحد)
+TREASURY_SHARDS = 8
+
+# عدد النقاط التي تُحجز من حساب المشرف دفعة واحدة عند نفاد رصيد حساب فرعي
+TREASURY_REFILL_BLOCK = 500
+
+# الفاصل الزمني (بالثواني) لإعادة توزيع الرصيد بالتساوي على الحسابات الفرعية
+TREASURY_REBALANCE_INTERVAL = 300
+
+# ==========================================
+# إعدادات أرشفة سجل المعاملات
+# ==========================================
+
+# عدد الأشهر الأخيرة التي تبقى معاملاتها في جدول المعاملات (ما قبلها يُؤرشف)
+LEDGER_HOT_MONTHS = 3
+
+# مجلد ملفات أرشيف المعاملات المضغوطة (نسبةً إلى مجلد التطبيق إذا لم يكن مسارًا مطلقًا)
+LEDGER_ARCHIVE_DIR = 'ledger_archive'
+
+# الحد الأقصى لعدد المعاملات في ملف أرشيف واحد
+LEDGER_ARCHIVE_CHUNK_SIZE = 100000
+
+# أنواع المعاملات التي لا تُؤرشف أبدًا لأن الكود يبحث عنها لمنع التكرار
+# (grading يتحقق من competition_reward قبل منح مكافأة المسابقة)
+LEDGER_ARCHIVE_EXCLUDED_TYPES = ['competition_reward']
+
+# ==========================================
+# إعدادات قوائم لوحة التحكم
+# ==========================================
+
+# مدة (بالثواني) تخزين العدد الإجمالي لنتائج قوائم المعاملات والمشتريات
+ADMIN_COUNT_CACHE_TTL = 60
+
+# الحد الأقصى لعدد مجموعات المرشحات المحفوظ عددها في ذاكرة كل عملية
+ADMIN_COUNT_CACHE_SIZE = 500
+
+# ==========================================
+# إعدادات التعديل الجماعي للأرصدة
+# ==========================================
+
+# الحد الأقصى لعدد الأسطر في ملف أو طلب تعديل جماعي واحد
+BULK_POINTS_MAX_ROWS = 10000
+
+# عدد المستخدمين في كل استعلام بحث وتحديث جماعي
+BULK_POINTS_CHUNK_SIZE = 500
+
+# ==========================================
+# إعدادات مصادقة API
+# ==========================================
+
+# الحد الأقصى لعدد المفاتيح التي تم التحقق منها المحفوظة في ذاكرة كل عملية
+API_KEY_CACHE_SIZE = 10000
+
+# مدة (بالثواني) صلاحية نتيجة التحقق المحفوظة قبل إعادة التحقق عبر PBKDF2
+API_KEY_CACHE_TTL = 600
+
+# الفاصل الزمني (بالثواني) لكتابة بيانات استخدام API المؤجلة (آخر استخدام للمفاتيح وسجل الطلبات)
+API_USAGE_FLUSH_INTERVAL = 5
+
+# عدد صفوف سجل الاستخدام المعلقة التي تُكتب عندها الدفعة فورًا دون انتظار الفاصل الزمني
+API_USAGE_FLUSH_SIZE = 500
+
+# الحد الأقصى لصفوف سجل الاستخدام المحتفظ بها في الذاكرة عند تعذر الكتابة في قاعدة البيانات
+API_USAGE_MAX_PENDING = 20000
+
+# أقصى مدة (بالثواني) قبل أن تتحقق العملية من إصدار إعدادات النظام المخزنة في ذاكرتها
+SYSTEM_CONFIG_CACHE_TTL = 5
+
+# الحد الأقصى لعدد الطلبات الفرعية في طلب دفعة واحد (POST /api/v1/batch)
+API_BATCH_MAX_REQUESTS = 10
+
+# ==========================================
+# إعدادات تقييد معدل الطلبات
+# ==========================================
+
+# ملف SQLite المشترك بين عمال الخادم لعدادات تقييد الطلبات (داخل مجلد instance)
+RATELIMIT_STORAGE_FILE = 'ratelimit.sqlite'
+
+# مضاعف حدود معدل طلبات API حسب صلاحية المفتاح (يُطبق على الحد المحدد لكل نقطة نهاية)
+API_RATE_LIMIT_TIER_MULTIPLIERS = {
+    'read': 1,
+    'write': 2,
+    'admin': 5,
+}
+
+# الفترة المقترحة (بالثواني) بين استعلامات العملاء لنقاط نهاية API للقراءة فقط
+# (تُرسل في Cache-Control و X-Poll-Interval)
+API_POLL_INTERVALS = {
+    'default': 30,
+    'get_user_points': 15,
+    'get_user_info': 60,
+    'get_user_referrals': 60,
+    'get_rewards': 300,
+}
+
+# ==========================================
+# إعدادات تصدير السجلات
+# ==========================================
+
+# عدد الصفوف في كل دفعة تُجلب من قاعدة البيانات وتُكتب إلى استجابة التصدير المتدفقة
+EXPORT_BATCH_SIZE = 1000
@@ -0,0 +1,106 @@
+"""
+ذاكرة مؤقتة لإعدادات النظام (SystemConfig) في كل عملية
+كانت المصادقة في API تقرأ global_revocation_timestamp من قاعدة البيانات في كل طلب، وإعدادات CORS
+تُقرأ مع كل طلب preflight. هنا تُحمّل جميع الإعدادات دفعة واحدة في قاموس في ذاكرة العملية،
+ويُتحقق من صفّ الإصدار (config_version) مرة كل SYSTEM_CONFIG_CACHE_TTL ثانية على الأكثر،
+ولا يُعاد التحميل إلا إذا تغير الإصدار.
+
+SystemConfig.set (وأي كتابة أخرى تستدعي SystemConfig.bump_version) يزيد الإصدار في نفس المعاملة،
+فترى العمليات الأخرى التغيير خلال فترة TTL واحدة، وتراه العملية التي كتبته مباشرة بعد الالتزام.
+
+SystemConfig.get وقراءاته المنوعة (get_int و get_bool و get_list و get_json) تقرأ من هنا، و
+get_setting تعطي قيمة config.<NAME> بعد تجاوزها من إعدادات النظام، بدلاً من تعديل وحدة config
+في ذاكرة العملية التي استقبلت التغيير وحدها.
+"""
+
+import threading
+import time
+from app import app, db
+from models import SystemConfig, CONFIG_VERSION_KEY
+import config
+
+# نسخة الإعدادات الحالية: المفتاح -> القيمة النصية
+_snapshot = None
+
+# الإصدار الذي بُنيت عليه النسخة الحالية
+_version = None
+
+# وقت آخر تحقق من صف الإصدار (time.monotonic)، أو None لفرض التحقق عند القراءة التالية
+_checked_at = None
+
+_lock = threading.Lock()
+
+
+def _read_version():
+    return db.session.query(SystemConfig.value).filter(SystemConfig.key == CONFIG_VERSION_KEY).scalar()
+
+
+def _refresh():
+    """إعادة تحميل الإعدادات إذا تغير الإصدار منذ آخر تحميل (يُستدعى مع القفل)"""
+    global _snapshot, _version, _checked_at
+    try:
+        version = _read_version()
+        if _snapshot is None or version != _version:
+            _snapshot = dict(db.session.query(SystemConfig.key, SystemConfig.value).all())
+            _version = version
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في تحميل إعدادات النظام: {str(e)}")
+        if _snapshot is None:
+            raise
+    _checked_at = time.monotonic()
+
+
+def _is_stale():
+    return (
+        _snapshot is None or _checked_at is None
+        or time.monotonic() - _checked_at >= config.SYSTEM_CONFIG_CACHE_TTL
+    )
+
+
+def get_config_snapshot():
+    """قاموس جميع الإعدادات (يُتحقق من الإصدار مرة كل SYSTEM_CONFIG_CACHE_TTL ثانية)"""
+    if _is_stale():
+        with _lock:
+            if _is_stale():
+                _refresh()
+    return _snapshot
+
+
+def get_config_value(key, default=None):
+    """قيمة إعداد من الذاكرة، أو default إذا لم يكن موجودًا أو كانت قيمته فارغة"""
+    value = get_config_snapshot().get(key)
+    return default if value is None else value
+
+
+def get_setting(name):
+    """
+    قيمة config.<name> مع تجاوزها من إعدادات النظام بنفس المفتاح،
+    محولة إلى نوع القيمة الافتراضية في config.py (منطقية، عدد صحيح، قائمة، قاموس JSON أو نص)
+    """
+    default = getattr(config, name)
+    if isinstance(default, bool):
+        return SystemConfig.get_bool(name, default)
+    if isinstance(default, int):
+        return SystemConfig.get_int(name, default)
+    if isinstance(default, (list, tuple)):
+        return SystemConfig.get_list(name, default)
+    if isinstance(default, dict):
+        return SystemConfig.get_json(name, default)
+    return SystemConfig.get(name, default)
+
+
+def invalidate_config_cache():
+    """فرض التحقق من الإصدار عند القراءة التالية (بعد كتابة إعداد في هذه العملية)"""
+    global _checked_at
+    with _lock:
+        _checked_at = None
+
+
+def clear_config_cache():
+    """إفراغ الذاكرة بالكامل (تُحمّل من جديد عند القراءة التالية)"""
+    global _snapshot, _version, _checked_at
+    with _lock:
+        _snapshot = None
+        _version = None
+        _checked_at = None
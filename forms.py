@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, TextAreaField, IntegerField, BooleanField, DateTimeField, SelectField, FloatField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, NumberRange
 from models import User
@@ -135,6 +136,13 @@ class AdminPointsForm(FlaskForm):
     submit = SubmitField('تعديل الرصيد')
 
 
+class BulkPointsForm(FlaskForm):
+    """نموذج التعديل الجماعي للأرصدة (ملف CSV أو قائمة JSON)"""
+    csv_file = FileField('ملف CSV', validators=[FileAllowed(['csv', 'txt'], 'يجب أن يكون الملف بصيغة CSV')])
+    json_rows = TextAreaField('أو قائمة JSON')
+    submit = SubmitField('التحقق والتطبيق')
+
+
 class PurchaseRecordForm(FlaskForm):
     """نموذج تسجيل عملية شراء جديدة من قبل المشرف"""
     username = StringField('اسم المستخدم', validators=[DataRequired()])
@@ -0,0 +1,599 @@
+"""
+تصحيح إجابات المسابقات وطابور التصحيح في الخلفية
+يحتوي على منطق تصحيح التقديم المشترك بين التصحيح الفوري (داخل طلب التقديم)
+وعمّال التصحيح الذين يسحبون المهام من جدول grading_job في قاعدة البيانات،
+حتى لا تتراكم طلبات التقديم على عمّال الويب عند انتهاء وقت المسابقات المؤقتة.
+
+إعادة تصحيح المسابقة بعد تعديل مفتاح الإجابات تمر بنفس الطابور (مهمة من نوع regrade)،
+فلا ينتظر طلب المشرف إعادة حساب جميع المشاركات.
+"""
+
+import json
+import re
+import threading
+from datetime import datetime, timedelta
+from app import app, db
+from models import Competition, Participation, ParticipationAnswer, PointsTransaction, User, GradingJob
+from answer_key import get_answer_key
+from regrade import regrade_competition
+from config_cache import get_setting
+import config
+
+# حقول نموذج الإجابات: answer_<question_id> و time_<question_id>
+ANSWER_FIELD_PATTERN = re.compile(r'^answer_(\d+)$')
+TIME_FIELD_PATTERN = re.compile(r'^time_(\d+)$')
+
+# أنواع مهام طابور التصحيح
+JOB_TYPE_SUBMISSION = 'submission'
+JOB_TYPE_REGRADE = 'regrade'
+
+# خيط تفريغ الطابور داخل عملية الويب (لمهام إعادة التصحيح)
+_drain_thread = None
+_drain_lock = threading.Lock()
+_drain_requested = threading.Event()
+
+
+def is_grading_queue_enabled():
+    """هل وضع التصحيح في الخلفية مفعل (إعدادات النظام أولاً ثم ملف الإعدادات)"""
+    return get_setting('GRADING_QUEUE_ENABLED')
+
+
+def extract_submission(form):
+    """
+    استخراج الإجابات الخام وأوقات الإجابة من نموذج التقديم
+
+    Returns:
+        tuple: (الإجابات {question_id: answer}, الأوقات {question_id: seconds})
+    """
+    answers = {}
+    times = {}
+    for field, value in form.items():
+        match = ANSWER_FIELD_PATTERN.match(field)
+        if match:
+            answers[match.group(1)] = value
+            continue
+        match = TIME_FIELD_PATTERN.match(field)
+        if match:
+            try:
+                seconds = int(value)
+            except (ValueError, TypeError):
+                continue
+            if seconds >= 0:
+                times[match.group(1)] = seconds
+    return answers, times
+
+
+def grade_submission(competition, participation, user, answers, times=None, elapsed_time=0,
+                     submission_key=None, ip_address=None, user_agent=None):
+    """
+    تصحيح تقديم واحد وتحديث المشاركة وإضافة النقاط ومعاملاتها
+
+    يجب أن يكون سجل المشاركة مقفلاً من المستدعي (with_for_update)، ولا تنفذ الدالة commit:
+    جميع التغييرات تُحفظ في معاملة المستدعي.
+
+    Args:
+        competition: كائن المسابقة
+        participation: كائن المشاركة (مقفل)
+        user: المستخدم صاحب المشاركة
+        answers: الإجابات الخام {str(question_id): answer}
+        times: الوقت المستغرق لكل سؤال {str(question_id): seconds}
+        elapsed_time: الوقت المستغرق لإكمال المسابقة (بالثواني)
+        submission_key: مفتاح التقديم
+        ip_address: عنوان IP للتقديم
+        user_agent: معلومات متصفح التقديم
+
+    Returns:
+        list: رسائل للمستخدم [(الرسالة, الفئة)]
+    """
+    times = times or {}
+    messages = []
+    total_score = 0
+    correct_answers = 0
+    bonus_points = 0
+    time_bonus = 0
+    penalties = 0
+
+    # حفظ وقت إكمال المسابقة (بالثواني)
+    if elapsed_time > 0:
+        participation.completion_time = elapsed_time
+
+    # الحصول على مفتاح الإجابات المُجمّع للمسابقة (من ذاكرة العملية)
+    answer_key = get_answer_key(competition)
+    total_questions = answer_key.total_questions
+    app.logger.info(f"عدد الأسئلة في المسابقة: {total_questions}")
+
+    # إنشاء قاموس لتخزين إجابات المستخدم
+    user_answers = {}
+
+    # النتائج المُصحّحة لكل سؤال (تُحفظ مرة واحدة لتعرضها صفحة النتائج دون إعادة التصحيح)
+    answer_results = []
+
+    # التحقق من كل إجابة
+    for position, question_id in enumerate(answer_key.question_ids):
+        compiled_question = answer_key.get(question_id)
+        answer_result = ParticipationAnswer(
+            participation_id=participation.id,
+            competition_id=competition.id,
+            question_id=question_id,
+            user_id=user.id,
+            position=position,
+            is_correct=False,
+            points_earned=0,
+            user_answer_text='لم تتم الإجابة',
+            correct_answer_text=compiled_question.correct_text
+        )
+        answer_results.append(answer_result)
+
+        if str(question_id) in answers:
+            user_answer = answers[str(question_id)]
+            user_answers[str(question_id)] = user_answer
+            app.logger.debug(f"إجابة المستخدم على السؤال {question_id}: {user_answer}")
+
+            # التصحيح باستخدام مفتاح الإجابات المُجمّع
+            is_correct, points_earned, correct_text = answer_key.grade(question_id, user_answer)
+
+            answer_result.answer = user_answer
+            answer_result.is_correct = is_correct
+            answer_result.points_earned = points_earned
+            answer_result.user_answer_text = compiled_question.answer_text(user_answer)
+
+            # الوقت المستغرق للإجابة على السؤال كما سجلته صفحة المسابقة
+            answer_result.time_spent = times.get(str(question_id))
+
+            if is_correct:
+                correct_answers += 1
+                total_score += points_earned
+                app.logger.debug(f"إجابة صحيحة! +{points_earned} نقاط")
+            else:
+                # تطبيق العقوبة إذا كانت مفعلة
+                if hasattr(competition, 'penalty_for_wrong_answers') and competition.penalty_for_wrong_answers > 0:
+                    penalty = competition.penalty_for_wrong_answers
+                    penalties += penalty
+                    app.logger.debug(f"عقوبة للإجابة الخاطئة: -{penalty} نقطة")
+
+                app.logger.debug(f"إجابة خاطئة. الإجابة الصحيحة: '{correct_text}'")
+        else:
+            app.logger.debug(f"لم يتم العثور على إجابة للسؤال {question_id}")
+
+    # حساب المكافآت الإضافية
+
+    # مكافأة الإجابة على جميع الأسئلة بشكل صحيح
+    if hasattr(competition, 'bonus_points') and correct_answers == total_questions and competition.bonus_points > 0:
+        bonus_points = competition.bonus_points
+        app.logger.info(f"مكافأة الإجابة على جميع الأسئلة بشكل صحيح: +{bonus_points} نقطة")
+
+    # حساب مكافأة الوقت (إذا أكمل المسابقة بسرعة)
+    if hasattr(competition, 'has_time_limit') and competition.has_time_limit and elapsed_time > 0:
+        # إذا كان الوقت المتبقي أكثر من نصف الوقت الإجمالي
+        time_remaining_ratio = 1 - (elapsed_time / competition.time_limit)
+        if time_remaining_ratio > 0.5:
+            time_bonus = int(total_score * 0.2)  # 20% مكافأة للوقت السريع
+            app.logger.info(f"مكافأة الوقت السريع: +{time_bonus} نقطة")
+
+    app.logger.info(f"النتيجة: {correct_answers} إجابات صحيحة من أصل {total_questions}. المجموع: {total_score} نقطة")
+
+    # حفظ إجابات المستخدم كـ JSON
+    participation.answers_data = json.dumps(user_answers)
+
+    # تحديث بيانات المشاركة
+    participation.score = total_score
+    participation.completed = True
+    participation.correct_answers = correct_answers
+    participation.bonus_points = bonus_points
+    participation.penalties = penalties
+    participation.time_bonus = time_bonus
+    participation.completed_at = datetime.utcnow()
+    participation.submission_key = submission_key
+
+    # استبدال النتائج المُصحّحة السابقة لهذه المشاركة (في حال إعادة المحاولة)
+    ParticipationAnswer.query.filter_by(participation_id=participation.id).delete(synchronize_session=False)
+    db.session.add_all(answer_results)
+    app.logger.info(f"تم تحديث بيانات المشاركة")
+
+    # إضافة النقاط مباشرة إلى رصيد المستخدم (إلا إذا كان مشرفًا)
+    total_points = total_score + bonus_points + time_bonus - penalties
+
+    if total_points > 0 and not user.is_admin:
+        # إضافة النقاط ذريًا داخل قاعدة البيانات
+        balance_after = User.increment_points(user.id, total_points)
+
+        # تسجيل معاملة النقاط
+        db.session.add(PointsTransaction(
+            user_id=user.id,
+            amount=total_points,
+            balance_after=balance_after,
+            transaction_type='competition_question_points',
+            related_id=competition.id,
+            description=f'نقاط المسابقة: {competition.title} ({correct_answers}/{total_questions} صحيحة)',
+            ip_address=ip_address,
+            user_agent=user_agent
+        ))
+
+        app.logger.info(f"تمت إضافة {total_points} نقطة لرصيد المستخدم. الرصيد بعد: {balance_after}")
+        messages.append((f'تهانينا! تمت إضافة {total_points} كربتو إلى رصيدك!', 'success'))
+
+    # حساب وإضافة نقاط المكافأة الإضافية إذا كانت المسابقة تمنح نقاط إضافية
+    # التحقق أولاً مما إذا كان المستخدم قد تلقى بالفعل مكافأة هذه المسابقة
+    already_received_reward = PointsTransaction.query.filter_by(
+        user_id=user.id,
+        transaction_type='competition_reward',
+        related_id=competition.id
+    ).first()
+
+    if already_received_reward:
+        app.logger.info(f"المستخدم {user.username} تلقى بالفعل مكافأة المسابقة #{competition.id}. لن يتم إضافة مكافأة مرة أخرى.")
+    elif competition.points > 0 and total_questions > 0:
+        # لم يحصل المستخدم على مكافأة هذه المسابقة من قبل
+        success_percentage = (correct_answers / total_questions) * 100
+        reward_points = 0
+
+        if success_percentage >= 80:  # 80% أو أعلى للحصول على كامل النقاط
+            reward_points = competition.points
+            app.logger.info(f"نسبة النجاح {success_percentage}% >= 80%. المكافأة الكاملة: {reward_points}")
+        elif success_percentage >= 50:  # 50% أو أعلى للحصول على نصف النقاط
+            reward_points = competition.points // 2
+            app.logger.info(f"نسبة النجاح {success_percentage}% >= 50%. نصف المكافأة: {reward_points}")
+        else:
+            app.logger.info(f"نسبة النجاح {success_percentage}% < 50%. لا توجد مكافأة إضافية.")
+
+        if reward_points > 0:
+            # إضافة النقاط مباشرة (إلا إذا كان مشرفًا)
+            if not user.is_admin:
+                balance_after = User.increment_points(user.id, reward_points)
+
+                # تسجيل معاملة النقاط
+                db.session.add(PointsTransaction(
+                    user_id=user.id,
+                    amount=reward_points,
+                    balance_after=balance_after,
+                    transaction_type='competition_reward',
+                    related_id=competition.id,
+                    description=f'مكافأة المشاركة في مسابقة: {competition.title}',
+                    ip_address=ip_address,
+                    user_agent=user_agent
+                ))
+                app.logger.info(f"تمت إضافة {reward_points} نقطة إضافية كمكافأة. الرصيد بعد: {balance_after}")
+
+            messages.append((f'تهانينا! لقد كسبت {reward_points} كربتو إضافية كمكافأة على أدائك الجيد في المسابقة.', 'success'))
+
+    return messages
+
+
+def get_pending_job(participation_id):
+    """آخر مهمة تصحيح لم تنته بعد لهذه المشاركة (أو None)"""
+    return GradingJob.query.filter(
+        GradingJob.participation_id == participation_id,
+        GradingJob.status.in_(('pending', 'processing'))
+    ).order_by(GradingJob.id.desc()).first()
+
+
+def enqueue_submission(competition, participation, user, answers, times=None, elapsed_time=0,
+                       submission_key=None, ip_address=None, user_agent=None):
+    """
+    إضافة تقديم إلى طابور التصحيح بدلاً من تصحيحه داخل الطلب
+    لا تنفذ commit؛ تُحفظ المهمة ضمن معاملة المستدعي مع قفل المشاركة.
+
+    Returns:
+        GradingJob: مهمة التصحيح الجديدة
+    """
+    job = GradingJob(
+        job_type=JOB_TYPE_SUBMISSION,
+        participation_id=participation.id,
+        competition_id=competition.id,
+        user_id=user.id,
+        answers_data=json.dumps({'answers': answers, 'times': times or {}}),
+        elapsed_time=elapsed_time,
+        submission_key=submission_key,
+        status='pending',
+        ip_address=ip_address,
+        user_agent=user_agent[:255] if user_agent else None
+    )
+    db.session.add(job)
+
+    # تسجيل مفتاح التقديم فورًا حتى تُعامل أي إعادة إرسال كتقديم مكرر
+    participation.submission_key = submission_key
+    return job
+
+
+def get_pending_regrade(competition_id):
+    """آخر مهمة إعادة تصحيح لم تنته بعد لهذه المسابقة (أو None)"""
+    return GradingJob.query.filter(
+        GradingJob.job_type == JOB_TYPE_REGRADE,
+        GradingJob.competition_id == competition_id,
+        GradingJob.status.in_(('pending', 'processing'))
+    ).order_by(GradingJob.id.desc()).first()
+
+
+def enqueue_regrade(competition, admin_user, ip_address=None):
+    """
+    إضافة إعادة تصحيح المسابقة إلى طابور التصحيح
+    لا تنفذ commit. إذا كانت هناك مهمة لم تبدأ بعد لنفس المسابقة تُعاد بدلاً من إضافة أخرى،
+    لأن إعادة التصحيح تستخدم مفتاح الإجابات الحالي عند تنفيذها.
+
+    Returns:
+        GradingJob: مهمة إعادة التصحيح
+    """
+    job = GradingJob.query.filter_by(
+        job_type=JOB_TYPE_REGRADE,
+        competition_id=competition.id,
+        status='pending'
+    ).first()
+    if job is not None:
+        return job
+
+    job = GradingJob(
+        job_type=JOB_TYPE_REGRADE,
+        competition_id=competition.id,
+        user_id=admin_user.id,
+        answers_data='{}',
+        status='pending',
+        ip_address=ip_address
+    )
+    db.session.add(job)
+    return job
+
+
+def _claim_job(job_id, now):
+    """
+    حجز مهمة واحدة بتحديث مشروط (pending -> processing)
+    يحجزها عامل واحد فقط حتى دون أقفال الصفوف (مثل SQLite): العامل الذي يغير الحالة أولاً
+
+    Returns:
+        bool: هل حُجزت المهمة لهذا العامل
+    """
+    result = db.session.execute(
+        db.update(GradingJob).where(
+            GradingJob.id == job_id,
+            GradingJob.status == 'pending'
+        ).values(
+            status='processing',
+            started_at=now,
+            attempts=db.func.coalesce(GradingJob.attempts, 0) + 1
+        ).execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def claim_grading_jobs(batch_size=None):
+    """
+    حجز دفعة من مهام التصحيح المعلقة لهذا العامل
+
+    تُختار المهام المرشحة بـ FOR UPDATE SKIP LOCKED (حيث تدعمه قاعدة البيانات) ثم تُحجز كل مهمة
+    بتحديث مشروط على حالتها، فلا يحجز عاملان نفس المهمة. تُعاد المهام التي بقيت قيد التصحيح
+    لفترة طويلة (توقف عامل) إلى الطابور.
+
+    Returns:
+        list: معرفات المهام المحجوزة
+    """
+    batch_size = batch_size or config.GRADING_BATCH_SIZE
+    now = datetime.utcnow()
+
+    try:
+        # إعادة المهام المتوقفة إلى الطابور (إذا كان العامل الأصلي ما زال يعمل فلن يستطيع إنهاءها،
+        # لأن الإنهاء مشروط بعدد المحاولات الذي حجزها به)
+        GradingJob.query.filter(
+            GradingJob.status == 'processing',
+            GradingJob.started_at < now - timedelta(seconds=config.GRADING_STALE_AFTER)
+        ).update({GradingJob.status: 'pending'}, synchronize_session=False)
+
+        candidate_ids = [job_id for (job_id,) in db.session.query(GradingJob.id).filter(
+            GradingJob.status == 'pending'
+        ).order_by(GradingJob.id).limit(batch_size).with_for_update(skip_locked=True)]
+
+        claimed = [job_id for job_id in candidate_ids if _claim_job(job_id, now)]
+        db.session.commit()
+        return claimed
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في حجز مهام التصحيح: {str(e)}")
+        return []
+
+
+def _finish_job(job_id, claimed_attempt, **values):
+    """
+    تحديث حالة مهمة ما زالت محجوزة لهذا العامل (processing بنفس رقم المحاولة)
+
+    Returns:
+        bool: هل تم التحديث (False إذا أُعيدت المهمة إلى الطابور وحجزها عامل آخر)
+    """
+    result = db.session.execute(
+        db.update(GradingJob).where(
+            GradingJob.id == job_id,
+            GradingJob.status == 'processing',
+            GradingJob.attempts == claimed_attempt
+        ).values(**values).execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _is_already_graded(participation, job):
+    """هل صُححت المشاركة بالفعل لتقديم هذه المهمة (مثلاً من عامل سابق انتهت مهلته)"""
+    return bool(
+        participation.completed
+        and job.submission_key
+        and participation.submission_key == job.submission_key
+        and participation.completed_at
+        and job.created_at
+        and participation.completed_at >= job.created_at
+    )
+
+
+def _run_submission_job(job):
+    """تصحيح تقديم المهمة ضمن المعاملة الحالية (لا تنفذ commit)"""
+    participation = Participation.query.filter_by(
+        id=job.participation_id
+    ).with_for_update().first()
+    competition = db.session.get(Competition, job.competition_id)
+    user = db.session.get(User, job.user_id)
+    if participation is None or competition is None or user is None:
+        raise ValueError("المشاركة أو المسابقة أو المستخدم غير موجود")
+
+    if _is_already_graded(participation, job):
+        app.logger.info(f"المشاركة #{participation.id} مُصححة بالفعل لمهمة التصحيح #{job.id}")
+        return
+
+    payload = json.loads(job.answers_data)
+    grade_submission(
+        competition,
+        participation,
+        user,
+        payload.get('answers', {}),
+        times=payload.get('times', {}),
+        elapsed_time=job.elapsed_time or 0,
+        submission_key=job.submission_key,
+        ip_address=job.ip_address,
+        user_agent=job.user_agent
+    )
+
+
+def _run_regrade_job(job):
+    """
+    إعادة تصحيح مسابقة المهمة (تنفذ commit خاص بها)
+    يُقفل سجل المسابقة أولاً حتى لا تحسب مهمتان فروقات الأرصدة من نفس القيم القديمة
+    """
+    competition = Competition.query.filter_by(id=job.competition_id).with_for_update().first()
+    if competition is None:
+        raise ValueError("المسابقة غير موجودة")
+
+    summary = regrade_competition(competition, admin_user=db.session.get(User, job.user_id), ip_address=job.ip_address)
+    if summary['legacy_skipped']:
+        app.logger.warning(
+            f"إعادة تصحيح المسابقة #{competition.id}: تم تجاهل {summary['legacy_skipped']} مشاركة قديمة "
+            f"لم تُنقل إلى جدول الإجابات المُصحّحة"
+        )
+
+
+def process_grading_job(job_id):
+    """
+    تصحيح مهمة واحدة في معاملة مستقلة
+    إنهاء المهمة (processing -> done) مشروط ويُنفذ في نفس معاملة التصحيح، فإذا فقد العامل المهمة
+    يُتراجع عن التصحيح كاملاً ولا تُضاف النقاط مرتين
+
+    Returns:
+        bool: نجاح التصحيح
+    """
+    job = db.session.get(GradingJob, job_id)
+    if job is None or job.status != 'processing':
+        return False
+    claimed_attempt = job.attempts
+
+    try:
+        if job.job_type == JOB_TYPE_REGRADE:
+            _run_regrade_job(job)
+        else:
+            _run_submission_job(job)
+
+        if not _finish_job(job_id, claimed_attempt, status='done', error=None, finished_at=datetime.utcnow()):
+            db.session.rollback()
+            app.logger.warning(f"لم تعد مهمة التصحيح #{job_id} محجوزة لهذا العامل، تم التراجع عن تصحيحها")
+            return False
+
+        db.session.commit()
+        app.logger.info(f"تم تصحيح مهمة التصحيح #{job_id} للمشاركة #{job.participation_id}")
+        return True
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في تصحيح المهمة #{job_id}: {str(e)}")
+
+        try:
+            if (claimed_attempt or 0) >= config.GRADING_MAX_ATTEMPTS:
+                _finish_job(job_id, claimed_attempt, status='failed', error=str(e)[:255],
+                            finished_at=datetime.utcnow())
+            else:
+                _finish_job(job_id, claimed_attempt, status='pending', error=str(e)[:255])
+            db.session.commit()
+        except Exception as update_error:
+            db.session.rollback()
+            app.logger.error(f"خطأ في تحديث حالة مهمة التصحيح #{job_id}: {str(update_error)}")
+        return False
+
+
+def process_grading_jobs(batch_size=None):
+    """
+    حجز دفعة من المهام وتصحيحها
+
+    Returns:
+        int: عدد المهام التي تمت معالجتها
+    """
+    job_ids = claim_grading_jobs(batch_size)
+    for job_id in job_ids:
+        process_grading_job(job_id)
+    return len(job_ids)
+
+
+def run_grading_worker(stop_event=None, poll_interval=None):
+    """حلقة عامل التصحيح: تفرغ الطابور على دفعات وتنتظر عندما يكون فارغًا"""
+    poll_interval = poll_interval or config.GRADING_POLL_INTERVAL
+    stop_event = stop_event or threading.Event()
+
+    with app.app_context():
+        while not stop_event.is_set():
+            try:
+                processed = process_grading_jobs()
+            except Exception as e:
+                app.logger.error(f"خطأ في عامل التصحيح: {str(e)}")
+                processed = 0
+            finally:
+                db.session.remove()
+
+            if not processed:
+                stop_event.wait(poll_interval)
+
+
+def start_grading_workers(count=None, stop_event=None):
+    """
+    تشغيل مجموعة من عمّال التصحيح في خيوط منفصلة
+
+    Returns:
+        list: خيوط العمّال
+    """
+    count = count or config.GRADING_WORKERS
+    workers = []
+    for index in range(count):
+        worker = threading.Thread(
+            target=run_grading_worker,
+            kwargs={'stop_event': stop_event},
+            name=f'grading-worker-{index + 1}',
+            daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+    app.logger.info(f"تم تشغيل {count} من عمّال التصحيح")
+    return workers
+
+
+def _drain_grading_queue():
+    global _drain_thread
+    with app.app_context():
+        while True:
+            _drain_requested.clear()
+            try:
+                while process_grading_jobs():
+                    db.session.remove()
+            except Exception as e:
+                app.logger.error(f"خطأ في تفريغ طابور التصحيح: {str(e)}")
+            finally:
+                db.session.remove()
+
+            with _drain_lock:
+                # لم تُضف مهام أثناء التفريغ: إنهاء الخيط
+                if not _drain_requested.is_set():
+                    _drain_thread = None
+                    return
+
+
+def start_grading_queue_drain():
+    """
+    تفريغ طابور التصحيح في خيط خلفي داخل هذه العملية حتى يفرغ
+    تُستدعى بعد إضافة مهمة إعادة تصحيح، فتُنفذ حتى لو لم يكن grading_worker.py مشغلاً؛
+    وإن كان مشغلاً يتقاسمان المهام عبر الحجز المشروط
+    """
+    global _drain_thread
+    with _drain_lock:
+        _drain_requested.set()
+        if _drain_thread is not None and _drain_thread.is_alive():
+            return _drain_thread
+
+        _drain_thread = threading.Thread(target=_drain_grading_queue, name='grading-drain', daemon=True)
+        _drain_thread.start()
+    return _drain_thread
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+عامل تصحيح الإجابات في الخلفية
+يسحب مهام التصحيح من جدول grading_job ويصححها على دفعات باستخدام عدة خيوط.
+يُشغّل كعملية مستقلة بجانب خادم الويب عند تفعيل GRADING_QUEUE_ENABLED:
+
+    python grading_worker.py [عدد العمّال]
+"""
+import sys
+import os
+import signal
+import logging
+import threading
+
+# تكوين سجل الأحداث
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# التأكد من تنفيذ السكريبت من الدليل الرئيسي للمشروع
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+try:
+    from app import app, db
+    from grading import start_grading_workers
+    import config
+    logger.info("تم استيراد المكتبات بنجاح")
+except ImportError as e:
+    logger.error(f"خطأ في استيراد المكتبات: {e}")
+    sys.exit(1)
+
+
+def main():
+    """تشغيل العمّال حتى استلام إشارة الإيقاف"""
+    try:
+        workers_count = int(sys.argv[1]) if len(sys.argv) > 1 else config.GRADING_WORKERS
+    except ValueError:
+        logger.error("يجب أن يكون عدد العمّال رقمًا صحيحًا")
+        return 1
+
+    # التأكد من وجود جدول الطابور
+    with app.app_context():
+        db.create_all()
+
+    stop_event = threading.Event()
+
+    def handle_stop(signum, frame):
+        logger.info("تم استلام إشارة الإيقاف، سيتوقف العمّال بعد إنهاء الدفعة الحالية")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_stop)
+    signal.signal(signal.SIGTERM, handle_stop)
+
+    workers = start_grading_workers(workers_count, stop_event=stop_event)
+    logger.info(f"عمّال التصحيح يعملون ({workers_count})")
+
+    while any(worker.is_alive() for worker in workers):
+        for worker in workers:
+            worker.join(timeout=1)
+
+    logger.info("تم إيقاف عمّال التصحيح")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
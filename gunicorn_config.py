@@ -23,4 +23,10 @@ raw_env = ["PORT=8080"]
 # تكوين السجلات
 accesslog = "-"  # stdout
 errorlog = "-"   # stderr
-loglevel = "info"
\ No newline at end of file
+loglevel = "info"
+
+
+def post_fork(server, worker):
+    """بدء الخيوط الخلفية في كل عامل (الخيوط المبدوءة في العملية الرئيسية مع preload_app لا تنتقل بعد fork)"""
+    from main import start_background_workers
+    start_background_workers()
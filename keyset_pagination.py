@@ -0,0 +1,121 @@
+"""
+ترقيم الصفحات بالمؤشرات (keyset / seek pagination) لقوائم لوحة التحكم
+بدلاً من OFFSET (الذي يمر على جميع الصفوف السابقة) و COUNT(*) في كل طلب، تُحدد الصفحة
+بآخر (created_at, id) تم عرضه، فتكلف الصفحة رقم 500 مثل الصفحة الأولى عبر فهرس مركب
+على (created_at, id). العدد الإجمالي تقريبي ويُخزن مؤقتًا في ذاكرة العملية.
+"""
+
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import tuple_
+import config
+
+# عدادات الصفوف المخزنة مؤقتًا: المفتاح -> (وقت الحساب، العدد)، الأحدث استخدامًا في النهاية
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+def encode_cursor(values):
+    """ترميز موضع الصفحة (قيم مفتاح الترتيب) كنص غير شفاف صالح للروابط"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """فك ترميز المؤشر إلى (created_at, id)، أو None إذا كان غير صالح"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw.decode('utf-8'))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def get_cached_count(key, query):
+    """
+    عدد صفوف الاستعلام مخزنًا لمدة ADMIN_COUNT_CACHE_TTL ثانية لكل مجموعة مرشحات
+    (بحد أقصى ADMIN_COUNT_CACHE_SIZE مجموعة، ويُحذف الأقدم استخدامًا عند الامتلاء)
+    """
+    now = time.time()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached and now - cached[0] < config.ADMIN_COUNT_CACHE_TTL:
+            _count_cache.move_to_end(key)
+            return cached[1]
+
+    count = query.order_by(None).count()
+    with _count_cache_lock:
+        _count_cache[key] = (now, count)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > config.ADMIN_COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return count
+
+
+class KeysetPage:
+    """صفحة نتائج مع مؤشرات الصفحة التالية والسابقة"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, created_column, id_column, per_page, after=None, before=None, count_key=None):
+    """
+    صفحة من الاستعلام مرتبة من الأحدث إلى الأقدم حسب (created_at, id)
+
+    Args:
+        after (str): مؤشر الصفحة التالية (صفوف أقدم من الموضع)
+        before (str): مؤشر الصفحة السابقة (صفوف أحدث من الموضع)
+        count_key (tuple): مفتاح تخزين العدد الإجمالي (None لتجاهل العدد)
+    """
+    total = get_cached_count(count_key, query) if count_key is not None else None
+    key = tuple_(created_column, id_column)
+
+    after_position = decode_cursor(after)
+    before_position = decode_cursor(before) if after_position is None else None
+
+    if before_position is not None:
+        # الصفحة السابقة: أقرب الصفوف الأحدث بترتيب تصاعدي ثم عكسها
+        rows = query.filter(key > tuple_(*before_position)).order_by(
+            created_column.asc(), id_column.asc()
+        ).limit(per_page + 1).all()
+        has_newer = len(rows) > per_page
+        rows = list(reversed(rows[:per_page]))
+        has_older = True
+    else:
+        if after_position is not None:
+            query = query.filter(key < tuple_(*after_position))
+        rows = query.order_by(created_column.desc(), id_column.desc()).limit(per_page + 1).all()
+        has_older = len(rows) > per_page
+        rows = rows[:per_page]
+        has_newer = after_position is not None
+
+    def position(row):
+        return encode_cursor((getattr(row, created_column.key), getattr(row, id_column.key)))
+
+    return KeysetPage(
+        rows,
+        per_page,
+        next_cursor=position(rows[-1]) if rows and has_older else None,
+        prev_cursor=position(rows[0]) if rows and has_newer else None,
+        total=total
+    )
@@ -0,0 +1,427 @@
+"""
+لوحات الصدارة في ذاكرة العملية
+تحتفظ بترتيب المستخدمين (حسب الرصيد) والمشاركين في كل مسابقة (حسب النتيجة) داخل قائمة تخطي
+مفهرسة (indexable skiplist) مرتبة بالمفتاح (-النقاط، المعرف)، بحيث يتم الحصول على الأوائل
+وترتيب مستخدم معين والمستخدمين المجاورين له في O(log n) دون استعلام ORDER BY عند كل طلب.
+
+تُبنى اللوحات من قاعدة البيانات عند بدء العملية، وتُحدَّث تدريجيًا بعد كل commit يغيّر
+رصيد مستخدم أو نتيجة مشاركة. يُعاد بناء اللوحة العامة دوريًا في خيط خلفي لكل عامل
+لالتقاط تغييرات العمليات الأخرى دون أن يتحمل أي طلب كلفة إعادة البناء.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import app, db
+import config
+
+# عنصر لوحة الصدارة كما يُعرض في القوالب
+LeaderboardEntry = namedtuple('LeaderboardEntry', ['rank', 'user_id', 'username', 'points'])
+
+# الحد الأقصى لمستويات قائمة التخطي (يكفي لأكثر من مليون عنصر بكفاءة)
+SKIPLIST_MAX_LEVELS = 24
+
+# مفتاح التغييرات المعلقة في session.info
+PENDING_CHANGES_KEY = 'leaderboard_pending'
+
+
+class _Infinity:
+    """قيمة أكبر من أي مفتاح (نهاية قائمة التخطي)"""
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return other is self
+
+    def __gt__(self, other):
+        return other is not self
+
+    def __ge__(self, other):
+        return True
+
+
+class _SkiplistNode:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, next_nodes, widths):
+        self.key = key
+        self.next = next_nodes
+        self.width = widths
+
+
+class IndexableSkiplist:
+    """
+    قائمة تخطي مفهرسة: إدراج وحذف والوصول بالموقع وحساب الترتيب في O(log n)
+    كل رابط يحمل عرضه (عدد العناصر التي يتخطاها) لحساب المواقع أثناء البحث
+    """
+
+    def __init__(self, max_levels=SKIPLIST_MAX_LEVELS):
+        self.size = 0
+        self.max_levels = max_levels
+        self._nil = _SkiplistNode(_Infinity(), [], [])
+        self._head = _SkiplistNode(None, [self._nil] * max_levels, [1] * max_levels)
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        level = 1
+        while level < self.max_levels and random.random() < 0.5:
+            level += 1
+        return level
+
+    def insert(self, key):
+        """إدراج مفتاح"""
+        chain = [None] * self.max_levels
+        steps_at_level = [0] * self.max_levels
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = self._random_level()
+        new_node = _SkiplistNode(key, [None] * height, [None] * height)
+        steps = 0
+        for level in range(height):
+            previous = chain[level]
+            new_node.next[level] = previous.next[level]
+            previous.next[level] = new_node
+            new_node.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self.max_levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        """حذف مفتاح موجود"""
+        chain = [None] * self.max_levels
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is self._nil or target.key != key:
+            raise KeyError(key)
+
+        for level in range(len(target.next)):
+            previous = chain[level]
+            previous.width[level] += target.width[level] - 1
+            previous.next[level] = target.next[level]
+        for level in range(len(target.next), self.max_levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        """عدد المفاتيح الأصغر من المفتاح المحدد (الموقع بدءًا من الصفر)"""
+        position = 0
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def __getitem__(self, index):
+        """المفتاح في الموقع المحدد (بدءًا من الصفر)"""
+        if index < 0 or index >= self.size:
+            raise IndexError(index)
+        node = self._head
+        remaining = index + 1
+        for level in reversed(range(self.max_levels)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node.key
+
+    def slice(self, start, stop):
+        """المفاتيح من الموقع start حتى stop (دون stop)"""
+        start = max(start, 0)
+        stop = min(stop, self.size)
+        if start >= stop:
+            return []
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(self.max_levels)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        for _ in range(stop - start):
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """لوحة صدارة مرتبة تنازليًا حسب النقاط مع كسر التعادل بالمعرف الأصغر"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._skiplist = IndexableSkiplist()
+        self._entries = {}  # user_id -> [points, username]
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    @staticmethod
+    def _key(user_id, points):
+        return (-points, user_id)
+
+    def load(self, rows):
+        """إعادة بناء اللوحة بالكامل من صفوف (user_id, username, points)"""
+        # البناء خارج القفل ثم الاستبدال، حتى لا تنتظر الطلبات القارئة طوال إعادة البناء
+        skiplist = IndexableSkiplist()
+        entries = {}
+        for user_id, username, points in rows:
+            points = points or 0
+            entries[user_id] = [points, username]
+            skiplist.insert(self._key(user_id, points))
+        with self._lock:
+            self._skiplist = skiplist
+            self._entries = entries
+            self.built_at = time.time()
+
+    def set(self, user_id, points, username=None):
+        """تحديث نقاط مستخدم (أو إضافته)"""
+        points = points or 0
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                if entry[0] == points:
+                    if username:
+                        entry[1] = username
+                    return
+                self._skiplist.remove(self._key(user_id, entry[0]))
+                entry[0] = points
+                if username:
+                    entry[1] = username
+            else:
+                self._entries[user_id] = [points, username]
+            self._skiplist.insert(self._key(user_id, points))
+
+    def remove(self, user_id):
+        """حذف مستخدم من اللوحة"""
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self._skiplist.remove(self._key(user_id, entry[0]))
+
+    def set_username(self, user_id, username):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry[1] = username
+
+    def _entries_for(self, start, stop):
+        keys = self._skiplist.slice(start, stop)
+        return [
+            LeaderboardEntry(start + offset + 1, key[1], self._entries[key[1]][1], -key[0])
+            for offset, key in enumerate(keys)
+        ]
+
+    def top(self, limit):
+        """أفضل limit مستخدمين"""
+        with self._lock:
+            return self._entries_for(0, limit)
+
+    def rank(self, user_id):
+        """ترتيب المستخدم (يبدأ من 1) أو None إذا لم يكن في اللوحة"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return self._skiplist.rank(self._key(user_id, entry[0])) + 1
+
+    def around(self, user_id, radius=2):
+        """المستخدم ومن حوله في الترتيب (radius قبله و radius بعده)"""
+        with self._lock:
+            rank = self.rank(user_id)
+            if rank is None:
+                return []
+            return self._entries_for(rank - 1 - radius, rank + radius)
+
+
+# لوحة الصدارة العامة (رصيد المستخدمين) ولوحات المسابقات (نتائج المشاركات)
+points_leaderboard = Leaderboard()
+_competition_leaderboards = {}
+_competition_leaderboards_lock = threading.Lock()
+
+# خيط إعادة البناء الدوري للوحة العامة والعملية التي بدأته (لا يرث العامل خيوط العملية الأم بعد fork)
+_refresher_lock = threading.Lock()
+_refresher_thread = None
+_refresher_pid = None
+
+
+def rebuild_points_leaderboard():
+    """إعادة بناء لوحة الصدارة العامة من قاعدة البيانات (المشرفون مستبعدون)"""
+    from models import User
+
+    rows = db.session.query(User.id, User.username, User.points).filter(User.is_admin == False).all()
+    points_leaderboard.load(rows)
+    app.logger.info(f"تم بناء لوحة الصدارة ({len(rows)} مستخدم)")
+    return points_leaderboard
+
+
+def get_points_leaderboard():
+    """
+    لوحة الصدارة العامة
+    يُعاد بناؤها دوريًا في الخيط الخلفي (start_leaderboard_refresher)، ولا تُبنى هنا إلا إذا لم تُبنَ بعد
+    """
+    if points_leaderboard.built_at is None:
+        rebuild_points_leaderboard()
+    return points_leaderboard
+
+
+def _refresh_loop(interval):
+    while True:
+        with app.app_context():
+            try:
+                rebuild_points_leaderboard()
+            except Exception as e:
+                app.logger.error(f"خطأ في إعادة بناء لوحة الصدارة: {str(e)}")
+            finally:
+                db.session.remove()
+        time.sleep(interval)
+
+
+def start_leaderboard_refresher(interval=None):
+    """
+    بدء خيط خلفي يبني لوحة الصدارة العامة فورًا ثم يعيد بناءها دوريًا
+    يُستدعى عند استيراد التطبيق وبعد fork في كل عامل gunicorn، ولا يبدأ أكثر من خيط واحد لكل عملية
+    """
+    global _refresher_thread, _refresher_pid
+    with _refresher_lock:
+        if _refresher_pid == os.getpid() and _refresher_thread is not None and _refresher_thread.is_alive():
+            return _refresher_thread
+
+        _refresher_thread = threading.Thread(
+            target=_refresh_loop,
+            args=(interval or config.LEADERBOARD_REBUILD_INTERVAL,),
+            daemon=True
+        )
+        _refresher_thread.start()
+        _refresher_pid = os.getpid()
+    return _refresher_thread
+
+
+def get_competition_leaderboard(competition_id):
+    """لوحة صدارة المسابقة (تُبنى عند أول طلب وتُحدّث مع اكتمال المشاركات)"""
+    from models import Participation, User
+
+    board = _competition_leaderboards.get(competition_id)
+    if board is not None and time.time() - board.built_at <= config.LEADERBOARD_REBUILD_INTERVAL:
+        return board
+
+    rows = db.session.query(Participation.user_id, User.username, Participation.score).join(
+        User, User.id == Participation.user_id
+    ).filter(Participation.competition_id == competition_id).all()
+
+    with _competition_leaderboards_lock:
+        board = _competition_leaderboards.get(competition_id) or Leaderboard()
+        board.load(rows)
+        _competition_leaderboards[competition_id] = board
+    return board
+
+
+def fill_usernames(board, entries):
+    """
+    إكمال أسماء المستخدمين غير المعروفة في عناصر اللوحة
+    (المستخدمون الذين أضيفوا من تحديثات لا تحمل الاسم) باستعلام واحد
+    """
+    from models import User
+
+    missing = [entry.user_id for entry in entries if entry.username is None]
+    if not missing:
+        return entries
+
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(missing)).all())
+    for user_id, username in usernames.items():
+        board.set_username(user_id, username)
+    return [
+        entry._replace(username=usernames.get(entry.user_id)) if entry.username is None else entry
+        for entry in entries
+    ]
+
+
+def record_points_change(user_id, points, username=None, is_admin=False, session=None):
+    """
+    تسجيل تغيير رصيد مستخدم ليُطبق على لوحة الصدارة بعد نجاح commit
+    (يُستخدم مع التحديثات الجماعية التي لا تمر عبر كائنات ORM)
+    """
+    session = session or db.session()
+    session.info.setdefault(PENDING_CHANGES_KEY, []).append(('points', user_id, points, username, is_admin))
+
+
+def record_participation_score(competition_id, user_id, score, session=None):
+    """تسجيل تغيير نتيجة مشاركة ليُطبق على لوحة صدارة المسابقة بعد نجاح commit"""
+    session = session or db.session()
+    session.info.setdefault(PENDING_CHANGES_KEY, []).append(('competition', competition_id, user_id, score))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_leaderboard_changes(session, flush_context):
+    """التقاط تغييرات الرصيد والنتائج من كائنات ORM عند كل flush"""
+    from models import User, Participation
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if obj in session.new or state.attrs.points.history.has_changes():
+                values = state.dict
+                record_points_change(
+                    values.get('id'), values.get('points'), values.get('username'),
+                    bool(values.get('is_admin')), session=session
+                )
+        elif isinstance(obj, Participation):
+            state = inspect(obj)
+            if obj in session.new or state.attrs.score.history.has_changes():
+                values = state.dict
+                record_participation_score(
+                    values.get('competition_id'), values.get('user_id'), values.get('score'), session=session
+                )
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_leaderboard_changes(session):
+    """تطبيق التغييرات على لوحات الصدارة بعد نجاح commit فقط"""
+    changes = session.info.pop(PENDING_CHANGES_KEY, None)
+    if not changes:
+        return
+
+    for change in changes:
+        try:
+            if change[0] == 'points':
+                _, user_id, points, username, is_admin = change
+                if user_id is None or points is None:
+                    continue
+                if is_admin:
+                    points_leaderboard.remove(user_id)
+                elif points_leaderboard.built_at is not None:
+                    points_leaderboard.set(user_id, points, username)
+            else:
+                _, competition_id, user_id, score = change
+                board = _competition_leaderboards.get(competition_id)
+                if board is not None and user_id is not None:
+                    board.set(user_id, score or 0)
+        except Exception as e:
+            app.logger.error(f"خطأ في تحديث لوحة الصدارة: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_leaderboard_changes(session):
+    """تجاهل التغييرات المعلقة عند إلغاء المعاملة"""
+    session.info.pop(PENDING_CHANGES_KEY, None)
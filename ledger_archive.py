@@ -0,0 +1,354 @@
+"""
+أرشفة سجل معاملات النقاط حسب الشهر
+تُنقل معاملات الأشهر المغلقة (الأقدم من LEDGER_HOT_MONTHS) من جدول points_transaction إلى
+ملفات عمودية مضغوطة (gzip + JSON لكل عمود)، فيبقى الجدول الساخن مقتصرًا على الأشهر الأخيرة
+وتلمس استعلامات لوحة التحكم المعاملات الحديثة فقط.
+
+لا تُؤرشف إلا المعاملات التي غطتها نقطة تحقق التسوية (ledger_reconcile)، حتى لا تحتاج التسوية
+إلى قراءة الأرشيف. أنواع المعاملات التي يبحث عنها الكود لمنع التكرار (LEDGER_ARCHIVE_EXCLUDED_TYPES،
+مثل competition_reward في grading) تبقى في الجدول دائمًا.
+
+سجل المستخدم يقرأ معاملات الأشهر الساخنة من الجدول ثم يكمل بالأقدم منها: ملفات الأرشيف مدموجة
+مع ما بقي من تلك الأشهر في الجدول.
+"""
+
+import gzip
+import heapq
+import json
+import os
+import sys
+from datetime import date, datetime
+from functools import lru_cache
+from sqlalchemy import func
+from app import app, db
+from models import LedgerArchive, LedgerArchiveUser, LedgerCheckpoint, PointsTransaction, User
+from keyset_pagination import KeysetPage, keyset_paginate, get_cached_count
+import config
+
+# أعمدة المعاملة المحفوظة في ملفات الأرشيف
+ARCHIVE_COLUMNS = [
+    'id', 'user_id', 'amount', 'balance_after', 'transaction_type', 'related_id',
+    'description', 'ip_address', 'user_agent', 'created_by_id', 'created_at', 'treasury_shard_id',
+]
+
+# عدد المعرفات في كل عملية حذف من الجدول الساخن
+DELETE_BATCH_SIZE = 1000
+
+# بادئة مؤشرات الصفحات الواقعة داخل الأرشيف
+ARCHIVE_CURSOR_PREFIX = 'a'
+
+
+class ArchivedTransaction:
+    """معاملة مقروءة من الأرشيف بنفس الخصائص التي تستخدمها قوالب المعاملات"""
+
+    archived = True
+
+    def __init__(self, values, user=None, created_by=None):
+        for column in ARCHIVE_COLUMNS:
+            setattr(self, column, values.get(column))
+        if isinstance(self.created_at, str):
+            self.created_at = datetime.fromisoformat(self.created_at)
+        self.user = user
+        self.created_by = created_by
+
+
+def get_archive_dir():
+    """المسار المطلق لمجلد الأرشيف"""
+    if os.path.isabs(config.LEDGER_ARCHIVE_DIR):
+        return config.LEDGER_ARCHIVE_DIR
+    return os.path.join(app.root_path, config.LEDGER_ARCHIVE_DIR)
+
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _next_month(day):
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+def get_hot_cutoff(today=None):
+    """أول يوم في أقدم شهر يبقى في الجدول الساخن"""
+    cutoff = _month_start(today or datetime.utcnow().date())
+    for _ in range(config.LEDGER_HOT_MONTHS - 1):
+        cutoff = date(cutoff.year - 1, 12, 1) if cutoff.month == 1 else date(cutoff.year, cutoff.month - 1, 1)
+    return cutoff
+
+
+def _write_archive_file(relative_path, rows):
+    """كتابة صفوف الأرشيف كأعمدة في ملف gzip (كتابة ذرية عبر ملف مؤقت)"""
+    data = {column: [] for column in ARCHIVE_COLUMNS}
+    for row in rows:
+        for column in ARCHIVE_COLUMNS:
+            value = getattr(row, column)
+            data[column].append(value.isoformat() if isinstance(value, datetime) else value)
+
+    path = os.path.join(get_archive_dir(), relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + '.tmp'
+    with gzip.open(temporary_path, 'wt', encoding='utf-8') as archive_file:
+        json.dump({'version': 1, 'columns': ARCHIVE_COLUMNS, 'data': data}, archive_file, ensure_ascii=False)
+    os.replace(temporary_path, path)
+    return path
+
+
+@lru_cache(maxsize=16)
+def _load_archive_file(path):
+    """قراءة ملف أرشيف (الملفات لا تتغير بعد كتابتها، لذا تُخزن آخر الملفات المقروءة)"""
+    with gzip.open(os.path.join(get_archive_dir(), path), 'rt', encoding='utf-8') as archive_file:
+        return json.load(archive_file)
+
+
+def archive_month(period_start, chunk_size=None):
+    """
+    أرشفة معاملات شهر واحد على دفعات (ملف أرشيف لكل دفعة)
+
+    Returns:
+        int: عدد المعاملات المؤرشفة
+    """
+    chunk_size = chunk_size or config.LEDGER_ARCHIVE_CHUNK_SIZE
+    period_start = _month_start(period_start)
+    period_end = datetime.combine(_next_month(period_start), datetime.min.time())
+    period_begin = datetime.combine(period_start, datetime.min.time())
+
+    archived = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(PointsTransaction).join(
+            LedgerCheckpoint, LedgerCheckpoint.user_id == PointsTransaction.user_id
+        ).filter(
+            PointsTransaction.created_at >= period_begin,
+            PointsTransaction.created_at < period_end,
+            PointsTransaction.id <= LedgerCheckpoint.transaction_id,
+            PointsTransaction.id > last_id,
+            PointsTransaction.transaction_type.notin_(config.LEDGER_ARCHIVE_EXCLUDED_TYPES)
+        ).order_by(PointsTransaction.id).limit(chunk_size).all()
+
+        if not rows:
+            break
+
+        ids = [row.id for row in rows]
+        relative_path = os.path.join(
+            period_start.strftime('%Y-%m'), f'points_transaction_{ids[0]}_{ids[-1]}.json.gz'
+        )
+        path = _write_archive_file(relative_path, rows)
+
+        try:
+            user_counts = {}
+            for row in rows:
+                user_counts[row.user_id] = user_counts.get(row.user_id, 0) + 1
+
+            archive = LedgerArchive(
+                period_start=period_start,
+                path=relative_path,
+                row_count=len(rows),
+                min_transaction_id=ids[0],
+                max_transaction_id=ids[-1]
+            )
+            db.session.add(archive)
+            db.session.flush()
+            db.session.execute(db.insert(LedgerArchiveUser), [
+                {'archive_id': archive.id, 'user_id': user_id, 'row_count': count}
+                for user_id, count in user_counts.items()
+            ])
+
+            for row in rows:
+                db.session.expunge(row)
+            for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                db.session.execute(
+                    db.delete(PointsTransaction).where(PointsTransaction.id.in_(ids[start:start + DELETE_BATCH_SIZE]))
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            os.remove(path)
+            app.logger.error(f"خطأ في أرشفة معاملات {period_start.strftime('%Y-%m')}: {str(e)}")
+            raise
+
+        archived += len(ids)
+        last_id = ids[-1]
+        app.logger.info(f"تمت أرشفة {len(ids)} معاملة من {period_start.strftime('%Y-%m')} في {relative_path}")
+
+    return archived
+
+
+def archive_closed_months(today=None):
+    """
+    أرشفة جميع الأشهر الأقدم من نافذة الأشهر الساخنة
+
+    Returns:
+        dict: عدد المعاملات المؤرشفة لكل شهر
+    """
+    cutoff = get_hot_cutoff(today)
+    oldest = db.session.query(func.min(PointsTransaction.created_at)).filter(
+        PointsTransaction.created_at < datetime.combine(cutoff, datetime.min.time()),
+        PointsTransaction.transaction_type.notin_(config.LEDGER_ARCHIVE_EXCLUDED_TYPES)
+    ).scalar()
+
+    summary = {}
+    if oldest is None:
+        return summary
+
+    month = _month_start(oldest.date())
+    while month < cutoff:
+        archived = archive_month(month)
+        if archived:
+            summary[month.strftime('%Y-%m')] = archived
+        month = _next_month(month)
+    return summary
+
+
+def count_archived_transactions(user_id):
+    """عدد معاملات المستخدم المؤرشفة"""
+    return db.session.query(func.coalesce(func.sum(LedgerArchiveUser.row_count), 0)).filter(
+        LedgerArchiveUser.user_id == user_id
+    ).scalar()
+
+
+def get_archived_transactions(user, before_id=None, limit=20):
+    """
+    معاملات المستخدم المؤرشفة من الأحدث إلى الأقدم (الأقدم من before_id إن وُجد)
+    تُتخطى ملفات الأرشيف التي لا تحتوي على المستخدم أو تقع بالكامل بعد الموضع
+    """
+    archives_query = db.session.query(LedgerArchive.path).join(
+        LedgerArchiveUser, LedgerArchiveUser.archive_id == LedgerArchive.id
+    ).filter(LedgerArchiveUser.user_id == user.id)
+    if before_id:
+        archives_query = archives_query.filter(LedgerArchive.min_transaction_id < before_id)
+
+    items = []
+    for (path,) in archives_query.order_by(LedgerArchive.max_transaction_id.desc()):
+        if len(items) >= limit:
+            break
+
+        content = _load_archive_file(path)
+        data = content['data']
+        positions = [
+            index for index, (user_id, row_id) in enumerate(zip(data['user_id'], data['id']))
+            if user_id == user.id and (not before_id or row_id < before_id)
+        ]
+        for index in reversed(positions[-(limit - len(items)):]):
+            items.append({column: data[column][index] for column in content['columns']})
+
+    # تحميل منشئي المعاملات باستعلام واحد
+    creator_ids = {item['created_by_id'] for item in items if item.get('created_by_id')}
+    creators = {creator.id: creator for creator in User.query.filter(User.id.in_(creator_ids))} if creator_ids else {}
+    return [ArchivedTransaction(item, user=user, created_by=creators.get(item.get('created_by_id'))) for item in items]
+
+
+def _get_older_transactions(user, cutoff, before_id=None, limit=20):
+    """
+    معاملات المستخدم الأقدم من بداية الأشهر الساخنة من الأحدث إلى الأقدم (حسب المعرف):
+    المؤرشفة مدموجة مع ما بقي منها في الجدول (الأنواع المستثناة من الأرشفة وما لم تغطه التسوية بعد)
+    """
+    archived = get_archived_transactions(user, before_id, limit)
+    retained_query = PointsTransaction.query.filter(
+        PointsTransaction.user_id == user.id,
+        PointsTransaction.created_at < cutoff
+    )
+    if before_id:
+        retained_query = retained_query.filter(PointsTransaction.id < before_id)
+    retained = retained_query.order_by(PointsTransaction.id.desc()).limit(limit).all()
+    return list(heapq.merge(archived, retained, key=lambda transaction: transaction.id, reverse=True))[:limit]
+
+
+def iter_archived_transactions(user_id, since=None):
+    """
+    معاملات المستخدم المؤرشفة من الأقدم إلى الأحدث كقواميس (لتصدير السجل الكامل بالبث)
+    تُقرأ الملفات شهرًا بعد شهر، فلا يبقى في الذاكرة إلا معاملات المستخدم في شهر واحد
+
+    Args:
+        since (tuple): (created_at, id) لآخر معاملة تم تصديرها، تُتخطى المعاملات حتى هذا الموضع
+    """
+    archives = db.session.query(LedgerArchive.period_start, LedgerArchive.path).join(
+        LedgerArchiveUser, LedgerArchiveUser.archive_id == LedgerArchive.id
+    ).filter(LedgerArchiveUser.user_id == user_id).order_by(
+        LedgerArchive.period_start, LedgerArchive.min_transaction_id
+    ).all()
+
+    def month_rows(paths):
+        rows = []
+        for path in paths:
+            content = _load_archive_file(path)
+            data = content['data']
+            for index, row_user_id in enumerate(data['user_id']):
+                if row_user_id != user_id:
+                    continue
+                row = {column: data[column][index] for column in content['columns']}
+                row['created_at'] = datetime.fromisoformat(row['created_at'])
+                if since is None or (row['created_at'], row['id']) > since:
+                    rows.append(row)
+        rows.sort(key=lambda row: (row['created_at'], row['id']))
+        return rows
+
+    period, paths = None, []
+    for period_start, path in archives:
+        if period_start != period and paths:
+            yield from month_rows(paths)
+            paths = []
+        period = period_start
+        paths.append(path)
+    if paths:
+        yield from month_rows(paths)
+
+
+def _encode_archive_cursor(before_id):
+    return ARCHIVE_CURSOR_PREFIX + str(before_id)
+
+
+def _decode_archive_cursor(cursor):
+    """معرف المعاملة التي تبدأ الصفحة المؤرشفة قبلها (0 لبداية الأرشيف)، أو None إذا لم يكن مؤشر أرشيف"""
+    if not cursor or not cursor.startswith(ARCHIVE_CURSOR_PREFIX):
+        return None
+    try:
+        return int(cursor[len(ARCHIVE_CURSOR_PREFIX):])
+    except ValueError:
+        return None
+
+
+def get_user_transactions_page(user, per_page, after=None, before=None):
+    """
+    صفحة من سجل معاملات المستخدم بالمؤشرات: معاملات الأشهر الساخنة من الجدول أولاً ثم الأقدم منها
+    (المؤرشفة وما بقي في الجدول). عند انتهاء الأشهر الساخنة يتحول مؤشر الصفحة التالية إلى مؤشر داخل الأرشيف
+    """
+    hot_query = PointsTransaction.query.filter_by(user_id=user.id)
+    total = get_cached_count(('points_transaction_user', user.id), hot_query) + count_archived_transactions(user.id)
+    cutoff = datetime.combine(get_hot_cutoff(), datetime.min.time())
+
+    archive_before = _decode_archive_cursor(after)
+    if archive_before is not None:
+        # داخل الأرشيف: التنقل للأمام فقط (العودة إلى أول الصفحات من الرابط الأول)
+        archived = _get_older_transactions(user, cutoff, archive_before, per_page + 1)
+        items = archived[:per_page]
+        next_cursor = _encode_archive_cursor(items[-1].id) if len(archived) > per_page else None
+        return KeysetPage(items, per_page, next_cursor=next_cursor, total=total)
+
+    page = keyset_paginate(
+        hot_query.filter(PointsTransaction.created_at >= cutoff), PointsTransaction.created_at, PointsTransaction.id,
+        per_page, after=after, before=before
+    )
+    if page.has_next or before:
+        page.total = total
+        return page
+
+    # انتهت معاملات الأشهر الساخنة: إكمال الصفحة من الأرشيف
+    remaining = per_page - len(page.items)
+    archived = _get_older_transactions(user, cutoff, None, remaining + 1)
+    page.items.extend(archived[:remaining])
+    if len(archived) > remaining:
+        page.next_cursor = _encode_archive_cursor(page.items[-1].id if remaining else 0)
+    page.total = total
+    return page
+
+
+def main():
+    """تشغيل الأرشفة من سطر الأوامر (بعد تشغيل التسوية ledger_reconcile.py)"""
+    with app.app_context():
+        summary = archive_closed_months()
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+تسوية سجل معاملات النقاط
+يتحقق من أن balance_after يشكّل سلسلة متسقة لكل مستخدم (الرصيد السابق + المبلغ)
+وأن آخر رصيد في السلسلة يطابق User.points.
+
+معاملات المشرف المركزي المرتبطة بحساب خزينة فرعي (treasury_shard_id) تشكل سلسلة مستقلة لكل
+حساب فرعي (balance_after فيها رصيد الحساب الفرعي، انظر treasury) ويُطابق آخرها TreasuryShard.balance،
+وبقية معاملاته سلسلة عادية تطابق User.points.
+
+يمر على السجل مرة واحدة بترتيب (المستخدم، المعاملة) باستعلام واحد متدفق
+(مؤشر من جهة الخادم عبر yield_per) فتبقى الذاكرة ثابتة مهما كان حجم السجل،
+ويبدأ كل مستخدم من آخر نقطة تحقق له (LedgerCheckpoint) بدلاً من بداية سجله.
+"""
+
+import json
+import os
+import sys
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import and_, bindparam, func
+from app import app, db
+from models import LedgerCheckpoint, PointsTransaction, TreasuryShard, User
+
+# عدد الصفوف المجلوبة من المؤشر في كل دفعة
+STREAM_BATCH_SIZE = 1000
+
+# عدد نقاط التحقق التي تُكتب دفعة واحدة
+CHECKPOINT_BATCH_SIZE = 500
+
+# الحد الأقصى للفروقات المحفوظة في التقرير (البقية تُعدّ فقط وتُمرّر إلى on_discrepancy)
+MAX_REPORTED_DISCREPANCIES = 1000
+
+# أنواع الفروقات
+DISCREPANCY_CHAIN = 'chain'  # balance_after لا يساوي الرصيد السابق + المبلغ
+DISCREPANCY_BALANCE = 'balance'  # رصيد المستخدم لا يطابق آخر رصيد في السلسلة
+
+Discrepancy = namedtuple('Discrepancy', ['user_id', 'transaction_id', 'kind', 'expected', 'actual'])
+
+
+class ReconciliationReport:
+    """ملخص عملية التسوية"""
+
+    def __init__(self):
+        self.started_at = datetime.utcnow()
+        self.finished_at = None
+        self.users = 0
+        self.transactions = 0
+        self.checkpoints = 0
+        self.discrepancy_count = 0
+        self.discrepancies = []
+
+    def add(self, discrepancy):
+        self.discrepancy_count += 1
+        if len(self.discrepancies) < MAX_REPORTED_DISCREPANCIES:
+            self.discrepancies.append(discrepancy)
+
+    @property
+    def ok(self):
+        return self.discrepancy_count == 0
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'users': self.users,
+            'transactions': self.transactions,
+            'checkpoints': self.checkpoints,
+            'discrepancy_count': self.discrepancy_count,
+            'discrepancies': [d._asdict() for d in self.discrepancies],
+        }
+
+
+def _ledger_stream():
+    """
+    استعلام واحد يُرجع كل مستخدم مع معاملاته اللاحقة لنقطة التحقق، مرتبة حسب (المستخدم، المعاملة)
+    المستخدم بلا معاملات جديدة يظهر في صف واحد بقيم معاملة فارغة
+    """
+    return db.session.query(
+        User.id,
+        User.points,
+        LedgerCheckpoint.transaction_id,
+        LedgerCheckpoint.balance,
+        PointsTransaction.id,
+        PointsTransaction.amount,
+        PointsTransaction.balance_after,
+        PointsTransaction.treasury_shard_id
+    ).outerjoin(
+        LedgerCheckpoint, LedgerCheckpoint.user_id == User.id
+    ).outerjoin(
+        PointsTransaction, and_(
+            PointsTransaction.user_id == User.id,
+            PointsTransaction.id > func.coalesce(LedgerCheckpoint.transaction_id, 0)
+        )
+    ).order_by(User.id, PointsTransaction.id).execution_options(
+        yield_per=STREAM_BATCH_SIZE, stream_results=True
+    )
+
+
+def reconcile_ledger(write_checkpoints=True, on_discrepancy=None):
+    """
+    التحقق من سلاسل معاملات جميع المستخدمين وتحديث نقاط التحقق
+
+    Args:
+        write_checkpoints (bool): حفظ نقطة تحقق جديدة لكل مستخدم سليم تقدمت سلسلته
+        on_discrepancy (callable): تُستدعى لكل فرق فور اكتشافه (لكتابة التقرير تدفقيًا)
+
+    Returns:
+        ReconciliationReport: ملخص التسوية
+    """
+    report = ReconciliationReport()
+    checkpoint_inserts = []
+    checkpoint_updates = []
+
+    # أرصدة حسابات الخزينة الفرعية لمطابقة آخر معاملة في سلسلة كل منها
+    shard_balances = dict(db.session.query(TreasuryShard.id, TreasuryShard.balance))
+
+    def flush_checkpoints(force=False):
+        if checkpoint_inserts and (force or len(checkpoint_inserts) >= CHECKPOINT_BATCH_SIZE):
+            db.session.execute(db.insert(LedgerCheckpoint), checkpoint_inserts)
+            report.checkpoints += len(checkpoint_inserts)
+            checkpoint_inserts.clear()
+        if checkpoint_updates and (force or len(checkpoint_updates) >= CHECKPOINT_BATCH_SIZE):
+            db.session.execute(
+                LedgerCheckpoint.__table__.update().where(
+                    LedgerCheckpoint.__table__.c.user_id == bindparam('b_user_id')
+                ).values(
+                    transaction_id=bindparam('transaction_id'),
+                    balance=bindparam('balance'),
+                    verified_at=bindparam('verified_at')
+                ),
+                checkpoint_updates
+            )
+            report.checkpoints += len(checkpoint_updates)
+            checkpoint_updates.clear()
+
+    def record(discrepancy):
+        report.add(discrepancy)
+        if on_discrepancy:
+            on_discrepancy(discrepancy)
+
+    def finish_user(state, shard_states):
+        user_id, points, checkpoint_id, expected, last_id, clean = state
+        actual = points or 0
+        if expected != actual:
+            record(Discrepancy(user_id, last_id, DISCREPANCY_BALANCE, expected, actual))
+            clean = False
+
+        for shard_id, (shard_expected, shard_last_id) in shard_states.items():
+            shard_actual = shard_balances.get(shard_id) or 0
+            if shard_expected != shard_actual:
+                record(Discrepancy(user_id, shard_last_id, DISCREPANCY_BALANCE, shard_expected, shard_actual))
+                clean = False
+
+        if write_checkpoints and clean and last_id is not None and last_id != checkpoint_id:
+            now = datetime.utcnow()
+            if checkpoint_id is None:
+                checkpoint_inserts.append({
+                    'user_id': user_id, 'transaction_id': last_id, 'balance': expected, 'verified_at': now
+                })
+            else:
+                checkpoint_updates.append({
+                    'b_user_id': user_id, 'transaction_id': last_id, 'balance': expected, 'verified_at': now
+                })
+
+    try:
+        # state: [user_id, points, checkpoint_transaction_id, expected_balance, last_transaction_id, clean]
+        # shard_states: treasury_shard_id -> [expected_balance, last_transaction_id] لسلاسل الحسابات الفرعية
+        state = None
+        shard_states = {}
+        for (user_id, points, checkpoint_id, checkpoint_balance, transaction_id, amount, balance_after,
+             shard_id) in _ledger_stream():
+            if state is None or state[0] != user_id:
+                if state is not None:
+                    finish_user(state, shard_states)
+                    flush_checkpoints()
+                report.users += 1
+                state = [user_id, points, checkpoint_id, checkpoint_balance or 0, checkpoint_id, True]
+                shard_states = {}
+
+            if transaction_id is None:
+                continue
+
+            report.transactions += 1
+            if shard_id is None:
+                previous = state[3]
+            elif shard_id in shard_states:
+                previous = shard_states[shard_id][0]
+            else:
+                # تبدأ سلسلة الحساب الفرعي من الصفر، أو من أول معاملة بعد نقطة التحقق
+                previous = 0 if checkpoint_id is None else balance_after - (amount or 0)
+
+            expected = previous + (amount or 0)
+            if balance_after != expected:
+                record(Discrepancy(user_id, transaction_id, DISCREPANCY_CHAIN, expected, balance_after))
+                state[5] = False
+            # متابعة السلسلة من القيمة المسجلة حتى لا يتكرر الإبلاغ عن نفس الانقطاع
+            if shard_id is not None:
+                shard_states[shard_id] = [balance_after, transaction_id]
+            else:
+                state[3] = balance_after
+            state[4] = transaction_id
+
+        if state is not None:
+            finish_user(state, shard_states)
+        flush_checkpoints(force=True)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في تسوية سجل المعاملات: {str(e)}")
+        raise
+
+    report.finished_at = datetime.utcnow()
+    app.logger.info(
+        f"تمت تسوية سجل المعاملات: {report.users} مستخدم، {report.transactions} معاملة، "
+        f"{report.discrepancy_count} فرق، {report.checkpoints} نقطة تحقق"
+    )
+    return report
+
+
+def main(argv=None):
+    """
+    تشغيل التسوية من سطر الأوامر (مثلاً كمهمة ليلية):
+        python ledger_reconcile.py [مسار التقرير] [--no-checkpoints]
+    تُكتب الفروقات في التقرير سطرًا بسطر (JSON Lines) فور اكتشافها
+    """
+    args = list(sys.argv[1:] if argv is None else argv)
+    write_checkpoints = '--no-checkpoints' not in args
+    paths = [arg for arg in args if not arg.startswith('--')]
+    report_path = paths[0] if paths else os.path.join(
+        'logs', f"ledger_reconcile_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    )
+
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        def write_discrepancy(discrepancy):
+            report_file.write(json.dumps(discrepancy._asdict(), ensure_ascii=False) + '\n')
+
+        with app.app_context():
+            report = reconcile_ledger(write_checkpoints=write_checkpoints, on_discrepancy=write_discrepancy)
+
+    summary = report.to_dict()
+    summary.pop('discrepancies')
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if report.ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
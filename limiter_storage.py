@@ -0,0 +1,162 @@
+"""
+تخزين عدادات تقييد معدل الطلبات (Flask-Limiter) في ملف SQLite مشترك
+التخزين في الذاكرة (memory://) يعطي كل عامل Gunicorn عداداته الخاصة، فيتضاعف الحد الفعلي
+بعدد العمال ويُصفّر عند إعادة التحميل. هنا تُحفظ العدادات في ملف SQLite بوضع WAL تتشاركه
+جميع العمليات على نفس الخادم دون خدمة خارجية، وكل زيادة عبارة SQL ذرية واحدة.
+
+يُسجَّل المخطط sqlite:// لدى مكتبة limits عند استيراد هذه الوحدة:
+    sqlite:///instance/ratelimit.sqlite   (مسار نسبي)
+    sqlite:////var/run/app/ratelimit.sqlite   (مسار مطلق)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from math import floor
+from limits.storage import Storage, SlidingWindowCounterSupport
+from limits.storage.base import TimestampedSlidingWindow
+
+# عدد عمليات الزيادة بين كل حذف للعدادات المنتهية
+PURGE_EVERY = 1000
+
+
+class SQLiteLimiterStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    تخزين عدادات limits في SQLite (استراتيجيتا fixed-window و sliding-window-counter)
+    لكل خيط في كل عملية اتصاله الخاص، ويُعاد فتح الاتصال بعد fork
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, timeout=5, **options):
+        self.path = uri[len('sqlite:///'):] if uri.startswith('sqlite:///') else uri[len('sqlite://'):]
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        self._operations = 0
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS limiter_counters ('
+            'key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)'
+        )
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        """اتصال الخيط الحالي (يُفتح من جديد في العملية الابنة بعد fork)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _purge_expired(self, connection, now):
+        self._operations += 1
+        if self._operations % PURGE_EVERY == 0:
+            connection.execute('DELETE FROM limiter_counters WHERE expires_at <= ?', (now,))
+
+    def _incr(self, connection, key, expiry, amount, now):
+        return connection.execute(
+            'INSERT INTO limiter_counters (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET '
+            'value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END, '
+            'expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END '
+            'RETURNING value',
+            (key, amount, now + expiry, now, now)
+        ).fetchone()[0]
+
+    def _get(self, connection, key, now):
+        row = connection.execute(
+            'SELECT value FROM limiter_counters WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key, expiry, amount=1):
+        """زيادة العداد ذريًا (يبدأ من جديد إذا انتهت صلاحيته)"""
+        now = time.time()
+        connection = self._connection()
+        value = self._incr(connection, key, expiry, amount, now)
+        self._purge_expired(connection, now)
+        return value
+
+    def decr(self, key, amount=1):
+        row = self._connection().execute(
+            'UPDATE limiter_counters SET value = MAX(value - ?, 0) WHERE key = ? AND expires_at > ? RETURNING value',
+            (amount, key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key):
+        return self._get(self._connection(), key, time.time())
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connection().execute(
+            'SELECT expires_at FROM limiter_counters WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM limiter_counters WHERE key = ?', (key,))
+
+    def reset(self):
+        return self._connection().execute('DELETE FROM limiter_counters').rowcount
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _sliding_window_info(self, connection, key, expiry, now):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._get(connection, previous_key, now)
+        current_count = self._get(connection, current_key, now)
+        previous_ttl = 0.0 if previous_count == 0 else (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        """
+        حجز طلب في النافذة المنزلقة إذا لم يتجاوز العدد الموزون الحد
+        القراءة والزيادة في معاملة واحدة (BEGIN IMMEDIATE) فلا يتجاوز العمال المتزامنون الحد
+        """
+        if amount > limit:
+            return False
+
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            previous_count, previous_ttl, current_count, _ = self._sliding_window_info(connection, key, expiry, now)
+            weighted_count = previous_count * previous_ttl / expiry + current_count
+            if floor(weighted_count) + amount > limit:
+                connection.execute('COMMIT')
+                return False
+
+            _, current_key = self.sliding_window_keys(key, expiry, now)
+            self._incr(connection, current_key, 2 * expiry, amount, now)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        self._purge_expired(connection, now)
+        return True
+
+    def get_sliding_window(self, key, expiry):
+        return self._sliding_window_info(self._connection(), key, expiry, time.time())
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self._connection().execute(
+            'DELETE FROM limiter_counters WHERE key IN (?, ?)', (previous_key, current_key)
+        )
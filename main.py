@@ -5,6 +5,9 @@ import time
 from app import app  # noqa: F401
 import api_routes  # noqa: F401
 import routes  # noqa: F401
+from treasury import start_treasury_rebalancer
+from api_usage_buffer import start_api_usage_flusher
+from leaderboard import start_leaderboard_refresher
 
 # إعداد السجلات
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +28,23 @@ def start_keep_alive():
     keep_alive_thread.start()
     logger.info("Keep-alive thread started")
 
+def start_background_workers():
+    """
+    بدء الخيوط الخلفية للتطبيق في العملية الحالية
+    يُستدعى عند استيراد main (في كل عامل gunicorn عند تشغيل main:app) ومن خطاف post_fork
+    عند تحميل التطبيق مسبقًا في العملية الرئيسية، ولا يبدأ كل خيط أكثر من مرة لكل عملية
+    """
+    # إعادة توزيع رصيد خزينة المشرف دوريًا على الحسابات الفرعية
+    start_treasury_rebalancer()
+
+    # كتابة بيانات استخدام API المؤجلة دفعة واحدة في الخلفية
+    start_api_usage_flusher()
+
+    # بناء لوحة الصدارة العامة عند بدء العامل وإعادة بنائها دوريًا في الخلفية
+    start_leaderboard_refresher()
+
+start_background_workers()
+
 if __name__ == "__main__":
     # استخدام المنفذ 8080 (المطلوب في Replit) أو المنفذ المحدد في المتغيرات البيئية
     port = int(os.environ.get("PORT", 8080))
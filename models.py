@@ -2,6 +2,7 @@ from app import db, app
 from flask_login import UserMixin
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+import json
 import secrets
 import string
 import uuid
@@ -23,6 +24,15 @@ class PointsPackage(db.Model):
 
 class PointsTransaction(db.Model):
     """سجل جميع عمليات تعديل رصيد الكربتو"""
+    __table_args__ = (
+        # سلسلة معاملات كل مستخدم بترتيب الإدخال (للتسوية والقراءة حسب المستخدم)
+        db.Index('ix_points_transaction_user_id_id', 'user_id', 'id'),
+        # ترقيم قوائم لوحة التحكم بالمؤشرات على (created_at, id) مع كل مرشح، ونطاقات الأشهر عند الأرشفة
+        db.Index('ix_points_transaction_created_at_id', 'created_at', 'id'),
+        db.Index('ix_points_transaction_user_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_points_transaction_type_created_at_id', 'transaction_type', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Integer, nullable=False)  # مقدار النقاط (موجب للإضافة، سالب للخصم)
@@ -33,6 +43,8 @@ class PointsTransaction(db.Model):
     ip_address = db.Column(db.String(45), nullable=True)  # عنوان IP
     user_agent = db.Column(db.String(255), nullable=True)  # معلومات المتصفح
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # من قام بإنشاء العملية (المستخدم نفسه أو المشرف)
+    # حساب الخزينة الفرعي لمعاملات المشرف المركزي عبر الخزينة (balance_after عندها رصيد الحساب الفرعي)
+    treasury_shard_id = db.Column(db.Integer, db.ForeignKey('treasury_shard.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
@@ -43,8 +55,132 @@ class PointsTransaction(db.Model):
         return f'<PointsTransaction {self.id}: {self.amount} for user {self.user_id}>'
 
 
+class LedgerCheckpoint(db.Model):
+    """
+    نقطة تحقق لسلسلة معاملات المستخدم: آخر معاملة تم التحقق منها ورصيدها
+    تبدأ التسوية التالية من هذه النقطة بدلاً من إعادة فحص سجل المستخدم بالكامل
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    transaction_id = db.Column(db.Integer, nullable=False)  # آخر معاملة تم التحقق منها
+    balance = db.Column(db.Integer, nullable=False)  # الرصيد بعد تلك المعاملة
+    verified_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('ledger_checkpoint', uselist=False, cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<LedgerCheckpoint user {self.user_id}: {self.balance} at transaction {self.transaction_id}>'
+
+
+class LedgerArchive(db.Model):
+    """
+    ملف أرشيف مضغوط لمعاملات نقاط شهر مغلق
+    تُنقل المعاملات القديمة (التي تم التحقق منها) من جدول المعاملات إلى ملفات عمودية مضغوطة
+    حتى يبقى الجدول الساخن صغيرًا، مع بقاء سجل المستخدم قابلًا للقراءة عبر الأرشيف
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    period_start = db.Column(db.Date, nullable=False, index=True)  # أول يوم في الشهر المؤرشف
+    path = db.Column(db.String(255), nullable=False)  # مسار الملف داخل مجلد الأرشيف
+    row_count = db.Column(db.Integer, nullable=False)
+    min_transaction_id = db.Column(db.Integer, nullable=False)
+    max_transaction_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    users = db.relationship('LedgerArchiveUser', backref='archive', lazy='dynamic', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<LedgerArchive {self.period_start}: {self.row_count} rows>'
+
+
+class LedgerArchiveUser(db.Model):
+    """فهرس المستخدمين في كل ملف أرشيف (لقراءة سجل مستخدم دون فتح جميع الملفات)"""
+    __table_args__ = (
+        db.UniqueConstraint('archive_id', 'user_id', name='uq_ledger_archive_user'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    archive_id = db.Column(db.Integer, db.ForeignKey('ledger_archive.id'), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    row_count = db.Column(db.Integer, nullable=False)
+
+
+class PointsRollup(db.Model):
+    """
+    تجميع مادي لنقاط كل مستخدم في كل فترة زمنية (يوم/أسبوع/شهر)
+    يُحدّث تدريجيًا مع كل معاملة نقاط، لتكون لوحات الصدارة الدورية قراءة مفهرسة
+    بدلاً من جمع سجل المعاملات بالكامل
+    """
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period_type', 'period_start', name='uq_points_rollup_user_period'),
+        db.Index('ix_points_rollup_period_earned', 'period_type', 'period_start', 'points_earned'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    period_type = db.Column(db.String(10), nullable=False)  # day / week / month
+    period_start = db.Column(db.Date, nullable=False)  # بداية الفترة (اليوم، الاثنين، أول الشهر)
+    points_earned = db.Column(db.Integer, default=0, nullable=False)  # مجموع النقاط المكتسبة (المعاملات الموجبة)
+    net_points = db.Column(db.Integer, default=0, nullable=False)  # صافي تغيير الرصيد في الفترة
+    transactions_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('points_rollups', lazy='dynamic', cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<PointsRollup {self.period_type} {self.period_start}: {self.points_earned} for user {self.user_id}>'
+
+
+class TreasuryShard(db.Model):
+    """
+    حساب ضمان فرعي لخزينة المشرف المركزي
+    تُحجز النقاط من حساب المشرف على دفعات في عدة حسابات فرعية، وتُصرف منها منح الترحيب
+    والإحالة، حتى لا تتسلسل جميع عمليات التسجيل على قفل صف المشرف الواحد
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    shard_index = db.Column(db.Integer, unique=True, nullable=False)
+    balance = db.Column(db.Integer, default=0, nullable=False)  # النقاط المحجوزة في هذا الحساب الفرعي
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TreasuryShard {self.shard_index}: {self.balance}>'
+
+
+class PointsAdjustmentBatch(db.Model):
+    """دفعة تعديل جماعي للأرصدة من قبل المشرف (مثل توزيع جوائز مسابقة) مع نتيجة كل سطر"""
+    id = db.Column(db.Integer, primary_key=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # applied / rejected
+    row_count = db.Column(db.Integer, default=0)
+    users_count = db.Column(db.Integer, default=0)
+    total_added = db.Column(db.Integer, default=0)
+    total_deducted = db.Column(db.Integer, default=0)
+    results = db.Column(db.Text, nullable=True)  # نتائج الأسطر بتنسيق JSON
+    ip_address = db.Column(db.String(45), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    created_by = db.relationship('User', foreign_keys=[created_by_id])
+
+    def get_results(self):
+        """نتائج الأسطر كقائمة"""
+        import json
+        try:
+            return json.loads(self.results) if self.results else []
+        except (ValueError, TypeError):
+            return []
+
+    def __repr__(self):
+        return f'<PointsAdjustmentBatch {self.id}: {self.status} {self.row_count} rows>'
+
+
 class PurchaseRecord(db.Model):
     """سجل عمليات شراء الكربتو"""
+    __table_args__ = (
+        # ترقيم قوائم لوحة التحكم بالمؤشرات على (created_at, id) مع كل مرشح
+        db.Index('ix_purchase_record_created_at_id', 'created_at', 'id'),
+        db.Index('ix_purchase_record_user_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_purchase_record_method_created_at_id', 'payment_method', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount_paid = db.Column(db.Float, nullable=False)  # المبلغ المدفوع بالدولار
@@ -132,25 +268,28 @@ class User(UserMixin, db.Model):
             return False
             
         try:
-            # إذا كان الطلب لخصم النقاط من حساب المشرف المركزي
+            # إذا كان الطلب لخصم النقاط من حساب المشرف المركزي (عبر خزينته المجزأة)
             if from_admin and not self.is_admin:
-                # الحصول على حساب المشرف
-                admin = User.query.filter_by(is_admin=True).first()
-                if not admin:
+                from treasury import get_central_admin_id, withdraw_from_treasury
+
+                admin_id = get_central_admin_id()
+                if not admin_id:
                     app.logger.error("لا يوجد حساب مشرف مركزي لخصم النقاط منه")
                     return False
                 
-                # التحقق من وجود نقاط كافية في حساب المشرف
-                if admin.points < points_to_add:
-                    app.logger.error(f"لا توجد نقاط كافية في حساب المشرف. المتوفر: {admin.points}, المطلوب: {points_to_add}")
+                # خصم النقاط من الخزينة (يفشل إذا لم تكن النقاط كافية)
+                withdrawal = withdraw_from_treasury(admin_id, points_to_add)
+                if withdrawal is None:
+                    app.logger.error(f"لا توجد نقاط كافية في حساب المشرف. المطلوب: {points_to_add}")
                     return False
+                shard_id, admin_balance = withdrawal
                 
-                # خصم النقاط من حساب المشرف
-                admin.points -= points_to_add
+                # مرتبطة بالحساب الفرعي الذي صُرفت منه المنحة (balance_after رصيده بعد الخصم)
                 admin_transaction = PointsTransaction(
-                    user_id=admin.id,
+                    user_id=admin_id,
+                    treasury_shard_id=shard_id,
                     amount=-points_to_add,
-                    balance_after=admin.points,
+                    balance_after=admin_balance,
                     transaction_type=f"admin_deduction_{transaction_type}",
                     related_id=related_id,
                     description=f"خصم {points_to_add} كربتو من حساب المشرف لـ {description}",
@@ -163,19 +302,15 @@ class User(UserMixin, db.Model):
                 
                 db.session.add(admin_transaction)
             
-            # تسجيل حالة النقاط قبل التعديل
-            previous_points = self.points
-            app.logger.info(f"Previous points: {previous_points}")
-            
-            # إضافة النقاط للمستخدم
-            self.points += points_to_add
-            app.logger.info(f"New points: {self.points}")
+            # إضافة النقاط للمستخدم داخل قاعدة البيانات
+            new_balance = User.increment_points(self.id, points_to_add)
+            app.logger.info(f"New points: {new_balance}")
             
             # إنشاء سجل العملية
             transaction = PointsTransaction(
                 user_id=self.id,
                 amount=points_to_add,
-                balance_after=self.points,
+                balance_after=new_balance,
                 transaction_type=transaction_type,
                 related_id=related_id,
                 description=description,
@@ -222,17 +357,16 @@ class User(UserMixin, db.Model):
         if not from_user or not to_user:
             return False
             
-        # التحقق من وجود نقاط كافية
-        if from_user.points < points:
-            return False
-            
         try:
-            # خصم النقاط من المرسل
-            from_user.points -= points
+            # خصم النقاط من المرسل (يفشل التحديث إذا لم تكن النقاط كافية)
+            from_balance = cls.increment_points(from_user.id, -points, require_funds=True)
+            if from_balance is None:
+                return False
+            
             from_transaction = PointsTransaction(
                 user_id=from_user.id,
                 amount=-points,
-                balance_after=from_user.points,
+                balance_after=from_balance,
                 transaction_type=f"transfer_out_{transaction_type}",
                 related_id=to_user.id,
                 description=description or f"تحويل {points} كربتو إلى {to_user.username}",
@@ -240,11 +374,11 @@ class User(UserMixin, db.Model):
             )
             
             # إضافة النقاط للمستقبل
-            to_user.points += points
+            to_balance = cls.increment_points(to_user.id, points)
             to_transaction = PointsTransaction(
                 user_id=to_user.id,
                 amount=points,
-                balance_after=to_user.points,
+                balance_after=to_balance,
                 transaction_type=f"transfer_in_{transaction_type}",
                 related_id=from_user.id,
                 description=description or f"استلام {points} كربتو من {from_user.username}",
@@ -267,6 +401,45 @@ class User(UserMixin, db.Model):
             app.logger.error(f"خطأ في تحويل النقاط: {str(e)}")
             return False
     
+    @classmethod
+    def increment_points(cls, user_id, amount, require_funds=False):
+        """
+        تعديل رصيد المستخدم ذريًا داخل قاعدة البيانات (points = points + amount)
+        بدلاً من قراءة الرصيد وتعديله في Python، حتى لا تضيع التحديثات المتزامنة.
+        لا تنفذ commit؛ يجب على المستدعي تنفيذه ضمن معاملته.
+        
+        Args:
+            user_id (int): معرف المستخدم
+            amount (int): مقدار التعديل (سالب للخصم)
+            require_funds (bool): عند الخصم، لا يُنفذ التحديث إلا إذا كان الرصيد كافيًا
+                                  (WHERE points >= المقدار)
+            
+        Returns:
+            int: الرصيد بعد التعديل، أو None إذا لم يُحدَّث أي صف
+                 (المستخدم غير موجود أو الرصيد غير كافٍ)
+        """
+        from sqlalchemy.orm.attributes import set_committed_value
+        from leaderboard import record_points_change
+
+        statement = db.update(cls).where(cls.id == user_id)
+        if require_funds and amount < 0:
+            statement = statement.where(cls.points >= -amount)
+        row = db.session.execute(
+            statement.values(points=cls.points + amount)
+            .returning(cls.points, cls.username, cls.is_admin)
+            .execution_options(synchronize_session=False)
+        ).one_or_none()
+        if row is None:
+            return None
+
+        points, username, is_admin = row
+        # مزامنة الكائن المحمّل في الجلسة (إن وُجد) مع الرصيد الجديد دون اعتباره تعديلًا معلقًا
+        loaded_user = db.session.identity_map.get(db.inspect(cls).identity_key_from_primary_key((user_id,)))
+        if loaded_user is not None:
+            set_committed_value(loaded_user, 'points', points)
+        record_points_change(user_id, points, username, is_admin)
+        return points
+    
     def get_client_ip(self, request):
         """
         الحصول على عنوان IP الحقيقي للعميل بشكل آمن
@@ -295,18 +468,20 @@ class User(UserMixin, db.Model):
             created_by_id (int): معرف المستخدم الذي أنشأ العملية (المستخدم نفسه أو المشرف)
             request (Flask.request): كائن الطلب للحصول على معلومات مثل IP و User-Agent
         """
-        if points <= 0 or self.points < points:
+        if points <= 0:
             return False
             
         try:
-            # خصم النقاط من المستخدم
-            self.points -= points
+            # خصم النقاط من المستخدم (يفشل التحديث إذا لم تكن النقاط كافية)
+            new_balance = User.increment_points(self.id, -points, require_funds=True)
+            if new_balance is None:
+                return False
             
             # إنشاء سجل العملية
             transaction = PointsTransaction(
                 user_id=self.id,
                 amount=-points,  # قيمة سالبة للخصم
-                balance_after=self.points,
+                balance_after=new_balance,
                 transaction_type=transaction_type,
                 related_id=related_id,
                 description=description,
@@ -451,6 +626,7 @@ class Competition(db.Model):
     allow_multiple_attempts = db.Column(db.Boolean, default=False)  # السماح بعدة محاولات
     penalty_for_wrong_answers = db.Column(db.Integer, default=0)  # عقوبة الإجابات الخاطئة
     bonus_points = db.Column(db.Integer, default=0)  # نقاط إضافية للإجابة على جميع الأسئلة بشكل صحيح
+    answer_key_version = db.Column(db.Integer, default=1)  # إصدار مفتاح الإجابات (يزداد عند تعديل الأسئلة)
     
     # Relationships
     participations = db.relationship('Participation', backref='competition', lazy='dynamic')
@@ -552,98 +728,14 @@ class Question(db.Model):
     def check_answer(self, user_answer):
         """التحقق من صحة إجابة المستخدم وحساب النقاط
         
+        يستخدم نفس منطق مفتاح الإجابات المُجمّع (answer_key) لضمان تطابق التصحيح.
+        للتصحيح المتكرر استخدم get_answer_key بدلاً من هذه الدالة.
+        
         Returns:
             tuple: (صحيح/خطأ, النقاط المكتسبة, نص الإجابة الصحيحة)
         """
-        is_correct = False
-        points_earned = 0
-        correct_text = ""
-        
-        # للخيارات المتعددة
-        if self.question_type in ['multiple_choice', 'image_choice']:
-            # تحويل الإجابة إلى رقم إذا كانت مخزنة كنص
-            try:
-                user_index = int(user_answer)
-            except (ValueError, TypeError):
-                user_index = -1
-                
-            # تحويل الإجابة الصحيحة إلى رقم إذا كانت مخزنة كنص
-            try:
-                correct_index = int(self.correct_answer)
-            except (ValueError, TypeError):
-                correct_index = -1
-                
-            is_correct = user_index == correct_index
-            
-            # الحصول على نص الإجابة الصحيحة
-            options = self.options_list
-            if 0 <= correct_index < len(options):
-                correct_text = options[correct_index]
-                
-        # للإجابة بصح/خطأ
-        elif self.question_type == 'true_false':
-            is_correct = str(user_answer).lower() == str(self.correct_answer).lower()
-            correct_text = "صواب" if self.correct_answer.lower() == "true" else "خطأ"
-            
-        # للإجابة النصية البسيطة
-        elif self.question_type in ['text', 'short_answer']:
-            # يمكن تحسينها لاحقًا لدعم المطابقة التقريبية أو أن تكون غير حساسة لحالة الأحرف
-            normalized_user_answer = str(user_answer).strip().lower()
-            normalized_correct_answer = str(self.correct_answer).strip().lower()
-            
-            # المطابقة الدقيقة للإجابة النصية
-            is_correct = normalized_user_answer == normalized_correct_answer
-            correct_text = self.correct_answer
-            
-        # للإجابات المتعددة
-        elif self.question_type == 'multiple_answers':
-            import json
-            # نتوقع أن تكون إجابة المستخدم قائمة مفصولة بفواصل أو قائمة فعلية
-            if isinstance(user_answer, str):
-                try:
-                    user_selections = set(json.loads(user_answer))
-                except:
-                    user_selections = set(user_answer.split(','))
-            else:
-                user_selections = set(user_answer)
-                
-            # الإجابة الصحيحة مخزنة كقائمة JSON
-            try:
-                correct_selections = set(json.loads(self.correct_answer))
-            except:
-                correct_selections = set(self.correct_answer.split(','))
-                
-            # حساب درجة التطابق
-            if len(correct_selections) > 0:
-                # إذا تم تمكين الائتمان الجزئي، نحسب نسبة الإجابات الصحيحة
-                if self.partial_credit_enabled:
-                    correct_matches = len(user_selections.intersection(correct_selections))
-                    total_expected = len(correct_selections)
-                    partial_score = correct_matches / total_expected
-                    
-                    # الإجابة صحيحة إذا كانت نسبة التطابق 100٪
-                    is_correct = partial_score == 1.0
-                    
-                    # حساب النقاط الجزئية
-                    points_earned = self.points * partial_score
-                else:
-                    # بدون ائتمان جزئي، الإجابة صحيحة فقط إذا كانت جميع الخيارات مطابقة
-                    is_correct = user_selections == correct_selections
-            else:
-                is_correct = False
-                
-            # تحويل الإجابات الصحيحة إلى نص
-            correct_text = ", ".join([self.options_list[int(i)] for i in correct_selections if i.isdigit() and int(i) < len(self.options_list)])
-        
-        # حساب النقاط النهائية
-        if is_correct:
-            points_earned = self.points
-        elif points_earned == 0 and self.partial_credit_enabled:
-            # يمكن منح نقاط جزئية للإجابات القريبة من الصحيحة حسب نوع السؤال
-            # تحتاج إلى تنفيذ خاص لكل نوع
-            pass
-            
-        return (is_correct, points_earned, correct_text)
+        from answer_key import CompiledQuestion
+        return CompiledQuestion(self).check(user_answer)
 
 
 class Reward(db.Model):
@@ -655,10 +747,38 @@ class Reward(db.Model):
     is_available = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # تصفح قائمة المكافآت المتاحة في API بالمؤشرات على (created_at, id)
+        db.Index('ix_reward_available_created_at_id', 'is_available', 'created_at', 'id'),
+    )
+    
     # Relationships
     redemptions = db.relationship('RewardRedemption', backref='reward', lazy='dynamic')
 
 
+# مفتاح إعداد إصدار كتالوج المكافآت (يُستخدم في ETag لقائمة المكافآت في API)
+REWARD_CATALOG_VERSION_KEY = 'reward_catalog_version'
+
+
+def bump_reward_catalog_version(mapper, connection, target):
+    """تحديث إصدار كتالوج المكافآت ضمن نفس المعاملة عند أي تغيير في مكافأة"""
+    table = SystemConfig.__table__
+    version = datetime.utcnow().isoformat()
+    updated = connection.execute(
+        table.update().where(table.c.key == REWARD_CATALOG_VERSION_KEY).values(value=version, updated_at=datetime.utcnow())
+    ).rowcount
+    if not updated:
+        connection.execute(table.insert().values(
+            key=REWARD_CATALOG_VERSION_KEY, value=version,
+            description='إصدار كتالوج المكافآت', updated_at=datetime.utcnow()
+        ))
+    SystemConfig.bump_version(connection)
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    db.event.listen(Reward, _event_name, bump_reward_catalog_version)
+
+
 class Participation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -675,6 +795,7 @@ class Participation(db.Model):
     bonus_points = db.Column(db.Integer, default=0)  # نقاط إضافية
     penalties = db.Column(db.Integer, default=0)  # عقوبات
     time_bonus = db.Column(db.Integer, default=0)  # نقاط إضافية للوقت
+    submission_key = db.Column(db.String(64), nullable=True)  # مفتاح آخر تقديم تمت معالجته (لمنع معالجة التقديم المكرر)
     
     @property
     def total_points(self):
@@ -703,6 +824,69 @@ class Participation(db.Model):
             return "غير مكتمل"
 
 
+class ParticipationAnswer(db.Model):
+    """نتيجة مُصحّحة لإجابة واحدة في مشاركة، تُكتب مرة واحدة عند تقديم الإجابات"""
+    __table_args__ = (
+        # مفتاح الإجابة الطبيعي؛ بادئته (competition_id, question_id) تخدم استعلامات التحليل المجمّعة
+        db.UniqueConstraint('competition_id', 'question_id', 'user_id', name='uq_participation_answer_question_user'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    participation_id = db.Column(db.Integer, db.ForeignKey('participation.id'), nullable=False, index=True)
+    competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    position = db.Column(db.Integer, default=0)  # ترتيب السؤال في مفتاح الإجابات وقت التصحيح
+    answer = db.Column(db.Text, nullable=True)  # الإجابة الخام كما أرسلها المستخدم (فارغة إذا لم يجب)
+    is_correct = db.Column(db.Boolean, default=False)
+    points_earned = db.Column(db.Float, default=0)  # قد تكون كسرية عند تفعيل الدرجات الجزئية
+    user_answer_text = db.Column(db.Text, nullable=True)  # نص إجابة المستخدم للعرض
+    correct_answer_text = db.Column(db.Text, nullable=True)  # نص الإجابة الصحيحة وقت التصحيح
+    time_spent = db.Column(db.Integer, nullable=True)  # الوقت المستغرق للإجابة على السؤال (بالثواني)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # العلاقات
+    participation = db.relationship('Participation', backref=db.backref(
+        'answer_results', lazy='dynamic', cascade='all, delete-orphan'
+    ))
+    question = db.relationship('Question')
+
+
+class GradingJob(db.Model):
+    """
+    طابور التصحيح في قاعدة البيانات: تصحيح تقديم واحد (وضع التصحيح في الخلفية)
+    أو إعادة تصحيح مسابقة كاملة بعد تعديل مفتاح الإجابات
+    """
+    __table_args__ = (
+        db.Index('ix_grading_job_status_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(20), nullable=False, default='submission', server_default='submission')  # submission, regrade
+    participation_id = db.Column(db.Integer, db.ForeignKey('participation.id'), nullable=True, index=True)  # فارغ لمهام إعادة التصحيح
+    competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # صاحب التقديم أو المشرف الذي طلب إعادة التصحيح
+    answers_data = db.Column(db.Text, nullable=False)  # الإجابات الخام كـ JSON: {"answers": {...}, "times": {...}}
+    elapsed_time = db.Column(db.Integer, default=0)  # الوقت المستغرق لإكمال المسابقة (بالثواني)
+    submission_key = db.Column(db.String(64), nullable=True)  # مفتاح التقديم المرتبط بالمهمة
+    status = db.Column(db.String(20), default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, default=0)  # عدد محاولات التصحيح
+    error = db.Column(db.String(255), nullable=True)  # آخر خطأ أثناء التصحيح
+    ip_address = db.Column(db.String(45), nullable=True)
+    user_agent = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # العلاقات
+    participation = db.relationship('Participation', backref=db.backref('grading_jobs', lazy='dynamic'))
+
+    @property
+    def is_pending(self):
+        """هل المهمة ما زالت بانتظار التصحيح أو قيد التصحيح"""
+        return self.status in ('pending', 'processing')
+
+
 class RewardRedemption(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -775,6 +959,11 @@ class Referral(db.Model):
     verified_at = db.Column(db.DateTime, nullable=True)  # وقت التحقق
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # تصفح إحالات المستخدم في API بالمؤشرات على (created_at, id)
+        db.Index('ix_referral_referrer_created_at_id', 'referrer_id', 'created_at', 'id'),
+    )
+    
     # علاقات قاعدة البيانات
     referrer = db.relationship('User', foreign_keys=[referrer_id], backref='referrals_made')
     referred = db.relationship('User', foreign_keys=[referred_id], backref='referral_source')
@@ -815,6 +1004,10 @@ class AdminNotification(db.Model):
         return f'<AdminNotification {self.id}: {self.title[:20]}... ({self.notification_type})>'
 
 
+# مفتاح صف إصدار الإعدادات (عدد صحيح يزداد مع كل تغيير، تتحقق منه الذاكرة المؤقتة في config_cache)
+CONFIG_VERSION_KEY = 'config_version'
+
+
 class SystemConfig(db.Model):
     """نموذج لتخزين إعدادات النظام في قاعدة البيانات بدلاً من الملف"""
     id = db.Column(db.Integer, primary_key=True)
@@ -827,12 +1020,51 @@ class SystemConfig(db.Model):
         return f'<SystemConfig {self.key}={self.value}>'
     
     @classmethod
-    def get(cls, key, default=None):
-        """الحصول على قيمة إعداد معين مع إعداد افتراضي"""
-        config = cls.query.filter_by(key=key).first()
-        if config:
-            return config.value
-        return default
+    def get(cls, key, default=None, fresh=False):
+        """
+        الحصول على قيمة إعداد معين مع إعداد افتراضي
+        تُقرأ القيمة من نسخة الإعدادات المحملة في ذاكرة العملية (config_cache) دون استعلام،
+        و fresh=True يتحقق من إصدار الإعدادات أولاً (لقيم كتبتها عملية أخرى للتو)
+        """
+        from config_cache import get_config_value, invalidate_config_cache
+        if fresh:
+            invalidate_config_cache()
+        return get_config_value(key, default)
+    
+    @classmethod
+    def get_int(cls, key, default=None):
+        """قيمة الإعداد كعدد صحيح (default إذا لم يوجد أو لم يكن رقمًا)"""
+        try:
+            return int(cls.get(key))
+        except (TypeError, ValueError):
+            return default
+    
+    @classmethod
+    def get_bool(cls, key, default=False):
+        """قيمة الإعداد كقيمة منطقية (true / 1 / yes / on)"""
+        value = cls.get(key)
+        if value is None:
+            return default
+        return str(value).strip().lower() in ('true', '1', 'yes', 'on')
+    
+    @classmethod
+    def get_list(cls, key, default=None, separator=','):
+        """قيمة الإعداد كقائمة نصوص مفصولة بفاصلة (بدون العناصر الفارغة)"""
+        value = cls.get(key)
+        if not value:
+            return default
+        return [item.strip() for item in value.split(separator) if item.strip()]
+    
+    @classmethod
+    def get_json(cls, key, default=None):
+        """قيمة الإعداد بعد فك ترميز JSON (default إذا لم توجد أو كانت غير صالحة)"""
+        value = cls.get(key)
+        if value is None:
+            return default
+        try:
+            return json.loads(value)
+        except (TypeError, ValueError):
+            return default
     
     @classmethod
     def set(cls, key, value, description=None):
@@ -845,8 +1077,46 @@ class SystemConfig(db.Model):
         else:
             config = cls(key=key, value=value, description=description)
             db.session.add(config)
+        cls.bump_version()
         db.session.commit()
         return config
+    
+    @classmethod
+    def bump_version(cls, connection=None):
+        """
+        زيادة إصدار الإعدادات ذريًا ضمن المعاملة الحالية (أو على الاتصال المحدد داخل أحداث المخطط)
+        حتى تعيد العمليات الأخرى تحميل إعداداتها المخزنة
+        """
+        table = cls.__table__
+        execute = connection.execute if connection is not None else db.session.execute
+        updated = execute(
+            table.update().where(table.c.key == CONFIG_VERSION_KEY).values(
+                value=db.cast(db.func.coalesce(db.cast(table.c.value, db.Integer), 0) + 1, db.Text),
+                updated_at=datetime.utcnow()
+            )
+        ).rowcount
+        if not updated:
+            execute(table.insert().values(
+                key=CONFIG_VERSION_KEY, value='1', description='إصدار إعدادات النظام', updated_at=datetime.utcnow()
+            ))
+        # تُفرغ ذاكرة هذه العملية بعد الالتزام (انظر _invalidate_config_after_commit)
+        db.session.info['config_changed'] = True
+
+
+def _invalidate_config_after_commit(session):
+    """إعادة التحقق من إصدار الإعدادات في هذه العملية بعد الالتزام بمعاملة غيّرت الإعدادات"""
+    if session.info.pop('config_changed', False):
+        from config_cache import invalidate_config_cache
+        invalidate_config_cache()
+
+
+def _discard_config_change(session, previous_transaction):
+    """تجاهل علامة التغيير عند التراجع عن المعاملة"""
+    session.info.pop('config_changed', None)
+
+
+db.event.listen(db.session, 'after_commit', _invalidate_config_after_commit)
+db.event.listen(db.session, 'after_soft_rollback', _discard_config_change)
 
 
 class APIKey(db.Model):
@@ -937,6 +1207,10 @@ class APIKey(db.Model):
         self.revocation_reason = reason
         db.session.commit()
         
+        # حذف المفتاح من ذاكرة المفاتيح التي تم التحقق منها
+        from api_key_cache import invalidate_api_key
+        invalidate_api_key(self.id)
+        
         # تسجيل عملية الإلغاء
         app.logger.info(f"تم إلغاء مفتاح API (ID: {self.id}) للمستخدم {self.user_id}. السبب: {reason}")
         return True
@@ -982,9 +1256,15 @@ class APIUsageLog(db.Model):
     def log_request(cls, api_key_id, user_id, endpoint, method, status_code, ip_address,
                    user_agent=None, is_automated=False, response_time_ms=None,
                    request_size=None, response_size=None):
-        """تسجيل طلب API"""
+        """
+        تسجيل طلب API
+        لا يُكتب الصف مباشرة؛ يُضاف إلى ذاكرة الكتابة المؤجلة (api_usage_buffer)
+        ويُدرج مع الطلبات الأخرى دفعة واحدة
+        """
+        from api_usage_buffer import record_api_usage
+
         try:
-            log = cls(
+            record_api_usage(
                 api_key_id=api_key_id,
                 user_id=user_id,
                 endpoint=endpoint,
@@ -997,10 +1277,7 @@ class APIUsageLog(db.Model):
                 request_size=request_size,
                 response_size=response_size
             )
-            db.session.add(log)
-            db.session.commit()
-            return log
+            return True
         except Exception as e:
             app.logger.error(f"خطأ في تسجيل طلب API: {str(e)}")
-            db.session.rollback()
             return None
@@ -0,0 +1,184 @@
+"""
+تجميعات النقاط الدورية (يومي/أسبوعي/شهري) للوحات الصدارة الدورية
+كل معاملة نقاط تُضاف إلى صف التجميع الخاص بالمستخدم في كل فترة ضمن نفس المعاملة
+(upsert)، فتصبح قراءة ترتيب الفترة استعلامًا مفهرسًا على جدول points_rollup
+بدلاً من SUM على سجل المعاملات بالكامل.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app import db
+from models import PointsRollup, PointsTransaction, User
+from leaderboard import LeaderboardEntry
+
+# الفترات المدعومة وأسماؤها المعروضة
+PERIOD_TYPES = {
+    'day': 'اليوم',
+    'week': 'هذا الأسبوع',
+    'month': 'هذا الشهر',
+}
+
+# أسماء بديلة مقبولة في معامل ?period=
+PERIOD_ALIASES = {
+    'daily': 'day',
+    'weekly': 'week',
+    'monthly': 'month',
+}
+
+
+def normalize_period(period):
+    """تحويل قيمة معامل الفترة إلى أحد أنواع PERIOD_TYPES أو None"""
+    if not period:
+        return None
+    period = PERIOD_ALIASES.get(period.lower(), period.lower())
+    return period if period in PERIOD_TYPES else None
+
+
+def get_period_start(period_type, moment=None):
+    """بداية الفترة التي يقع فيها الوقت المحدد (بتوقيت UTC)"""
+    day = (moment or datetime.utcnow()).date()
+    if period_type == 'day':
+        return day
+    if period_type == 'week':
+        return day - timedelta(days=day.weekday())
+    if period_type == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"نوع فترة غير معروف: {period_type}")
+
+
+def _rollup_values(transactions):
+    """تجميع المعاملات في صفوف (مستخدم، فترة) قبل كتابتها"""
+    totals = {}
+    for transaction in transactions:
+        user_id = transaction['user_id']
+        amount = transaction['amount'] or 0
+        created_at = transaction.get('created_at') or datetime.utcnow()
+        for period_type in PERIOD_TYPES:
+            key = (user_id, period_type, get_period_start(period_type, created_at))
+            row = totals.setdefault(key, [0, 0, 0])
+            if amount > 0:
+                row[0] += amount
+            row[1] += amount
+            row[2] += 1
+
+    now = datetime.utcnow()
+    return [
+        {
+            'user_id': user_id,
+            'period_type': period_type,
+            'period_start': period_start,
+            'points_earned': earned,
+            'net_points': net,
+            'transactions_count': count,
+            'updated_at': now,
+        }
+        for (user_id, period_type, period_start), (earned, net, count) in totals.items()
+    ]
+
+
+def _upsert_rollups(connection, values):
+    """إضافة القيم إلى صفوف التجميع الموجودة أو إنشاؤها (INSERT ... ON CONFLICT DO UPDATE)"""
+    table = PointsRollup.__table__
+    dialect = connection.dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'period_type', 'period_start'],
+            set_={
+                'points_earned': table.c.points_earned + statement.excluded.points_earned,
+                'net_points': table.c.net_points + statement.excluded.net_points,
+                'transactions_count': table.c.transactions_count + statement.excluded.transactions_count,
+                'updated_at': statement.excluded.updated_at,
+            }
+        )
+        connection.execute(statement, values)
+        return
+
+    # قواعد بيانات أخرى: تحديث ثم إدراج عند عدم وجود الصف
+    for row in values:
+        result = connection.execute(
+            table.update().where(
+                table.c.user_id == row['user_id'],
+                table.c.period_type == row['period_type'],
+                table.c.period_start == row['period_start']
+            ).values(
+                points_earned=table.c.points_earned + row['points_earned'],
+                net_points=table.c.net_points + row['net_points'],
+                transactions_count=table.c.transactions_count + row['transactions_count'],
+                updated_at=row['updated_at']
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), [row])
+
+
+def record_transactions_rollup(transactions, session=None):
+    """
+    تحديث تجميعات الفترات لمجموعة معاملات نقاط ضمن المعاملة الحالية
+    (يُستدعى تلقائيًا لمعاملات ORM، ويدويًا بعد الإدراج الجماعي عبر db.insert)
+
+    Args:
+        transactions (list): قواميس تحتوي على user_id و amount و created_at
+    """
+    values = _rollup_values(transactions)
+    if values:
+        session = session or db.session()
+        _upsert_rollups(session.connection(), values)
+
+
+@event.listens_for(Session, 'after_flush')
+def _rollup_new_transactions(session, flush_context):
+    """تجميع معاملات النقاط الجديدة في نفس المعاملة التي كُتبت فيها"""
+    transactions = [
+        {'user_id': obj.user_id, 'amount': obj.amount, 'created_at': obj.created_at}
+        for obj in session.new
+        if isinstance(obj, PointsTransaction)
+    ]
+    if transactions:
+        record_transactions_rollup(transactions, session=session)
+
+
+def get_period_leaderboard(period_type, limit=50, moment=None):
+    """أفضل المستخدمين في الفترة الحالية حسب النقاط المكتسبة (المشرفون مستبعدون)"""
+    period_start = get_period_start(period_type, moment)
+    rows = db.session.query(
+        PointsRollup.user_id, User.username, PointsRollup.points_earned
+    ).join(User, User.id == PointsRollup.user_id).filter(
+        PointsRollup.period_type == period_type,
+        PointsRollup.period_start == period_start,
+        PointsRollup.points_earned > 0,
+        User.is_admin == False
+    ).order_by(PointsRollup.points_earned.desc(), PointsRollup.user_id).limit(limit).all()
+
+    return [
+        LeaderboardEntry(position, user_id, username, points)
+        for position, (user_id, username, points) in enumerate(rows, start=1)
+    ]
+
+
+def get_period_rank(period_type, user_id, moment=None):
+    """ترتيب المستخدم في الفترة الحالية، أو None إذا لم يكتسب نقاطًا فيها"""
+    period_start = get_period_start(period_type, moment)
+    earned = db.session.query(PointsRollup.points_earned).filter_by(
+        user_id=user_id, period_type=period_type, period_start=period_start
+    ).scalar()
+    if not earned or earned <= 0:
+        return None
+
+    ahead = db.session.query(func.count(PointsRollup.id)).join(
+        User, User.id == PointsRollup.user_id
+    ).filter(
+        PointsRollup.period_type == period_type,
+        PointsRollup.period_start == period_start,
+        User.is_admin == False,
+        (PointsRollup.points_earned > earned) |
+        ((PointsRollup.points_earned == earned) & (PointsRollup.user_id < user_id))
+    ).scalar()
+    return ahead + 1
@@ -0,0 +1,271 @@
+"""
+محرك إعادة التصحيح الجماعي للمسابقات
+يُستخدم بعد تعديل مفتاح الإجابات لإعادة حساب نتائج جميع المشاركات دفعة واحدة:
+- يُصحّح كل إجابة مميزة مرة واحدة فقط لكل سؤال ثم يُحدّث جميع صفوفها بتحديث جماعي
+- تُجمّع النتائج لكل مشاركة داخل قاعدة البيانات (GROUP BY)
+- تُكتب الدرجات الجديدة وتعديلات الأرصدة ومعاملات النقاط بعمليات جماعية في معاملة واحدة
+"""
+
+from datetime import datetime
+from sqlalchemy import func, case, and_, bindparam
+from app import app, db
+from models import Participation, ParticipationAnswer, PointsTransaction, User
+from answer_key import get_answer_key
+from audit_log import log_audit_event
+from leaderboard import record_points_change, record_participation_score
+from points_rollup import record_transactions_rollup
+
+# نوع معاملة النقاط لفروقات إعادة التصحيح
+REGRADE_TRANSACTION_TYPE = 'competition_regrade'
+
+
+def _credited_points(score, bonus_points, time_bonus, penalties):
+    """النقاط التي أُضيفت لرصيد المستخدم عند التقديم (لا تُضاف النقاط السالبة)"""
+    total = (score or 0) + (bonus_points or 0) + (time_bonus or 0) - (penalties or 0)
+    return total if total > 0 else 0
+
+
+def _regrade_answer_rows(answer_key):
+    """
+    إعادة تصحيح صفوف الإجابات المخزنة لكل سؤال في مفتاح الإجابات
+    تُصحّح كل إجابة مميزة مرة واحدة ثم يُحدّث جميع الصفوف المطابقة بتحديث جماعي
+
+    Returns:
+        int: عدد الإجابات المميزة التي أُعيد تصحيحها
+    """
+    answers_table = ParticipationAnswer.__table__
+    update_graded = answers_table.update().where(and_(
+        answers_table.c.question_id == bindparam('b_question_id'),
+        answers_table.c.answer == bindparam('b_answer')
+    )).values(
+        is_correct=bindparam('b_is_correct'),
+        points_earned=bindparam('b_points_earned'),
+        correct_answer_text=bindparam('b_correct_answer_text')
+    )
+
+    graded_answers = 0
+    for question_id in answer_key.question_ids:
+        compiled_question = answer_key.get(question_id)
+
+        # تحديث نص الإجابة الصحيحة لجميع صفوف السؤال (بما فيها غير المجاب عليها)
+        db.session.execute(
+            answers_table.update().where(
+                answers_table.c.question_id == question_id
+            ).values(correct_answer_text=compiled_question.correct_text)
+        )
+
+        distinct_answers = db.session.query(ParticipationAnswer.answer).filter(
+            ParticipationAnswer.question_id == question_id,
+            ParticipationAnswer.answer.isnot(None)
+        ).distinct().all()
+
+        params = []
+        for (answer,) in distinct_answers:
+            is_correct, points_earned, correct_text = compiled_question.check(answer)
+            params.append({
+                'b_question_id': question_id,
+                'b_answer': answer,
+                'b_is_correct': is_correct,
+                'b_points_earned': points_earned,
+                'b_correct_answer_text': correct_text,
+            })
+
+        if params:
+            db.session.execute(update_graded, params)
+            graded_answers += len(params)
+
+    return graded_answers
+
+
+def _participation_totals(competition, answer_key):
+    """
+    تجميع نتائج كل مشاركة من صفوف الإجابات المُصحّحة داخل قاعدة البيانات
+
+    Returns:
+        dict: participation_id -> (عدد الصحيحة, مجموع النقاط, عدد الخاطئة المجاب عليها)
+    """
+    if not answer_key.question_ids:
+        return {}
+
+    rows = db.session.query(
+        ParticipationAnswer.participation_id,
+        func.sum(case((ParticipationAnswer.is_correct == True, 1), else_=0)),
+        func.sum(case((ParticipationAnswer.is_correct == True, ParticipationAnswer.points_earned), else_=0)),
+        func.sum(case((and_(
+            ParticipationAnswer.is_correct == False,
+            ParticipationAnswer.answer.isnot(None)
+        ), 1), else_=0))
+    ).filter(
+        ParticipationAnswer.competition_id == competition.id,
+        ParticipationAnswer.question_id.in_(answer_key.question_ids)
+    ).group_by(
+        ParticipationAnswer.participation_id
+    ).all()
+
+    return {
+        participation_id: (int(correct or 0), float(score or 0), int(wrong or 0))
+        for participation_id, correct, score, wrong in rows
+    }
+
+
+def regrade_competition(competition, admin_user=None, ip_address=None):
+    """
+    إعادة تصحيح جميع المشاركات المكتملة في المسابقة وفق مفتاح الإجابات الحالي
+    وتسوية أرصدة المستخدمين بفروقات النقاط
+
+    يجب استدعاؤها بعد حفظ تعديلات الأسئلة (commit) حتى يُجمَّع المفتاح الجديد.
+    تُنفّذ جميع التحديثات في معاملة واحدة وتُلغى بالكامل عند حدوث خطأ.
+
+    Args:
+        competition: كائن المسابقة
+        admin_user: المشرف الذي طلب إعادة التصحيح (اختياري)
+        ip_address: عنوان IP للطلب (اختياري)
+
+    Returns:
+        dict: ملخص إعادة التصحيح
+    """
+    summary = {
+        'participations': 0,
+        'changed': 0,
+        'legacy_skipped': 0,
+        'adjusted_users': 0,
+        'points_delta': 0,
+    }
+
+    try:
+        answer_key = get_answer_key(competition)
+        total_questions = answer_key.total_questions
+
+        _regrade_answer_rows(answer_key)
+        totals = _participation_totals(competition, answer_key)
+
+        participations = db.session.query(
+            Participation.id,
+            Participation.user_id,
+            Participation.score,
+            Participation.correct_answers,
+            Participation.bonus_points,
+            Participation.time_bonus,
+            Participation.penalties,
+            Participation.completion_time
+        ).filter(
+            Participation.competition_id == competition.id,
+            Participation.completed == True
+        ).all()
+
+        penalty_per_wrong = competition.penalty_for_wrong_answers or 0
+        competition_bonus = competition.bonus_points or 0
+
+        participation_updates = []
+        user_deltas = {}
+        for participation in participations:
+            summary['participations'] += 1
+
+            if participation.id not in totals:
+                # مشاركة قديمة لم تُنقل إلى جدول الإجابات المُصحّحة (update_participation_answers.py)
+                summary['legacy_skipped'] += 1
+                continue
+
+            correct_answers, total_score, wrong_answers = totals[participation.id]
+            total_score = int(total_score)
+
+            # نفس قواعد حساب النتيجة المستخدمة في submit_answers
+            penalties = wrong_answers * penalty_per_wrong if penalty_per_wrong > 0 else 0
+            bonus_points = competition_bonus if competition_bonus > 0 and correct_answers == total_questions else 0
+            time_bonus = 0
+            if competition.has_time_limit and participation.completion_time:
+                time_remaining_ratio = 1 - (participation.completion_time / competition.time_limit)
+                if time_remaining_ratio > 0.5:
+                    time_bonus = int(total_score * 0.2)
+
+            new_values = (total_score, correct_answers, bonus_points, time_bonus, penalties)
+            old_values = (
+                participation.score, participation.correct_answers, participation.bonus_points,
+                participation.time_bonus, participation.penalties
+            )
+            if new_values == old_values:
+                continue
+
+            summary['changed'] += 1
+            record_participation_score(competition.id, participation.user_id, total_score)
+            participation_updates.append({
+                'id': participation.id,
+                'score': total_score,
+                'correct_answers': correct_answers,
+                'bonus_points': bonus_points,
+                'time_bonus': time_bonus,
+                'penalties': penalties,
+            })
+
+            delta = _credited_points(total_score, bonus_points, time_bonus, penalties) - _credited_points(
+                participation.score, participation.bonus_points, participation.time_bonus, participation.penalties
+            )
+            if delta:
+                user_deltas[participation.user_id] = user_deltas.get(participation.user_id, 0) + delta
+
+        if participation_updates:
+            db.session.execute(db.update(Participation), participation_updates)
+
+        # تسوية أرصدة المستخدمين (المشرفون لا يحصلون على نقاط المسابقات)
+        if user_deltas:
+            users = db.session.query(User.id, User.points).filter(
+                User.id.in_(list(user_deltas.keys())),
+                User.is_admin == False
+            ).with_for_update().all()
+
+            now = datetime.utcnow()
+            balance_updates = []
+            transactions = []
+            for user_id, points in users:
+                points = points or 0
+                # لا ينخفض الرصيد عن الصفر عند سحب نقاط أُضيفت سابقًا
+                new_balance = max(points + user_deltas[user_id], 0)
+                amount = new_balance - points
+                if amount == 0:
+                    continue
+
+                balance_updates.append({'id': user_id, 'points': new_balance})
+                record_points_change(user_id, new_balance)
+                transactions.append({
+                    'user_id': user_id,
+                    'amount': amount,
+                    'balance_after': new_balance,
+                    'transaction_type': REGRADE_TRANSACTION_TYPE,
+                    'related_id': competition.id,
+                    'description': f'تعديل نقاط بعد إعادة تصحيح مسابقة: {competition.title}'[:255],
+                    'ip_address': ip_address,
+                    'created_by_id': admin_user.id if admin_user else None,
+                    'created_at': now,
+                })
+                summary['points_delta'] += amount
+
+            if balance_updates:
+                db.session.execute(db.update(User), balance_updates)
+                db.session.execute(db.insert(PointsTransaction), transactions)
+                record_transactions_rollup(transactions)
+            summary['adjusted_users'] = len(balance_updates)
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في إعادة تصحيح المسابقة #{competition.id}: {str(e)}")
+        raise
+
+    app.logger.info(
+        f"تمت إعادة تصحيح المسابقة #{competition.id}: {summary['changed']} مشاركة معدلة من {summary['participations']}، "
+        f"{summary['adjusted_users']} رصيد معدل (الفرق {summary['points_delta']})، {summary['legacy_skipped']} مشاركة قديمة متجاهلة"
+    )
+
+    log_audit_event(
+        event_type='MANAGEMENT_ACTION',
+        severity='WARNING' if summary['points_delta'] else 'INFO',
+        details=(
+            f"إعادة تصحيح المسابقة: {competition.title} - {summary['changed']} مشاركة معدلة، "
+            f"{summary['adjusted_users']} مستخدم تم تعديل رصيده (إجمالي الفرق {summary['points_delta']})"
+        ),
+        user_id=admin_user.id if admin_user else None,
+        username=admin_user.username if admin_user else None,
+        ip_address=ip_address
+    )
+
+    return summary
@@ -1,17 +1,33 @@
-from flask import render_template, redirect, url_for, flash, request, abort, jsonify, session
+from flask import render_template, redirect, url_for, flash, request, abort, jsonify, session, Response
 from flask_login import login_user, logout_user, login_required, current_user
 from sqlalchemy import desc, func, or_
 from functools import wraps
 from app import app, db, limiter
-from models import User, Competition, Reward, Participation, RewardRedemption, ChatRoom, ChatRoomMember, Message, PointsPackage, Referral, ReferralIPLog, AdminNotification, APIKey, Question, PointsTransaction
+from models import User, Competition, Reward, Participation, RewardRedemption, ChatRoom, ChatRoomMember, Message, PointsPackage, Referral, ReferralIPLog, AdminNotification, APIKey, Question, PointsTransaction, ParticipationAnswer
 import config
+import uuid
 import referral_security
 from audit_log import log_audit_event, monitor_login_attempts, log_sensitive_action, EVENT_TYPES, SEVERITY_LEVELS
+from answer_key import get_answer_key, invalidate_answer_key, CompiledQuestion
+from answer_analytics import get_competition_analytics
+from leaderboard import get_points_leaderboard, get_competition_leaderboard, fill_usernames
+from treasury import get_central_admin_id
+from ledger_archive import get_user_transactions_page
+from keyset_pagination import keyset_paginate
+from streaming_export import EXPORT_MIMETYPES, iter_keyset_rows, stream_export
+from points_rollup import PERIOD_TYPES, normalize_period, get_period_leaderboard, get_period_rank
+from api_key_cache import invalidate_api_key
+from config_cache import get_setting
+from bulk_points import BulkPointsError, parse_csv_rows, parse_json_rows, apply_bulk_adjustments, results_to_csv
+from grading import (
+    grade_submission, enqueue_submission, extract_submission, get_pending_job, is_grading_queue_enabled,
+    enqueue_regrade, get_pending_regrade, start_grading_queue_drain
+)
 from forms import (
     LoginForm, RegistrationForm, CompetitionForm, RewardForm,
     ParticipationForm, RedeemRewardForm, RedemptionStatusForm,
     CreateChatRoomForm, SendMessageForm, DirectMessageForm,
-    PointsPackageForm, AdminPointsForm, QuestionForm
+    PointsPackageForm, AdminPointsForm, BulkPointsForm, QuestionForm
 )
 from datetime import datetime
 
@@ -50,7 +66,8 @@ def index():
             Reward.points_required
         ).limit(4).all()
         
-        top_users = User.query.order_by(User.points.desc()).limit(5).all()
+        board = get_points_leaderboard()
+        top_users = fill_usernames(board, board.top(5))
     except Exception as e:
         app.logger.error(f"Error loading index page: {str(e)}")
         # Return a simplified version if database queries fail
@@ -138,21 +155,18 @@ def register():
         # منح المكافأة الترحيبية للمستخدم الجديد من حساب المشرف المركزي
         welcome_bonus = config.REFERRAL_WELCOME_BONUS
         if welcome_bonus > 0:
-            # الحصول على المشرف المركزي
-            admin = User.query.filter_by(is_admin=True).first()
-            
-            if admin and admin.points >= welcome_bonus:
-                # إضافة النقاط من حساب المشرف المركزي
-                success = user.add_points(
-                    points=welcome_bonus,
-                    transaction_type='welcome_bonus',
-                    description=f'مكافأة ترحيبية للمستخدم الجديد - {welcome_bonus} كربتو',
-                    created_by_id=admin.id,
-                    request=request,
-                    from_admin=True
-                )
-                if success:
-                    flash(f'تهانينا! لقد حصلت على {welcome_bonus} كربتو كمكافأة ترحيبية', 'success')
+            # الحصول على المشرف المركزي (كفاية الرصيد يتحقق منها الخصم الذري من الخزينة في add_points)
+            admin_id = get_central_admin_id()
+            success = admin_id is not None and user.add_points(
+                points=welcome_bonus,
+                transaction_type='welcome_bonus',
+                description=f'مكافأة ترحيبية للمستخدم الجديد - {welcome_bonus} كربتو',
+                created_by_id=admin_id,
+                request=request,
+                from_admin=True
+            )
+            if success:
+                flash(f'تهانينا! لقد حصلت على {welcome_bonus} كربتو كمكافأة ترحيبية', 'success')
             else:
                 # في حالة عدم وجود حساب مشرف أو عدم وجود نقاط كافية، نسجل هذا في السجلات
                 app.logger.warning(f"لم تتم إضافة المكافأة الترحيبية ({welcome_bonus} كربتو) للمستخدم {user.username} - لا توجد نقاط كافية في حساب المشرف")
@@ -303,6 +317,7 @@ def deactivate_api_key(key_id):
     # إلغاء تنشيط المفتاح
     api_key.is_active = False
     db.session.commit()
+    invalidate_api_key(api_key.id)
     
     # تسجيل الحدث
     log_audit_event(
@@ -492,9 +507,8 @@ def competition_details(competition_id):
                 flash('أنت مشارك بالفعل في هذه المسابقة', 'info')
         
         # Get top participants
-        top_participants = Participation.query.filter_by(
-            competition_id=competition.id
-        ).order_by(desc(Participation.score)).limit(10).all()
+        competition_board = get_competition_leaderboard(competition.id)
+        top_participants = fill_usernames(competition_board, competition_board.top(10))
         
         # Get competition questions
         questions = []
@@ -511,6 +525,7 @@ def competition_details(competition_id):
             form=form,
             questions=questions,
             top_participants=top_participants,
+            submission_key=uuid.uuid4().hex,  # مفتاح فريد لكل عرض لنموذج الإجابات لمنع التقديم المكرر
             now=now  # Pass current date to template
         )
     except Exception as e:
@@ -522,44 +537,46 @@ def competition_details(competition_id):
 @app.route('/competitions/<int:competition_id>/submit-answers', methods=['POST'])
 @login_required
 def submit_answers(competition_id):
-    """معالجة تقديم إجابات المسابقة وإضافة النقاط"""
+    """معالجة تقديم إجابات المسابقة وإضافة النقاط (فوريًا أو عبر طابور التصحيح)"""
     app.logger.info(f"=== بداية معالجة إجابات المسابقة #{competition_id} للمستخدم {current_user.username} ===")
     
     # متغيرات للتتبع
     competition = None
     participation = None
-    total_score = 0
-    correct_answers = 0
-    total_questions = 0
-    bonus_points = 0
-    time_bonus = 0
-    penalties = 0
     time_expired = 'time_expired' in request.form
     elapsed_time = int(request.form.get('elapsed_time', 0))
     
-    # ستخزن نتائج الإجابات لعرضها في صفحة النتائج
-    results = []
+    # مفتاح التقديم الذي تولده صفحة المسابقة؛ يتشاركه الإرسال اليدوي والإرسال التلقائي عند انتهاء الوقت
+    submission_key = (request.form.get('submission_key') or '').strip()[:64] or None
     
     try:
         # التحقق من وجود المسابقة
         competition = Competition.query.get_or_404(competition_id)
         app.logger.info(f"تم العثور على المسابقة: {competition.title}")
         
-        # التحقق من أن المستخدم مشارك بالفعل في المسابقة
+        # التحقق من أن المستخدم مشارك بالفعل في المسابقة مع قفل سجل المشاركة حتى نهاية المعاملة
+        # (أي تقديم متزامن آخر لنفس المشاركة ينتظر هنا ثم يرى نتيجة التقديم الأول)
         participation = Participation.query.filter_by(
             user_id=current_user.id,
             competition_id=competition.id
-        ).first_or_404()
+        ).with_for_update().first_or_404()
         app.logger.info(f"المستخدم مشارك بالفعل في المسابقة")
         
+        # التقديم المكرر (نقرة مزدوجة، أو إرسال تلقائي بالتزامن مع إرسال يدوي، أو تقديم ما زال في الطابور)
+        # لا يُعالج مرة أخرى
+        duplicate_submission = submission_key is not None and participation.submission_key == submission_key
+        if (duplicate_submission
+                or (participation.completed and not competition.allow_multiple_attempts)
+                or get_pending_job(participation.id) is not None):
+            db.session.rollback()
+            app.logger.info(f"تم تجاهل تقديم مكرر للمسابقة #{competition.id} من المستخدم {current_user.username}")
+            flash('تم استلام إجاباتك لهذه المسابقة بالفعل', 'info')
+            return redirect(url_for('competition_results', competition_id=competition.id))
+        
         # تحديث عدد المحاولات ووقت آخر محاولة
         participation.attempts += 1
         participation.last_attempt_at = datetime.utcnow()
         
-        # حفظ وقت إكمال المسابقة (بالثواني)
-        if elapsed_time > 0:
-            participation.completion_time = elapsed_time
-        
         # التحقق من أن المسابقة لا تزال نشطة
         now = datetime.utcnow()
         if not competition.is_active:
@@ -572,196 +589,34 @@ def submit_answers(competition_id):
             flash('لقد انتهت هذه المسابقة ولا يمكن تقديم إجابات', 'warning')
             return redirect(url_for('competition_details', competition_id=competition.id))
         
-        # الحصول على جميع أسئلة المسابقة
-        questions = competition.get_questions()
-        app.logger.info(f"عدد الأسئلة في المسابقة: {len(questions)}")
-        total_questions = len(questions)
-        
-        # إنشاء قاموس لتخزين إجابات المستخدم
-        user_answers = {}
-        
-        # التحقق من كل إجابة
-        for question in questions:
-            answer_key = f'answer_{question.id}'
-            result_entry = {
-                'question': question,
-                'is_correct': False,
-                'points_earned': 0,
-                'user_answer': None,
-                'user_answer_text': 'لم تتم الإجابة',
-                'correct_answer_text': '',
-            }
-            
-            if answer_key in request.form:
-                user_answer = request.form[answer_key]
-                user_answers[str(question.id)] = user_answer
-                result_entry['user_answer'] = user_answer
-                app.logger.debug(f"إجابة المستخدم على السؤال {question.id}: {user_answer}")
-                
-                # استخدام طريقة check_answer من كائن السؤال
-                is_correct, points_earned, correct_text = question.check_answer(user_answer)
-                
-                if is_correct:
-                    correct_answers += 1
-                    total_score += points_earned
-                    result_entry['is_correct'] = True
-                    result_entry['points_earned'] = points_earned
-                    app.logger.debug(f"إجابة صحيحة! +{points_earned} نقاط")
-                else:
-                    # تطبيق العقوبة إذا كانت مفعلة
-                    if hasattr(competition, 'penalty_for_wrong_answers') and competition.penalty_for_wrong_answers > 0:
-                        penalty = competition.penalty_for_wrong_answers
-                        penalties += penalty
-                        app.logger.debug(f"عقوبة للإجابة الخاطئة: -{penalty} نقطة")
-                    
-                    app.logger.debug(f"إجابة خاطئة. الإجابة الصحيحة: '{correct_text}'")
-                
-                # تحديث نص الإجابة للعرض في صفحة النتائج
-                if question.question_type in ['multiple_choice', 'image_choice']:
-                    try:
-                        option_index = int(user_answer)
-                        options = question.options_list
-                        if 0 <= option_index < len(options):
-                            result_entry['user_answer_text'] = options[option_index]
-                    except (ValueError, TypeError, IndexError):
-                        result_entry['user_answer_text'] = user_answer
-                elif question.question_type == 'true_false':
-                    result_entry['user_answer_text'] = 'صواب' if user_answer.lower() == 'true' else 'خطأ'
-                else:
-                    result_entry['user_answer_text'] = user_answer
-                
-                result_entry['correct_answer_text'] = correct_text
-            else:
-                app.logger.debug(f"لم يتم العثور على إجابة للسؤال {question.id}")
-            
-            # إضافة نتيجة هذا السؤال إلى قائمة النتائج
-            results.append(result_entry)
-        
-        # حساب المكافآت الإضافية
-        
-        # مكافأة الإجابة على جميع الأسئلة بشكل صحيح
-        if hasattr(competition, 'bonus_points') and correct_answers == total_questions and competition.bonus_points > 0:
-            bonus_points = competition.bonus_points
-            app.logger.info(f"مكافأة الإجابة على جميع الأسئلة بشكل صحيح: +{bonus_points} نقطة")
-        
-        # حساب مكافأة الوقت (إذا أكمل المسابقة بسرعة)
-        if hasattr(competition, 'has_time_limit') and competition.has_time_limit and elapsed_time > 0:
-            # إذا كان الوقت المتبقي أكثر من نصف الوقت الإجمالي
-            time_remaining_ratio = 1 - (elapsed_time / competition.time_limit)
-            if time_remaining_ratio > 0.5:
-                time_bonus = int(total_score * 0.2)  # 20% مكافأة للوقت السريع
-                app.logger.info(f"مكافأة الوقت السريع: +{time_bonus} نقطة")
-        
-        app.logger.info(f"النتيجة: {correct_answers} إجابات صحيحة من أصل {total_questions}. المجموع: {total_score} نقطة")
-        
-        # حفظ إجابات المستخدم كـ JSON
-        import json
-        participation.answers_data = json.dumps(user_answers)
-        
-        # تحديث بيانات المشاركة
-        participation.score = total_score
-        participation.completed = True
-        participation.correct_answers = correct_answers
-        participation.bonus_points = bonus_points
-        participation.penalties = penalties
-        participation.time_bonus = time_bonus
-        participation.completed_at = datetime.utcnow()
-        
-        # حفظ التغييرات في جدول المشاركة
-        db.session.commit()
-        app.logger.info(f"تم تحديث بيانات المشاركة")
+        answers, times = extract_submission(request.form)
+        ip_address = current_user.get_client_ip(request)
+        user_agent = request.user_agent.string if request.user_agent else None
         
-        # إضافة النقاط مباشرة إلى رصيد المستخدم (إلا إذا كان مشرفًا)
-        total_points = total_score + bonus_points + time_bonus - penalties
-        
-        if total_points > 0 and not current_user.is_admin:
-            # الاحتفاظ بالنقاط الحالية للمستخدم للمقارنة لاحقًا
-            points_before = current_user.points
-            
-            # إضافة النقاط مباشرة
-            current_user.points += total_points
-            
-            # تسجيل معاملة النقاط
-            transaction = PointsTransaction(
-                user_id=current_user.id,
-                amount=total_points,
-                balance_after=current_user.points,
-                transaction_type='competition_question_points',
-                related_id=competition.id,
-                description=f'نقاط المسابقة: {competition.title} ({correct_answers}/{total_questions} صحيحة)'
+        if is_grading_queue_enabled():
+            # وضع الطابور: حفظ الإجابات الخام والرد فورًا، ويتولى عمّال التصحيح الباقي
+            job = enqueue_submission(
+                competition, participation, current_user, answers,
+                times=times, elapsed_time=elapsed_time, submission_key=submission_key,
+                ip_address=ip_address, user_agent=user_agent
             )
-            
-            # إضافة معلومات الطلب إذا كانت متوفرة
-            if request:
-                ip_address = request.remote_addr
-                if 'X-Forwarded-For' in request.headers:
-                    ip_address = request.headers.get('X-Forwarded-For', '').split(',')[0].strip()
-                transaction.ip_address = ip_address
-                if hasattr(request, 'user_agent') and request.user_agent:
-                    transaction.user_agent = request.user_agent.string
-            
-            db.session.add(transaction)
             db.session.commit()
-            
-            app.logger.info(f"تمت إضافة {total_points} نقطة لرصيد المستخدم. الرصيد قبل: {points_before}, الرصيد بعد: {current_user.points}")
-            flash(f'تهانينا! تمت إضافة {total_points} كربتو إلى رصيدك!', 'success')
+            app.logger.info(f"=== تمت إضافة التقديم إلى طابور التصحيح (المهمة #{job.id}) ===")
+            flash('تم استلام إجاباتك وجاري تصحيحها', 'info')
+            return redirect(url_for('competition_results', competition_id=competition.id))
+        
+        messages = grade_submission(
+            competition, participation, current_user, answers,
+            times=times, elapsed_time=elapsed_time, submission_key=submission_key,
+            ip_address=ip_address, user_agent=user_agent
+        )
         
-        # حساب وإضافة نقاط المكافأة الإضافية إذا كانت المسابقة تمنح نقاط إضافية
-        # التحقق أولاً مما إذا كان المستخدم قد تلقى بالفعل مكافأة هذه المسابقة
-        already_received_reward = PointsTransaction.query.filter_by(
-            user_id=current_user.id,
-            transaction_type='competition_reward',
-            related_id=competition.id
-        ).first()
+        # حفظ المشاركة والإجابات والنقاط ومعاملاتها في معاملة واحدة (يُحرر قفل المشاركة هنا)
+        db.session.commit()
         
-        if already_received_reward:
-            app.logger.info(f"المستخدم {current_user.username} تلقى بالفعل مكافأة المسابقة #{competition.id}. لن يتم إضافة مكافأة مرة أخرى.")
-        elif competition.points > 0 and total_questions > 0:
-            # لم يحصل المستخدم على مكافأة هذه المسابقة من قبل
-            success_percentage = (correct_answers / total_questions) * 100
-            reward_points = 0
-            
-            if success_percentage >= 80:  # 80% أو أعلى للحصول على كامل النقاط
-                reward_points = competition.points
-                app.logger.info(f"نسبة النجاح {success_percentage}% >= 80%. المكافأة الكاملة: {reward_points}")
-            elif success_percentage >= 50:  # 50% أو أعلى للحصول على نصف النقاط
-                reward_points = competition.points // 2
-                app.logger.info(f"نسبة النجاح {success_percentage}% >= 50%. نصف المكافأة: {reward_points}")
-            else:
-                app.logger.info(f"نسبة النجاح {success_percentage}% < 50%. لا توجد مكافأة إضافية.")
-            
-            if reward_points > 0:
-                # الاحتفاظ بالنقاط الحالية للمستخدم للمقارنة لاحقًا
-                points_before = current_user.points
-                
-                # إضافة النقاط مباشرة (إلا إذا كان مشرفًا)
-                if not current_user.is_admin:
-                    current_user.points += reward_points
-                    
-                    # تسجيل معاملة النقاط
-                    transaction = PointsTransaction(
-                        user_id=current_user.id,
-                        amount=reward_points,
-                        balance_after=current_user.points,
-                        transaction_type='competition_reward',
-                        related_id=competition.id,
-                        description=f'مكافأة المشاركة في مسابقة: {competition.title}'
-                    )
-                    
-                    # إضافة معلومات الطلب إذا كانت متوفرة
-                    if request:
-                        ip_address = request.remote_addr
-                        if 'X-Forwarded-For' in request.headers:
-                            ip_address = request.headers.get('X-Forwarded-For', '').split(',')[0].strip()
-                        transaction.ip_address = ip_address
-                        if hasattr(request, 'user_agent') and request.user_agent:
-                            transaction.user_agent = request.user_agent.string
-                    
-                    db.session.add(transaction)
-                    db.session.commit()
-                
-                app.logger.info(f"تمت إضافة {reward_points} نقطة إضافية كمكافأة. الرصيد قبل: {points_before}, الرصيد بعد: {current_user.points}")
-                flash(f'تهانينا! لقد كسبت {reward_points} كربتو إضافية كمكافأة على أدائك الجيد في المسابقة.', 'success')
+        # رسائل المستخدم تُعرض فقط بعد نجاح حفظ المعاملة
+        for message, category in messages:
+            flash(message, category)
         
         app.logger.info(f"=== اكتملت معالجة الإجابات بنجاح. الرصيد الحالي: {current_user.points} ===")
         
@@ -788,13 +643,49 @@ def competition_results(competition_id):
         competition_id=competition.id
     ).first_or_404()
     
+    # التقديم ما زال في طابور التصحيح
+    grading_job = get_pending_job(participation.id)
+    if grading_job is not None:
+        return render_template(
+            'competition_grading.html',
+            competition=competition,
+            grading_job=grading_job
+        )
+    
     # التحقق من أن المستخدم أكمل المسابقة
     if not participation.completed:
         flash('يجب عليك إكمال المسابقة أولاً لرؤية النتائج', 'warning')
         return redirect(url_for('competition_details', competition_id=competition.id))
     
-    # الحصول على أسئلة المسابقة
+    # قراءة النتائج المُصحّحة المحفوظة عند التقديم في استعلام واحد
+    stored_results = ParticipationAnswer.query.filter_by(
+        participation_id=participation.id
+    ).options(
+        db.joinedload(ParticipationAnswer.question)
+    ).order_by(ParticipationAnswer.position).all()
+    
+    if stored_results:
+        results = [{
+            'question': answer_result.question,
+            'is_correct': answer_result.is_correct,
+            'points_earned': answer_result.points_earned,
+            'user_answer': answer_result.answer,
+            'user_answer_text': answer_result.user_answer_text,
+            'correct_answer_text': answer_result.correct_answer_text,
+        } for answer_result in stored_results]
+        questions = [answer_result.question for answer_result in stored_results]
+        
+        return render_template(
+            'competition_results.html',
+            competition=competition,
+            participation=participation,
+            questions=questions,
+            results=results
+        )
+    
+    # المشاركات القديمة (قبل حفظ النتائج المُصحّحة): التصحيح من بيانات الإجابات المخزنة
     questions = competition.get_questions()
+    answer_key = get_answer_key(competition)
     
     # تحليل إجابات المستخدم المخزنة
     results = []
@@ -818,26 +709,14 @@ def competition_results(competition_id):
                     user_answer = user_answers[str(question.id)]
                     result_entry['user_answer'] = user_answer
                     
-                    # الحصول على تفاصيل الإجابة الصحيحة
-                    is_correct, points_earned, correct_text = question.check_answer(user_answer)
+                    # الحصول على تفاصيل الإجابة الصحيحة من المفتاح المُجمّع
+                    compiled_question = answer_key.get(question.id) or CompiledQuestion(question)
+                    is_correct, points_earned, correct_text = compiled_question.check(user_answer)
                     
                     result_entry['is_correct'] = is_correct
                     result_entry['points_earned'] = points_earned
                     result_entry['correct_answer_text'] = correct_text
-                    
-                    # تحديث نص الإجابة للعرض
-                    if question.question_type in ['multiple_choice', 'image_choice']:
-                        try:
-                            option_index = int(user_answer)
-                            options = question.options_list
-                            if 0 <= option_index < len(options):
-                                result_entry['user_answer_text'] = options[option_index]
-                        except (ValueError, TypeError, IndexError):
-                            result_entry['user_answer_text'] = user_answer
-                    elif question.question_type == 'true_false':
-                        result_entry['user_answer_text'] = 'صواب' if user_answer.lower() == 'true' else 'خطأ'
-                    else:
-                        result_entry['user_answer_text'] = user_answer
+                    result_entry['user_answer_text'] = compiled_question.answer_text(user_answer)
                 
                 results.append(result_entry)
     except (json.JSONDecodeError, TypeError) as e:
@@ -922,15 +801,37 @@ def redeem_reward(reward_id):
 
 @app.route('/leaderboard')
 def leaderboard():
-    top_users = User.query.filter(User.is_admin == False).order_by(User.points.desc()).limit(50).all()
-    return render_template('leaderboard.html', top_users=top_users)
+    period = normalize_period(request.args.get('period'))
+    my_rank = None
+    neighbors = []
+
+    # لوحات الفترات تُقرأ من جدول التجميعات الدورية
+    if period:
+        top_users = get_period_leaderboard(period, limit=50)
+        if current_user.is_authenticated and not current_user.is_admin:
+            my_rank = get_period_rank(period, current_user.id)
+        return render_template('leaderboard.html', top_users=top_users, my_rank=my_rank, neighbors=neighbors,
+                               period=period, periods=PERIOD_TYPES)
+
+    board = get_points_leaderboard()
+    top_users = fill_usernames(board, board.top(50))
+
+    # ترتيب المستخدم الحالي ومن حوله
+    if current_user.is_authenticated and not current_user.is_admin:
+        if current_user.id not in board:
+            board.set(current_user.id, current_user.points, current_user.username)
+        my_rank = board.rank(current_user.id)
+        neighbors = fill_usernames(board, board.around(current_user.id, radius=2))
+
+    return render_template('leaderboard.html', top_users=top_users, my_rank=my_rank, neighbors=neighbors,
+                           period=None, periods=PERIOD_TYPES)
 
 
 @app.route('/points-pricing')
 def points_pricing():
     """عرض صفحة باقات الكربتو وأسعارها"""
     packages = PointsPackage.query.filter_by(is_active=True).order_by(PointsPackage.display_order).all()
-    contact_link = config.CONTACT_LINK
+    contact_link = get_setting('CONTACT_LINK')
     currency_name = config.CURRENCY_NAME
     currency_name_plural = config.CURRENCY_NAME_PLURAL
     return render_template('points_pricing.html', 
@@ -1221,7 +1122,50 @@ def admin_competition_questions(competition_id):
         total_questions=total_questions,
         active_questions=active_questions,
         filter_type=filter_type,
-        filtered_count=filtered_count
+        filtered_count=filtered_count,
+        pending_regrade=get_pending_regrade(competition.id)
+    )
+
+
+@app.route('/secure-admin-panel-9382/competitions/<int:competition_id>/regrade', methods=['POST'])
+@admin_required
+def admin_regrade_competition(competition_id):
+    """جدولة إعادة تصحيح جميع المشاركات المكتملة في المسابقة وفق مفتاح الإجابات الحالي (في الخلفية)"""
+    competition = Competition.query.get_or_404(competition_id)
+    
+    try:
+        enqueue_regrade(competition, current_user, ip_address=request.remote_addr)
+        db.session.commit()
+        start_grading_queue_drain()
+        flash('تمت جدولة إعادة تصحيح المشاركات في الخلفية، وستُعدّل الأرصدة عند انتهائها', 'info')
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في جدولة إعادة تصحيح المسابقة: {str(e)}")
+        flash('حدث خطأ أثناء جدولة إعادة تصحيح المسابقة', 'danger')
+    
+    return redirect(url_for('admin_competition_questions', competition_id=competition.id))
+
+
+@app.route('/secure-admin-panel-9382/competitions/<int:competition_id>/analytics', methods=['GET'])
+@admin_required
+def admin_competition_analytics(competition_id):
+    """عرض إحصائيات أسئلة المسابقة للمشرف (نسبة الإجابات الصحيحة، توزيع الخيارات، متوسط الوقت)"""
+    competition = Competition.query.get_or_404(competition_id)
+    
+    # تشمل الإحصائيات الأسئلة غير النشطة لأنها قد تحتوي على إجابات سابقة
+    questions = competition.get_questions(include_inactive=True)
+    analytics = get_competition_analytics(competition, questions)
+    
+    completed_participations = Participation.query.filter_by(
+        competition_id=competition.id,
+        completed=True
+    ).count()
+    
+    return render_template(
+        'admin/competition_analytics.html',
+        competition=competition,
+        analytics=analytics,
+        completed_participations=completed_participations
     )
 
 
@@ -1273,6 +1217,7 @@ def admin_new_question(competition_id):
                 
                 # إضافة وحفظ السؤال في قاعدة البيانات
                 db.session.add(question)
+                invalidate_answer_key(competition.id)
                 db.session.commit()
                 
                 # تسجيل الحدث
@@ -1371,6 +1316,11 @@ def admin_edit_question(competition_id, question_id):
         # معالجة النموذج عند إرساله
         if form.validate_on_submit():
             try:
+                # الحقول التي تؤثر على التصحيح قبل التعديل (لتحديد الحاجة لإعادة التصحيح)
+                grading_fields_before = (
+                    question.correct_answer, question.options, question.question_type, question.points
+                )
+                
                 # معالجة الخيارات إذا كان نوع السؤال اختيار من متعدد أو اختيار مع صورة
                 if form.question_type.data in ['multiple_choice', 'image_choice'] and form.options.data:
                     import json
@@ -1401,6 +1351,7 @@ def admin_edit_question(competition_id, question_id):
                 question.time_limit = time_limit
                 question.difficulty = form.difficulty.data
                 
+                invalidate_answer_key(competition.id)
                 db.session.commit()
                 
                 # تسجيل الحدث
@@ -1414,6 +1365,16 @@ def admin_edit_question(competition_id, question_id):
                 )
                 
                 flash('تم تعديل السؤال بنجاح', 'success')
+                
+                # إعادة تصحيح المشاركات السابقة إذا تغير مفتاح الإجابة
+                grading_fields_after = (
+                    question.correct_answer, question.options, question.question_type, question.points
+                )
+                if question.is_active and grading_fields_after != grading_fields_before:
+                    enqueue_regrade(competition, current_user, ip_address=request.remote_addr)
+                    db.session.commit()
+                    start_grading_queue_drain()
+                    flash('تمت جدولة إعادة تصحيح المشاركات السابقة في الخلفية', 'info')
                 return redirect(url_for('admin_competition_questions', competition_id=competition.id))
             except Exception as e:
                 db.session.rollback()
@@ -1479,6 +1440,7 @@ def admin_delete_question(competition_id, question_id):
     try:
         # حذف السؤال
         db.session.delete(question)
+        invalidate_answer_key(competition.id)
         db.session.commit()
         
         # تسجيل الحدث
@@ -1519,6 +1481,7 @@ def admin_toggle_question_status(competition_id, question_id, action):
     try:
         # تحديث حالة السؤال
         question.is_active = (action == 'activate')
+        invalidate_answer_key(competition.id)
         db.session.commit()
         
         # تسجيل الحدث
@@ -1596,7 +1559,7 @@ def admin_edit_reward(reward_id):
 def admin_points_packages():
     """إدارة باقات الكربتو"""
     packages = PointsPackage.query.order_by(PointsPackage.display_order).all()
-    contact_link = config.CONTACT_LINK
+    contact_link = get_setting('CONTACT_LINK')
     currency_name = config.CURRENCY_NAME
     currency_name_plural = config.CURRENCY_NAME_PLURAL
     return render_template('admin/points_packages.html', 
@@ -1693,9 +1656,6 @@ def admin_config():
                 description='رابط التواصل مع المشرف للشراء'
             )
             
-            # تحديث المتغير في الذاكرة
-            config.CONTACT_LINK = new_contact_link
-            
             # تسجيل تغيير الإعدادات في سجل التدقيق
             ip_address = request.remote_addr
             if 'X-Forwarded-For' in request.headers:
@@ -1718,8 +1678,8 @@ def admin_config():
             app.logger.error(f"خطأ في تحديث التكوين: {str(e)}")
             flash(f'حدث خطأ أثناء تحديث الإعدادات: {str(e)}', 'danger')
     
-    # استخدام القيمة من قاعدة البيانات إذا كانت موجودة، وإلا استخدام القيمة من ملف config.py
-    contact_link = SystemConfig.get('CONTACT_LINK', config.CONTACT_LINK)
+    # استخدام القيمة من إعدادات النظام إذا كانت موجودة، وإلا استخدام القيمة من ملف config.py
+    contact_link = get_setting('CONTACT_LINK')
     
     return render_template('admin/config.html', contact_link=contact_link)
 
@@ -1767,7 +1727,6 @@ def admin_transactions():
     transaction_type = request.args.get('transaction_type')
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
-    page = request.args.get('page', 1, type=int)
     per_page = 50  # عدد العناصر في كل صفحة
     
     # إنشاء الاستعلام الأساسي
@@ -1797,11 +1756,13 @@ def admin_transactions():
         except ValueError:
             flash('صيغة تاريخ النهاية غير صحيحة، تم تجاهلها', 'warning')
     
-    # ترتيب النتائج من الأحدث إلى الأقدم
-    query = query.order_by(PointsTransaction.created_at.desc())
-    
-    # تنفيذ الاستعلام مع التقسيم إلى صفحات
-    pagination = query.paginate(page=page, per_page=per_page)
+    # صفحة النتائج من الأحدث إلى الأقدم بالمؤشرات (بدون OFFSET) مع عدد إجمالي مخزن مؤقتًا
+    pagination = keyset_paginate(
+        query, PointsTransaction.created_at, PointsTransaction.id, per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        count_key=('points_transaction', user_id, transaction_type, start_date_str, end_date_str)
+    )
     transactions = pagination.items
     
     return render_template(
@@ -1820,12 +1781,12 @@ def admin_user_transactions(user_id):
     # التحقق من وجود المستخدم
     user = User.query.get_or_404(user_id)
     
-    page = request.args.get('page', 1, type=int)
     per_page = 20  # عدد العناصر في كل صفحة
     
-    # الحصول على معاملات المستخدم
-    query = PointsTransaction.query.filter_by(user_id=user_id).order_by(PointsTransaction.created_at.desc())
-    pagination = query.paginate(page=page, per_page=per_page)
+    # الحصول على معاملات المستخدم (الحديثة من الجدول ثم القديمة من الأرشيف)
+    pagination = get_user_transactions_page(
+        user, per_page, after=request.args.get('after'), before=request.args.get('before')
+    )
     transactions = pagination.items
     
     return render_template(
@@ -1939,23 +1900,102 @@ def admin_add_points():
     return render_template('admin/add_points.html', form=form)
 
 
-@app.route('/admin/purchases')
+@app.route('/admin/add-points/bulk', methods=['GET', 'POST'])
 @admin_required
-def admin_purchases():
-    """عرض سجل عمليات شراء الكربتو"""
+@limiter.limit("10 per minute")  # تقييد معدل الطلبات على عمليات تعديل النقاط
+def admin_bulk_points():
+    """تعديل أرصدة عدة مستخدمين دفعة واحدة من ملف CSV أو قائمة JSON"""
+    form = BulkPointsForm()
+
+    # طلبات JSON (من الأدوات الإدارية) تُرجع نتيجة كل سطر مباشرة
+    if request.method == 'POST' and request.is_json:
+        try:
+            rows = parse_json_rows(request.get_json(silent=True))
+        except BulkPointsError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    elif form.validate_on_submit():
+        try:
+            if form.csv_file.data:
+                rows = parse_csv_rows(form.csv_file.data.read().decode('utf-8-sig'))
+            elif form.json_rows.data and form.json_rows.data.strip():
+                rows = parse_json_rows(form.json_rows.data)
+            else:
+                raise BulkPointsError('يرجى رفع ملف CSV أو إدخال قائمة JSON')
+        except UnicodeDecodeError:
+            flash('يجب أن يكون الملف بترميز UTF-8', 'danger')
+            return render_template('admin/bulk_points.html', form=form, max_rows=config.BULK_POINTS_MAX_ROWS)
+        except BulkPointsError as e:
+            flash(str(e), 'danger')
+            return render_template('admin/bulk_points.html', form=form, max_rows=config.BULK_POINTS_MAX_ROWS)
+    else:
+        return render_template('admin/bulk_points.html', form=form, max_rows=config.BULK_POINTS_MAX_ROWS)
+
+    ip_address = request.remote_addr
+    if 'X-Forwarded-For' in request.headers:
+        ip_address = request.headers.get('X-Forwarded-For', '').split(',')[0].strip()
+
+    try:
+        batch = apply_bulk_adjustments(
+            rows, current_user, ip_address=ip_address,
+            user_agent=request.user_agent.string if request.user_agent else None
+        )
+    except Exception:
+        if request.is_json:
+            return jsonify({'success': False, 'error': 'حدث خطأ أثناء تطبيق التعديلات'}), 500
+        flash('حدث خطأ أثناء تطبيق التعديلات، لم يتم تعديل أي رصيد', 'danger')
+        return render_template('admin/bulk_points.html', form=form, max_rows=config.BULK_POINTS_MAX_ROWS)
+
+    if request.is_json:
+        return jsonify({
+            'success': batch.status == 'applied',
+            'batch_id': batch.id,
+            'status': batch.status,
+            'rows': batch.row_count,
+            'users': batch.users_count,
+            'total_added': batch.total_added,
+            'total_deducted': batch.total_deducted,
+            'results_url': url_for('admin_bulk_points_results', batch_id=batch.id),
+            'results': batch.get_results(),
+        }), 200 if batch.status == 'applied' else 422
+
+    if batch.status == 'applied':
+        flash(f'تم تطبيق {batch.row_count} تعديل على أرصدة {batch.users_count} مستخدم', 'success')
+    else:
+        flash('لم يتم تطبيق الدفعة لوجود أسطر غير صالحة، راجع النتائج أدناه', 'danger')
+    return render_template(
+        'admin/bulk_points.html', form=BulkPointsForm(formdata=None), batch=batch, max_rows=config.BULK_POINTS_MAX_ROWS
+    )
+
+
+@app.route('/admin/add-points/bulk/<int:batch_id>/results.csv')
+@admin_required
+def admin_bulk_points_results(batch_id):
+    """تنزيل نتيجة كل سطر في دفعة تعديل جماعي"""
+    from models import PointsAdjustmentBatch
+
+    batch = PointsAdjustmentBatch.query.get_or_404(batch_id)
+    return Response(
+        results_to_csv(batch),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=bulk_points_{batch.id}.csv'}
+    )
+
+
+# أعمدة تصدير سجل المشتريات
+PURCHASE_EXPORT_COLUMNS = [
+    'id', 'user_id', 'username', 'amount_paid', 'currency', 'points_added',
+    'payment_method', 'reference', 'notes', 'created_by_id', 'created_at',
+]
+
+
+def _filter_purchases(query):
+    """تطبيق مرشحات سجل المشتريات من معاملات الطلب (المستخدم وطريقة الدفع ونطاق التاريخ)"""
     from models import PurchaseRecord
-    from forms import PurchaseRecordForm
     
-    # استخراج معايير البحث من البارامترات
     user_id = request.args.get('user_id', type=int)
     payment_method = request.args.get('payment_method')
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
-    page = request.args.get('page', 1, type=int)
-    per_page = 20  # عدد العناصر في كل صفحة
-    
-    # إنشاء الاستعلام الأساسي
-    query = PurchaseRecord.query
     
     # تطبيق المرشحات إذا كانت موجودة
     if user_id:
@@ -1981,11 +2021,31 @@ def admin_purchases():
         except ValueError:
             flash('صيغة تاريخ النهاية غير صحيحة، تم تجاهلها', 'warning')
     
-    # ترتيب النتائج من الأحدث إلى الأقدم
-    query = query.order_by(PurchaseRecord.created_at.desc())
+    return query
+
+
+@app.route('/admin/purchases')
+@admin_required
+def admin_purchases():
+    """عرض سجل عمليات شراء الكربتو"""
+    from models import PurchaseRecord
+    from forms import PurchaseRecordForm
+    
+    per_page = 20  # عدد العناصر في كل صفحة
     
-    # تنفيذ الاستعلام مع التقسيم إلى صفحات
-    pagination = query.paginate(page=page, per_page=per_page)
+    # إنشاء الاستعلام الأساسي مع المرشحات
+    query = _filter_purchases(PurchaseRecord.query)
+    
+    # صفحة النتائج من الأحدث إلى الأقدم بالمؤشرات (بدون OFFSET) مع عدد إجمالي مخزن مؤقتًا
+    pagination = keyset_paginate(
+        query, PurchaseRecord.created_at, PurchaseRecord.id, per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        count_key=(
+            'purchase_record', request.args.get('user_id', type=int), request.args.get('payment_method'),
+            request.args.get('start_date'), request.args.get('end_date')
+        )
+    )
     purchases = pagination.items
     
     return render_template(
@@ -1995,6 +2055,36 @@ def admin_purchases():
     )
 
 
+@app.route('/admin/purchases/export')
+@admin_required
+def admin_export_purchases():
+    """تصدير سجل المشتريات الكامل (مع المرشحات الحالية) بالبث بصيغة CSV أو NDJSON"""
+    from models import PurchaseRecord
+    
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_MIMETYPES:
+        abort(400)
+    
+    # الأعمدة المصدرة فقط مع اسم المستخدم في نفس الاستعلام
+    query = _filter_purchases(db.session.query(
+        PurchaseRecord.id, PurchaseRecord.user_id, User.username, PurchaseRecord.amount_paid,
+        PurchaseRecord.currency, PurchaseRecord.points_added, PurchaseRecord.payment_method,
+        PurchaseRecord.reference, PurchaseRecord.notes, PurchaseRecord.created_by_id, PurchaseRecord.created_at
+    ).join(User, User.id == PurchaseRecord.user_id))
+    rows = iter_keyset_rows(query, PurchaseRecord.created_at, PurchaseRecord.id, since=request.args.get('since'))
+    
+    log_audit_event(
+        event_type='DATA_EXPORT',
+        severity='INFO',
+        details=f"تصدير سجل المشتريات بصيغة {export_format} بواسطة المشرف {current_user.username}",
+        user_id=current_user.id,
+        username=current_user.username,
+        ip_address=request.remote_addr
+    )
+    
+    return stream_export(rows, PURCHASE_EXPORT_COLUMNS, export_format, 'purchases')
+
+
 @app.route('/admin/purchases/user/<int:user_id>')
 @admin_required
 def admin_user_purchases(user_id):
@@ -2004,12 +2094,16 @@ def admin_user_purchases(user_id):
     # التحقق من وجود المستخدم
     user = User.query.get_or_404(user_id)
     
-    page = request.args.get('page', 1, type=int)
     per_page = 10  # عدد العناصر في كل صفحة
     
     # الحصول على معاملات المستخدم
-    query = PurchaseRecord.query.filter_by(user_id=user_id).order_by(PurchaseRecord.created_at.desc())
-    pagination = query.paginate(page=page, per_page=per_page)
+    query = PurchaseRecord.query.filter_by(user_id=user_id)
+    pagination = keyset_paginate(
+        query, PurchaseRecord.created_at, PurchaseRecord.id, per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        count_key=('purchase_record', user_id, None, None, None)
+    )
     purchases = pagination.items
     
     return render_template(
@@ -0,0 +1,166 @@
+"""
+عدادات النوافذ الزمنية المنزلقة في ذاكرة العملية
+تُستخدم لكشف إساءة استخدام API (معدل الطلبات وعدد عناوين IP لكل مفتاح، ومحاولات المصادقة
+الفاشلة لكل عنوان) بدلاً من استعلامات COUNT و GROUP BY على سجلات الاستخدام في كل طلب.
+
+كل مفتاح يملك حلقة ثابتة الحجم من الخانات الزمنية (bucket)، فتكلفة الإضافة والعد ثابتة
+مهما كان عدد الطلبات. المفاتيح الخاملة لأكثر من طول النافذة تُحذف تلقائيًا، ويُحدّ العدد
+الكلي للمفاتيح المتتبعة حتى لا تنمو الذاكرة مع عناوين IP العشوائية.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# الحد الأقصى الافتراضي لعدد المفاتيح المتتبعة في كل عداد
+DEFAULT_MAX_KEYS = 100000
+
+
+class _Ring:
+    """حلقة خانات لمفتاح واحد مع المجموع الحالي"""
+
+    __slots__ = ('counts', 'stamps', 'total')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.stamps = [-1] * size
+        self.total = 0
+
+
+class SlidingWindowCounter:
+    """
+    عداد أحداث لكل مفتاح خلال آخر window_seconds ثانية بدقة bucket_seconds
+
+    Example:
+        calls = SlidingWindowCounter(60, 5)
+        if calls.add(key_id) > 30: ...
+    """
+
+    def __init__(self, window_seconds, bucket_seconds=1, max_keys=DEFAULT_MAX_KEYS):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.size = max(1, int(window_seconds // bucket_seconds))
+        self.max_keys = max_keys
+        self._rings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, now):
+        return int(now // self.bucket_seconds)
+
+    def _expire(self, ring, bucket):
+        """تصفير الخانات التي خرجت من النافذة"""
+        oldest = bucket - self.size
+        for slot in range(self.size):
+            if ring.stamps[slot] != -1 and ring.stamps[slot] <= oldest:
+                ring.total -= ring.counts[slot]
+                ring.counts[slot] = 0
+                ring.stamps[slot] = -1
+
+    def _evict_idle(self, now):
+        """حذف المفاتيح الخاملة من بداية الترتيب (الأقدم استخدامًا) وتطبيق الحد الأقصى"""
+        while self._rings:
+            key, ring = next(iter(self._rings.items()))
+            last = max(ring.stamps)
+            idle = last == -1 or (self._bucket(now) - last) >= self.size
+            if not idle and len(self._rings) <= self.max_keys:
+                break
+            del self._rings[key]
+
+    def add(self, key, amount=1, now=None):
+        """إضافة حدث للمفتاح، ويُرجع عدد أحداثه في النافذة بعد الإضافة"""
+        now = time.time() if now is None else now
+        bucket = self._bucket(now)
+        slot = bucket % self.size
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = self._rings[key] = _Ring(self.size)
+            else:
+                self._rings.move_to_end(key)
+            self._expire(ring, bucket)
+            if ring.stamps[slot] != bucket:
+                ring.total -= ring.counts[slot]
+                ring.counts[slot] = 0
+                ring.stamps[slot] = bucket
+            ring.counts[slot] += amount
+            ring.total += amount
+            total = ring.total
+            self._evict_idle(now)
+        return total
+
+    def count(self, key, now=None):
+        """عدد أحداث المفتاح في النافذة"""
+        now = time.time() if now is None else now
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                return 0
+            self._expire(ring, self._bucket(now))
+            return ring.total
+
+    def reset(self, key=None):
+        """حذف عداد مفتاح (أو جميع العدادات)"""
+        with self._lock:
+            if key is None:
+                self._rings.clear()
+            else:
+                self._rings.pop(key, None)
+
+
+class SlidingWindowSet:
+    """
+    عدد القيم المختلفة لكل مفتاح خلال آخر window_seconds ثانية (مثل عناوين IP لمفتاح API)
+    تُحفظ القيم بترتيب آخر ظهور، فتُحذف القديمة من البداية دون المرور على الباقي
+    """
+
+    def __init__(self, window_seconds, max_values=100, max_keys=DEFAULT_MAX_KEYS):
+        self.window_seconds = window_seconds
+        self.max_values = max_values
+        self.max_keys = max_keys
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, values, now):
+        oldest = now - self.window_seconds
+        while values and (next(iter(values.values())) <= oldest or len(values) > self.max_values):
+            values.popitem(last=False)
+
+    def add(self, key, value, now=None):
+        """تسجيل ظهور القيمة للمفتاح، ويُرجع عدد القيم المختلفة في النافذة"""
+        now = time.time() if now is None else now
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = OrderedDict()
+            else:
+                self._values.move_to_end(key)
+            values[value] = now
+            values.move_to_end(value)
+            self._expire(values, now)
+            distinct = len(values)
+
+            # حذف المفاتيح الخاملة أو الزائدة عن الحد من بداية الترتيب
+            while self._values:
+                first_key, first_values = next(iter(self._values.items()))
+                self._expire(first_values, now)
+                if first_values and len(self._values) <= self.max_keys:
+                    break
+                del self._values[first_key]
+        return distinct
+
+    def count(self, key, now=None):
+        """عدد القيم المختلفة للمفتاح في النافذة"""
+        now = time.time() if now is None else now
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                return 0
+            self._expire(values, now)
+            return len(values)
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
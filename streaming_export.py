@@ -0,0 +1,95 @@
+"""
+تصدير السجلات الطويلة بالبث (NDJSON أو CSV)
+بدلاً من التصفح 50 صفًا في كل طلب، تُقرأ الصفوف بترتيب (created_at, id) عبر مؤشر قاعدة بيانات
+من جهة الخادم (yield_per) وتُكتب إلى الاستجابة على دفعات من مولّد، فتبقى ذاكرة العامل ثابتة
+مهما كان عدد الصفوف.
+
+كل صف يحمل مؤشرًا غير شفاف (cursor)؛ إذا انقطع التنزيل يُستأنف بتمريره في المعامل since.
+"""
+
+import csv
+import heapq
+import io
+import json
+from datetime import datetime
+from flask import Response, stream_with_context
+from sqlalchemy import tuple_
+from keyset_pagination import encode_cursor, decode_cursor
+import config
+
+# صيغ التصدير المدعومة ونوع المحتوى لكل منها
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_keyset_rows(query, created_column, id_column, since=None):
+    """
+    صفوف الاستعلام من الأقدم إلى الأحدث بعد الموضع since (مؤشر مُرمّز)،
+    تُجلب على دفعات من EXPORT_BATCH_SIZE صف عبر مؤشر من جهة الخادم
+    """
+    position = decode_cursor(since)
+    if position is not None:
+        query = query.filter(tuple_(created_column, id_column) > tuple_(*position))
+    return query.order_by(created_column.asc(), id_column.asc()).yield_per(config.EXPORT_BATCH_SIZE)
+
+
+def merge_sorted_rows(*sources):
+    """دمج مصادر صفوف مرتبة (مثل الجدول والأرشيف) في تدفق واحد مرتب حسب (created_at, id)"""
+    return heapq.merge(*sources, key=lambda row: (_value(row, 'created_at'), _value(row, 'id')))
+
+
+def _value(row, column):
+    return row[column] if isinstance(row, dict) else getattr(row, column)
+
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_export(rows, columns, export_format, filename):
+    """
+    استجابة بث للصفوف بالصيغة المطلوبة مع عمود cursor لاستئناف التصدير
+
+    Args:
+        rows: مولّد صفوف (Row أو dict) مرتب حسب (created_at, id)
+        columns (list): الأعمدة المصدرة بترتيبها
+        export_format (str): 'ndjson' أو 'csv'
+        filename (str): اسم الملف بدون الامتداد
+    """
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if export_format == 'csv' else None
+        if writer:
+            writer.writerow(columns + ['cursor'])
+
+        pending = 0
+        for row in rows:
+            values = [_serialize(_value(row, column)) for column in columns]
+            cursor = encode_cursor((_value(row, 'created_at'), _value(row, 'id')))
+            if writer:
+                writer.writerow(values + [cursor])
+            else:
+                record = dict(zip(columns, values), cursor=cursor)
+                buffer.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+            pending += 1
+            if pending >= config.EXPORT_BATCH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+                pending = 0
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}.{export_format}',
+            # منع الوسيط العكسي من تجميع الاستجابة كاملة قبل إرسالها
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -0,0 +1,237 @@
+"""
+Integration tests for competition answer submission
+
+These tests verify that submitted answers are graded once and stored per question
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from app import app as flask_app, db
+from models import User, Competition, Question, Participation, ParticipationAnswer, PointsTransaction
+
+
+@pytest.fixture
+def app():
+    """Flask application fixture"""
+    flask_app.config['TESTING'] = True
+    flask_app.config['WTF_CSRF_ENABLED'] = False
+    flask_app.config['RATELIMIT_ENABLED'] = False
+
+    with flask_app.app_context():
+        yield flask_app
+
+
+@pytest.fixture
+def competition_setup(app):
+    """User participating in a competition with two questions"""
+    user = User(username='submit_test_user', email='submit_test@example.com', password_hash='x')
+    competition = Competition(
+        title='submit test',
+        description='submit test',
+        start_date=datetime.utcnow() - timedelta(days=1),
+        end_date=datetime.utcnow() + timedelta(days=1)
+    )
+    db.session.add_all([user, competition])
+    db.session.flush()
+
+    questions = [
+        Question(competition_id=competition.id, text='2 + 2', options=json.dumps(['3', '4']),
+                 correct_answer='1', order=1),
+        Question(competition_id=competition.id, text='3 + 3', options=json.dumps(['6', '7']),
+                 correct_answer='0', order=2),
+    ]
+    db.session.add_all(questions)
+    db.session.add(Participation(user_id=user.id, competition_id=competition.id))
+    db.session.commit()
+
+    yield user, competition, questions
+
+    participation_ids = [p.id for p in Participation.query.filter_by(competition_id=competition.id)]
+    ParticipationAnswer.query.filter(ParticipationAnswer.participation_id.in_(participation_ids)).delete(synchronize_session=False)
+    Participation.query.filter_by(competition_id=competition.id).delete()
+    PointsTransaction.query.filter_by(user_id=user.id).delete()
+    Question.query.filter_by(competition_id=competition.id).delete()
+    db.session.delete(competition)
+    db.session.delete(user)
+    db.session.commit()
+
+
+def test_submit_stores_graded_answers(app, competition_setup):
+    """Test submission writes one graded row per question with display texts"""
+    user, competition, questions = competition_setup
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.id)
+
+    response = client.post(
+        f'/competitions/{competition.id}/submit-answers',
+        data={f'answer_{questions[0].id}': '1'}
+    )
+    assert response.status_code == 302
+
+    participation = Participation.query.filter_by(user_id=user.id, competition_id=competition.id).first()
+    rows = participation.answer_results.order_by(ParticipationAnswer.position).all()
+    assert [row.question_id for row in rows] == [questions[0].id, questions[1].id]
+
+    assert rows[0].is_correct is True
+    assert rows[0].points_earned == questions[0].points
+    assert rows[0].user_answer_text == '4'
+
+    assert rows[1].is_correct is False
+    assert rows[1].answer is None
+    assert rows[1].user_answer_text == 'لم تتم الإجابة'
+    assert rows[1].correct_answer_text == '6'
+
+
+def test_duplicate_submit_is_processed_once(app, competition_setup):
+    """Test a resubmission with the same submission key credits points only once"""
+    user, competition, questions = competition_setup
+    competition.allow_multiple_attempts = True
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.id)
+
+    data = {
+        f'answer_{questions[0].id}': '1',
+        f'answer_{questions[1].id}': '0',
+        'submission_key': 'same-page-load',
+    }
+    for _ in range(2):
+        response = client.post(f'/competitions/{competition.id}/submit-answers', data=data)
+        assert response.status_code == 302
+
+    participation = Participation.query.filter_by(user_id=user.id, competition_id=competition.id).first()
+    assert participation.attempts == 2
+    assert participation.submission_key == 'same-page-load'
+
+    credited = PointsTransaction.query.filter_by(
+        user_id=user.id,
+        transaction_type='competition_question_points',
+        related_id=competition.id
+    ).all()
+    assert len(credited) == 1
+
+    db.session.refresh(user)
+    assert user.points == credited[0].amount == credited[0].balance_after
+
+
+def test_completed_single_attempt_is_not_regraded(app, competition_setup):
+    """Test a completed participation is not resubmitted when multiple attempts are disabled"""
+    user, competition, questions = competition_setup
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.id)
+
+    client.post(f'/competitions/{competition.id}/submit-answers',
+                data={f'answer_{questions[0].id}': '1', 'submission_key': 'first'})
+    client.post(f'/competitions/{competition.id}/submit-answers',
+                data={f'answer_{questions[0].id}': '1', 'submission_key': 'second'})
+
+    assert PointsTransaction.query.filter_by(
+        user_id=user.id,
+        transaction_type='competition_question_points'
+    ).count() == 1
+
+
+def test_queued_submit_is_graded_by_worker(app, competition_setup):
+    """Test queued mode stores the raw submission and a worker grades it later"""
+    from models import GradingJob, SystemConfig
+    from grading import process_grading_jobs
+
+    user, competition, questions = competition_setup
+    SystemConfig.set('GRADING_QUEUE_ENABLED', 'true')
+    try:
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+
+        client.post(
+            f'/competitions/{competition.id}/submit-answers',
+            data={f'answer_{questions[0].id}': '1', f'time_{questions[0].id}': '4', 'submission_key': 'queued'}
+        )
+
+        participation = Participation.query.filter_by(user_id=user.id, competition_id=competition.id).first()
+        assert participation.completed is False
+
+        response = client.get(f'/competitions/{competition.id}/results')
+        assert response.status_code == 200
+        assert 'جاري تصحيحها' in response.get_data(as_text=True)
+
+        assert process_grading_jobs() == 1
+
+        db.session.refresh(participation)
+        assert participation.completed is True
+        assert participation.correct_answers == 1
+        job = GradingJob.query.filter_by(participation_id=participation.id).first()
+        assert job.status == 'done'
+        assert participation.answer_results.filter_by(question_id=questions[0].id).first().time_spent == 4
+    finally:
+        SystemConfig.set('GRADING_QUEUE_ENABLED', 'false')
+        GradingJob.query.filter_by(competition_id=competition.id).delete()
+        db.session.commit()
+
+
+def test_details_page_renders_leaderboard_points(app, competition_setup):
+    """Test the competition details page shows each leaderboard entry's points"""
+    user, competition, _ = competition_setup
+    participation = Participation.query.filter_by(user_id=user.id, competition_id=competition.id).first()
+    participation.score = 37
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.id)
+
+    response = client.get(f'/competitions/{competition.id}')
+    assert response.status_code == 200
+    assert '<span class="badge bg-primary rounded-pill">37</span>' in response.get_data(as_text=True)
+
+
+def test_racing_claimers_grade_a_job_once(app, competition_setup):
+    """Test two workers that both saw the same pending job claim and pay it only once"""
+    from models import GradingJob, SystemConfig
+    from grading import claim_grading_jobs, process_grading_job, _claim_job, _finish_job
+
+    user, competition, questions = competition_setup
+    SystemConfig.set('GRADING_QUEUE_ENABLED', 'true')
+    try:
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user.id)
+        client.post(
+            f'/competitions/{competition.id}/submit-answers',
+            data={f'answer_{questions[0].id}': '1', 'submission_key': 'race'}
+        )
+        job_id = GradingJob.query.filter_by(competition_id=competition.id).one().id
+
+        # both workers selected the job as a candidate; only the first conditional claim wins
+        assert claim_grading_jobs() == [job_id]
+        assert _claim_job(job_id, datetime.utcnow()) is False
+        db.session.commit()
+        assert claim_grading_jobs() == []
+
+        # the job goes stale and is reclaimed by a second worker while the first is still running
+        job = db.session.get(GradingJob, job_id)
+        job.started_at = datetime.utcnow() - timedelta(days=1)
+        db.session.commit()
+        assert claim_grading_jobs() == [job_id]
+        assert process_grading_job(job_id) is True
+        assert process_grading_job(job_id) is False
+
+        # the first worker can no longer finish its claim, and a re-run skips the graded participation
+        assert _finish_job(job_id, 1, status='done') is False
+        db.session.rollback()
+        db.session.execute(db.update(GradingJob).where(GradingJob.id == job_id).values(status='processing'))
+        db.session.commit()
+        assert process_grading_job(job_id) is True
+
+        assert PointsTransaction.query.filter_by(
+            user_id=user.id, transaction_type='competition_question_points'
+        ).count() == 1
+    finally:
+        SystemConfig.set('GRADING_QUEUE_ENABLED', 'false')
+        GradingJob.query.filter_by(competition_id=competition.id).delete()
+        db.session.commit()
@@ -0,0 +1,83 @@
+"""
+Unit tests for per-question analytics
+
+These tests verify the backfill from answers_data and the SQL aggregated statistics
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from app import app, db
+from answer_analytics import get_competition_analytics
+
+
+@pytest.fixture
+def competition():
+    """Competition with one choice question and three completed participations"""
+    from models import User, Competition, Question, Participation, ParticipationAnswer
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        competition = Competition(
+            title='analytics test',
+            description='analytics test',
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=1)
+        )
+        users = [
+            User(username=f'analytics_user_{i}', email=f'analytics_{i}@example.com', password_hash='x')
+            for i in range(3)
+        ]
+        db.session.add(competition)
+        db.session.add_all(users)
+        db.session.flush()
+
+        question = Question(
+            competition_id=competition.id,
+            text='2 + 2',
+            options=json.dumps(['3', '4', '5']),
+            correct_answer='1'
+        )
+        db.session.add(question)
+        db.session.flush()
+
+        for user, answer in zip(users, ['1', '1', '0']):
+            db.session.add(Participation(
+                user_id=user.id,
+                competition_id=competition.id,
+                completed=True,
+                answers_data=json.dumps({str(question.id): answer})
+            ))
+        db.session.commit()
+        yield competition
+
+        ParticipationAnswer.query.filter_by(competition_id=competition.id).delete()
+        Participation.query.filter_by(competition_id=competition.id).delete()
+        Question.query.filter_by(competition_id=competition.id).delete()
+        for user in users:
+            db.session.delete(user)
+        db.session.delete(competition)
+        db.session.commit()
+
+
+def test_backfill_and_analytics(competition):
+    """Test legacy JSON answers are backfilled once and aggregated per question"""
+    from update_participation_answers import backfill_participation_answers
+
+    participations, rows = backfill_participation_answers()
+    assert participations == 3
+    assert rows == 3
+
+    # running the backfill again does not duplicate rows
+    assert backfill_participation_answers() == (0, 0)
+
+    analytics = get_competition_analytics(competition, competition.get_questions(include_inactive=True))
+    assert len(analytics) == 1
+
+    stats = analytics[0]['stats']
+    assert stats['answered'] == 3
+    assert stats['correct'] == 2
+    assert round(stats['correct_rate']) == 67
+    assert stats['mean_time'] is None
+
+    assert [option['count'] for option in analytics[0]['options']] == [1, 2, 0]
@@ -0,0 +1,117 @@
+"""
+Unit tests for the compiled answer key
+
+These tests verify that compiled questions grade answers the same way
+Question.check_answer does and that the per-process cache honours versions
+"""
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from app import app, db
+from answer_key import CompiledQuestion, AnswerKey, get_answer_key, invalidate_answer_key
+
+
+def make_question(**kwargs):
+    """Build a lightweight question object with the attributes the compiler reads"""
+    defaults = {
+        'id': 1,
+        'question_type': 'multiple_choice',
+        'options': json.dumps(['a', 'b', 'c']),
+        'correct_answer': '1',
+        'points': 2,
+        'partial_credit_enabled': False,
+    }
+    defaults.update(kwargs)
+    return SimpleNamespace(**defaults)
+
+
+def test_multiple_choice_grading():
+    """Test choice questions compare option indexes"""
+    compiled = CompiledQuestion(make_question())
+    assert compiled.check('1') == (True, 2, 'b')
+    assert compiled.check('0') == (False, 0, 'b')
+    assert compiled.check('not-a-number') == (False, 0, 'b')
+    assert compiled.answer_text('2') == 'c'
+
+
+def test_true_false_and_text_grading():
+    """Test true/false and free text answers are case-insensitive"""
+    true_false = CompiledQuestion(make_question(question_type='true_false', options=None, correct_answer='True'))
+    assert true_false.check('true') == (True, 2, 'صواب')
+    assert true_false.answer_text('false') == 'خطأ'
+
+    text = CompiledQuestion(make_question(question_type='short_answer', options=None, correct_answer='Cairo'))
+    assert text.check('  cairo ')[0] is True
+    assert text.check('giza')[0] is False
+
+
+def test_multiple_answers_partial_credit():
+    """Test partial credit is reported but only full matches count as correct"""
+    question = make_question(
+        question_type='multiple_answers',
+        correct_answer=json.dumps(['0', '2']),
+        partial_credit_enabled=True,
+        points=4
+    )
+    compiled = CompiledQuestion(question)
+    is_correct, points_earned, _ = compiled.check(json.dumps(['2', '0']))
+    assert is_correct is True
+    assert points_earned == 4
+
+    is_correct, points_earned, _ = compiled.check('0')
+    assert is_correct is False
+    assert points_earned == 2
+
+
+def test_answer_key_lookup():
+    """Test the answer key keeps question order and grades by id"""
+    answer_key = AnswerKey(7, 3, [make_question(id=10), make_question(id=11, correct_answer='2')])
+    assert answer_key.question_ids == [10, 11]
+    assert answer_key.total_questions == 2
+    assert answer_key.grade(11, '2')[0] is True
+    assert answer_key.get(99) is None
+
+
+@pytest.fixture
+def competition():
+    """Competition with a single active question"""
+    from models import Competition, Question
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        competition = Competition(
+            title='answer key test',
+            description='answer key test',
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=1)
+        )
+        db.session.add(competition)
+        db.session.flush()
+        db.session.add(Question(
+            competition_id=competition.id,
+            text='2 + 2',
+            options=json.dumps(['3', '4']),
+            correct_answer='1'
+        ))
+        db.session.commit()
+        yield competition
+        Question.query.filter_by(competition_id=competition.id).delete()
+        db.session.delete(competition)
+        db.session.commit()
+
+
+def test_cache_reused_until_invalidated(competition):
+    """Test the compiled key is cached per version and rebuilt after invalidation"""
+    first = get_answer_key(competition)
+    assert get_answer_key(competition) is first
+    assert first.total_questions == 1
+
+    invalidate_answer_key(competition.id)
+    db.session.commit()
+    db.session.refresh(competition)
+
+    second = get_answer_key(competition)
+    assert second is not first
+    assert second.version == first.version + 1
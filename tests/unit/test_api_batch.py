@@ -0,0 +1,85 @@
+"""
+Unit tests for the batch API endpoint
+
+These tests verify that several GET sub-requests run against the existing views
+with a single API key verification, each with its own status and validators
+"""
+import pytest
+from app import app, db
+import api_usage_buffer
+import api_utils
+import api_routes  # noqa: F401
+
+
+@pytest.fixture
+def api_client():
+    """A test client with a fresh read API key"""
+    from models import User, APIKey, APIUsageLog
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='batch_user', email='batch_user@example.com', password_hash='x', points=40)
+        db.session.add(user)
+        db.session.commit()
+        key, raw_key = APIKey.generate_key(user.id, name='batch test')
+        user_id, key_id = user.id, key.id
+
+    yield app.test_client(), {'Authorization': f'Bearer {raw_key}'}, key_id
+
+    with app.app_context():
+        api_usage_buffer.flush_api_usage()
+        APIUsageLog.query.filter_by(api_key_id=key_id).delete()
+        APIKey.query.filter_by(user_id=user_id).delete()
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+
+
+def test_batch_authenticates_once(api_client, monkeypatch):
+    """Test four cold-start sub-requests verify the key once and each get a result"""
+    client, headers, _ = api_client
+    calls = []
+    original = api_utils.validate_api_key
+    monkeypatch.setattr(api_utils, 'validate_api_key', lambda: calls.append(1) or original())
+
+    response = client.post('/api/v1/batch', headers=headers, json={'requests': [
+        {'id': 'info', 'path': '/user/info'},
+        {'id': 'points', 'path': '/user/points'},
+        {'id': 'transactions', 'path': '/user/transactions?limit=5'},
+        {'id': 'rewards', 'path': '/rewards'},
+    ]})
+
+    assert response.status_code == 200
+    items = {item['id']: item for item in response.get_json()['data']}
+    assert [items[name]['status'] for name in ('info', 'points', 'transactions', 'rewards')] == [200] * 4
+    assert items['points']['body']['data']['points'] == 40
+    assert items['points']['headers']['ETag']
+    assert len(calls) == 1
+
+
+def test_batch_item_errors_and_conditional_gets(api_client):
+    """Test per-item 304, unknown paths, non-GET methods and the batch itself are isolated"""
+    client, headers, _ = api_client
+    first = client.post('/api/v1/batch', headers=headers, json={'requests': [{'path': '/user/points'}]})
+    etag = first.get_json()['data'][0]['headers']['ETag']
+
+    response = client.post('/api/v1/batch', headers=headers, json={'requests': [
+        {'path': '/user/points', 'headers': {'If-None-Match': etag}},
+        {'path': '/missing'},
+        {'path': '/keys', 'method': 'POST'},
+        {'path': '/batch'},
+    ]})
+
+    statuses = [(item['id'], item['status']) for item in response.get_json()['data']]
+    assert statuses == [(0, 304), (1, 404), (2, 405), (3, 404)]
+    assert response.get_json()['data'][0]['body'] is None
+
+
+def test_batch_requires_key_and_bounded_list(api_client):
+    """Test the batch rejects missing keys, empty lists and oversized lists"""
+    import config
+
+    client, headers, _ = api_client
+    assert client.post('/api/v1/batch', json={'requests': [{'path': '/user/info'}]}).status_code == 401
+    assert client.post('/api/v1/batch', headers=headers, json={'requests': []}).status_code == 400
+    oversized = [{'path': '/health'}] * (config.API_BATCH_MAX_REQUESTS + 1)
+    assert client.post('/api/v1/batch', headers=headers, json={'requests': oversized}).status_code == 400
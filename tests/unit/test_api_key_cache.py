@@ -0,0 +1,81 @@
+"""
+Unit tests for the verified API key cache
+
+These tests verify that PBKDF2 verification runs only on a cache miss and that
+revocations invalidate cached keys
+"""
+import pytest
+from flask import g
+from app import app, db
+import api_key_cache
+import api_usage_buffer
+from api_utils import validate_api_key, revoke_api_key, APIError
+
+
+@pytest.fixture
+def api_key(monkeypatch):
+    """A fresh API key with a counter on PBKDF2 verifications"""
+    from models import User, APIKey, APIFailedAuth, APIUsageLog
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='cache_key_user', email='cache_key_user@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        key, raw_key = APIKey.generate_key(user.id, name='cache test')
+
+        calls = []
+        verify_key = APIKey.verify_key
+
+        def counting_verify_key(value, key_hash):
+            calls.append(key_hash)
+            return verify_key(value, key_hash)
+
+        monkeypatch.setattr(APIKey, 'verify_key', staticmethod(counting_verify_key))
+        api_key_cache.clear_api_key_cache()
+        yield key, raw_key, calls
+
+        api_key_cache.clear_api_key_cache()
+        api_usage_buffer.flush_api_usage()
+        APIFailedAuth.query.filter_by(user_id=user.id).delete()
+        APIUsageLog.query.filter_by(api_key_id=key.id).delete()
+        APIKey.query.filter_by(user_id=user.id).delete()
+        db.session.delete(user)
+        db.session.commit()
+
+
+def _authenticate(raw_key):
+    with app.test_request_context('/api/v1/user', headers={
+        'Authorization': f'Bearer {raw_key}', 'User-Agent': 'pytest'
+    }):
+        validate_api_key()
+        return g.api_key_id
+
+
+def test_pbkdf2_runs_only_on_cache_miss(api_key):
+    """Test repeated requests with the same key skip key derivation"""
+    key, raw_key, calls = api_key
+    assert _authenticate(raw_key) == key.id
+    assert _authenticate(raw_key) == key.id
+    assert _authenticate(raw_key) == key.id
+    assert len(calls) == 1
+
+
+def test_revocation_evicts_cached_key(api_key):
+    """Test a revoked key is refused even after it was cached"""
+    key, raw_key, calls = api_key
+    _authenticate(raw_key)
+    key.revoke('leaked')
+
+    with pytest.raises(APIError):
+        _authenticate(raw_key)
+    assert len(calls) == 2
+
+
+def test_revocation_epoch_clears_cache(api_key):
+    """Test a new global revocation timestamp empties the cache"""
+    key, raw_key, calls = api_key
+    _authenticate(raw_key)
+    api_key_cache.sync_revocation_epoch('changed-by-another-worker')
+    _authenticate(raw_key)
+    assert len(calls) == 2
@@ -0,0 +1,102 @@
+"""
+Unit tests for cursor-paginated API list endpoints
+
+These tests verify that list pages are fetched with a fixed number of queries
+whatever the page size, and that cursors walk a list without gaps or duplicates
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from app import app, db
+import api_usage_buffer
+import api_routes  # noqa: F401
+
+
+@pytest.fixture
+def referrer():
+    """A user with a read API key and 50 referrals"""
+    from models import User, APIKey, APIUsageLog, Referral
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='list_referrer', email='list_referrer@example.com', password_hash='x')
+        referred = [
+            User(username=f'list_referred_{i}', email=f'list_referred_{i}@example.com', password_hash='x')
+            for i in range(50)
+        ]
+        db.session.add_all([user] + referred)
+        db.session.flush()
+        base = datetime(2024, 1, 1)
+        for position, other in enumerate(referred):
+            # إحالتان بنفس الوقت لاختبار الترتيب الثانوي حسب المعرف
+            db.session.add(Referral(
+                referrer_id=user.id, referred_id=other.id,
+                created_at=base + timedelta(minutes=min(position, 48))
+            ))
+        db.session.commit()
+        key, raw_key = APIKey.generate_key(user.id, name='list test')
+        user_id, key_id = user.id, key.id
+        referred_ids = [other.id for other in referred]
+
+    yield app.test_client(), {'Authorization': f'Bearer {raw_key}'}
+
+    with app.app_context():
+        api_usage_buffer.flush_api_usage()
+        APIUsageLog.query.filter_by(api_key_id=key_id).delete()
+        APIKey.query.filter_by(user_id=user_id).delete()
+        Referral.query.filter_by(referrer_id=user_id).delete()
+        User.query.filter(User.id.in_(referred_ids + [user_id])).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def _count_queries(client, url, headers):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, statements
+
+
+def test_referral_page_is_not_n_plus_one(referrer):
+    """Test a page of 50 referrals costs the same queries as a page of one"""
+    client, headers = referrer
+    client.get('/api/v1/referrals?limit=1', headers=headers)  # المصادقة الأولى (PBKDF2) خارج القياس
+
+    small, small_statements = _count_queries(client, '/api/v1/referrals?limit=1', headers)
+    full, full_statements = _count_queries(client, '/api/v1/referrals?limit=50', headers)
+
+    assert small.status_code == full.status_code == 200
+    assert len(full.get_json()['data']) == 50
+    assert full.get_json()['metadata']['total_referrals'] == 0
+    assert len(full_statements) == len(small_statements)
+    list_queries = [s for s in full_statements if 'JOIN user' in s and 'FROM referral' in s]
+    assert len(list_queries) == 1
+
+
+def test_referral_cursors_walk_without_gaps(referrer):
+    """Test following next_cursor visits every referral once, newest first"""
+    client, headers = referrer
+    seen = []
+    url = '/api/v1/referrals?limit=7'
+    while True:
+        body = client.get(url, headers=headers).get_json()
+        seen.extend(item['id'] for item in body['data'])
+        cursor = body['metadata']['next_cursor']
+        if cursor is None:
+            break
+        url = f'/api/v1/referrals?limit=7&after={cursor}'
+
+    assert len(seen) == len(set(seen)) == 50
+    assert 'offset' not in body['metadata']
+
+    back = client.get(f'/api/v1/referrals?limit=7&before={body["metadata"]["prev_cursor"]}', headers=headers)
+    assert [item['id'] for item in back.get_json()['data']] == seen[-8:-1]
@@ -0,0 +1,67 @@
+"""
+Unit tests for the precompiled API rate-limit registry
+
+These tests verify that limits are parsed once per endpoint, counted per API key
+id rather than per Authorization header, and scaled by the key's permission tier
+"""
+import uuid
+
+import pytest
+from flask import g
+from app import app
+import api_utils
+from api_utils import api_rate_limit, api_rate_limits, APIError
+
+
+def _make_endpoint(**tier_limits):
+    name = f"limited_{uuid.uuid4().hex}"
+
+    def endpoint():
+        return 'ok'
+    endpoint.__name__ = name
+    return api_rate_limit("2 per minute", **tier_limits)(endpoint), name
+
+
+def _call(endpoint, key_id, permissions='read', authorization='Bearer one'):
+    with app.test_request_context('/api/v1/test', headers={'Authorization': authorization}):
+        g.api_key_id = key_id
+        g.api_key_permissions = permissions
+        return endpoint()
+
+
+def test_api_endpoints_are_registered_once():
+    """Test the API blueprint's limits are resolved at import time"""
+    import api_routes  # noqa: F401
+
+    assert str(api_rate_limits['get_user_info'][None]) == '60 per 1 minute'
+    assert str(api_rate_limits['get_user_info']['admin']) == '300 per 1 minute'
+
+
+def test_limit_is_counted_per_key_and_not_reparsed(monkeypatch):
+    """Test the counter follows the key id across Authorization values"""
+    endpoint, name = _make_endpoint()
+    monkeypatch.setattr(api_utils, 'parse_rate_limit', lambda value: pytest.fail('limit parsed per request'))
+    key_id = uuid.uuid4().int % 10 ** 9
+
+    assert _call(endpoint, key_id, authorization='Bearer one') == 'ok'
+    assert _call(endpoint, key_id, authorization='Bearer two') == 'ok'
+    with pytest.raises(APIError) as error:
+        _call(endpoint, key_id)
+    assert error.value.status_code == 429
+
+    assert _call(endpoint, key_id + 1) == 'ok'
+
+
+def test_permission_tiers_and_overrides():
+    """Test write keys get the multiplied limit and explicit overrides win"""
+    endpoint, name = _make_endpoint(admin="1 per minute")
+    key_id = uuid.uuid4().int % 10 ** 9
+
+    for _ in range(4):
+        assert _call(endpoint, key_id, permissions='write') == 'ok'
+    with pytest.raises(APIError):
+        _call(endpoint, key_id, permissions='write')
+
+    assert _call(endpoint, key_id + 1, permissions='admin') == 'ok'
+    with pytest.raises(APIError):
+        _call(endpoint, key_id + 1, permissions='admin')
@@ -0,0 +1,115 @@
+"""
+Unit tests for write-behind API usage recording
+
+These tests verify that authenticated API calls do not write to the database
+and that a flush coalesces key touches and bulk-inserts usage rows
+"""
+import pytest
+from sqlalchemy import event
+from app import app, db
+import api_usage_buffer
+from api_utils import validate_api_key, log_api_call
+
+
+@pytest.fixture
+def api_key():
+    """A fresh API key with an empty usage buffer"""
+    from models import User, APIKey, APIUsageLog
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='usage_key_user', email='usage_key_user@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        key, raw_key = APIKey.generate_key(user.id, name='usage test')
+        api_usage_buffer.flush_api_usage()
+        yield key, raw_key
+
+        api_usage_buffer.flush_api_usage()
+        APIUsageLog.query.filter_by(api_key_id=key.id).delete()
+        APIKey.query.filter_by(user_id=user.id).delete()
+        db.session.delete(user)
+        db.session.commit()
+
+
+def _call(raw_key, ip_address):
+    from flask import g
+
+    with app.test_request_context('/api/v1/user', headers={
+        'Authorization': f'Bearer {raw_key}', 'User-Agent': 'pytest'
+    }, environ_base={'REMOTE_ADDR': ip_address}):
+        validate_api_key()
+        log_api_call('get_user_info', 200, user_id=g.user_id)
+
+
+def test_api_calls_are_written_behind(api_key):
+    """Test three calls issue no writes until the buffer is flushed once"""
+    from models import APIKey, APIUsageLog
+
+    key, raw_key = api_key
+    writes = []
+
+    def count_writes(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith('SELECT'):
+            writes.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count_writes)
+    try:
+        _call(raw_key, '10.0.0.1')
+        _call(raw_key, '10.0.0.1')
+        _call(raw_key, '10.0.0.2')
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_writes)
+    assert writes == []
+
+    assert api_usage_buffer.flush_api_usage() == (1, 3)
+    db.session.expire_all()
+    stored = db.session.get(APIKey, key.id)
+    assert stored.usage_count == 3
+    assert stored.last_ip == '10.0.0.2'
+    assert stored.last_used_at is not None
+    assert stored.automation_detected is True
+    assert APIUsageLog.query.filter_by(api_key_id=key.id, endpoint='/api/v1/user').count() == 3
+
+
+def test_flush_with_nothing_pending_is_a_no_op(api_key):
+    """Test an empty buffer does not touch the database"""
+    assert api_usage_buffer.flush_api_usage() == (0, 0)
+
+
+def test_failed_flush_keeps_pending_data(api_key, monkeypatch):
+    """Test a failed write puts the batch back and merges it with newer calls"""
+    from models import APIKey
+
+    key, raw_key = api_key
+    _call(raw_key, '10.0.0.1')
+
+    def fail(connection, touches, rows):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(api_usage_buffer, '_write_usage', fail)
+    assert api_usage_buffer.flush_api_usage() == (0, 0)
+    monkeypatch.undo()
+
+    _call(raw_key, '10.0.0.3')
+    assert api_usage_buffer.get_pending_last_ip(key.id) == '10.0.0.3'
+    assert api_usage_buffer.flush_api_usage() == (1, 2)
+    db.session.expire_all()
+    stored = db.session.get(APIKey, key.id)
+    assert stored.usage_count == 2
+    assert stored.last_ip == '10.0.0.3'
+
+
+def test_flush_does_not_commit_request_session(api_key):
+    """Test flushing writes on its own connection and leaves the caller's session untouched"""
+    from models import User, APIUsageLog
+
+    key, raw_key = api_key
+    _call(raw_key, '10.0.0.1')
+    db.session.add(User(username='usage_uncommitted', email='usage_uncommitted@example.com', password_hash='x'))
+
+    assert api_usage_buffer.flush_api_usage() == (1, 1)
+    db.session.rollback()
+    assert User.query.filter_by(username='usage_uncommitted').count() == 0
+    assert APIUsageLog.query.filter_by(api_key_id=key.id).count() == 1
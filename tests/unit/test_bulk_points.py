@@ -0,0 +1,113 @@
+"""
+Unit tests for bulk admin points adjustments
+
+These tests verify that a CSV or JSON batch is validated in one pass, applied
+all-or-nothing with one ledger row per line, and that per-row results can be downloaded
+"""
+import pytest
+from app import app, db
+from bulk_points import BulkPointsError, parse_csv_rows, parse_json_rows, apply_bulk_adjustments
+
+
+@pytest.fixture
+def accounts():
+    """An admin and two users with known balances"""
+    from models import User, PointsTransaction, PointsAdjustmentBatch
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        admin = User(username='bulk_admin', email='bulk_admin@example.com', password_hash='x', is_admin=True)
+        alice = User(username='bulk_alice', email='bulk_alice@example.com', password_hash='x', points=10)
+        bob = User(username='bulk_bob', email='bulk_bob@example.com', password_hash='x', points=0)
+        db.session.add_all([admin, alice, bob])
+        db.session.commit()
+        yield admin, alice, bob
+
+        ids = [admin.id, alice.id, bob.id]
+        PointsTransaction.query.filter(PointsTransaction.user_id.in_(ids)).delete(synchronize_session=False)
+        PointsAdjustmentBatch.query.filter_by(created_by_id=admin.id).delete()
+        for user in (admin, alice, bob):
+            db.session.delete(user)
+        db.session.commit()
+
+
+def test_parse_csv_and_json_rows():
+    """Test both input formats produce the same rows and bad headers are refused"""
+    csv_rows = parse_csv_rows('username,amount,reason\nbulk_alice,5,prize\n\nbulk_bob,-1,fix\n')
+    json_rows = parse_json_rows('[{"username": "bulk_alice", "amount": 5, "reason": "prize"},'
+                                ' {"username": "bulk_bob", "amount": -1, "reason": "fix"}]')
+    assert [(r['user'], str(r['amount']), r['reason']) for r in csv_rows] == [
+        ('bulk_alice', '5', 'prize'), ('bulk_bob', '-1', 'fix')
+    ]
+    assert [(r['user'], str(r['amount']), r['reason']) for r in json_rows] == [
+        ('bulk_alice', '5', 'prize'), ('bulk_bob', '-1', 'fix')
+    ]
+
+    with pytest.raises(BulkPointsError):
+        parse_csv_rows('name,value\nbulk_alice,5\n')
+    with pytest.raises(BulkPointsError):
+        parse_json_rows('{"user": "bulk_alice"}')
+
+
+def test_batch_is_applied_with_one_ledger_row_per_line(accounts):
+    """Test balances are chained per user and every line is written to the ledger"""
+    from models import User, PointsTransaction
+
+    admin, alice, bob = accounts
+    rows = parse_json_rows([
+        {'user': 'bulk_alice', 'amount': -10, 'reason': 'correction'},
+        {'user_id': bob.id, 'amount': 7, 'reason': 'prize'},
+        {'user': 'bulk_alice', 'amount': 3, 'reason': 'prize'},
+    ])
+    batch = apply_bulk_adjustments(rows, admin, ip_address='127.0.0.1')
+
+    assert batch.status == 'applied'
+    assert (batch.row_count, batch.users_count, batch.total_added, batch.total_deducted) == (3, 2, 10, 10)
+    assert db.session.get(User, alice.id).points == 3
+    assert db.session.get(User, bob.id).points == 7
+
+    ledger = PointsTransaction.query.filter_by(related_id=batch.id, transaction_type='admin_adjustment').order_by(
+        PointsTransaction.id
+    ).all()
+    assert [(t.user_id, t.amount, t.balance_after) for t in ledger] == [
+        (alice.id, -10, 0), (bob.id, 7, 7), (alice.id, 3, 3)
+    ]
+    assert [r['status'] for r in batch.get_results()] == ['applied'] * 3
+
+
+def test_invalid_line_rejects_whole_batch(accounts):
+    """Test an overdraft or unknown user leaves every balance untouched"""
+    from models import User, PointsTransaction
+
+    admin, alice, bob = accounts
+    rows = parse_csv_rows(
+        'user,amount,reason\n'
+        'bulk_bob,5,prize\n'
+        'bulk_alice,-11,overdraft\n'
+        'nobody_here,1,prize\n'
+        'bulk_bob,abc,prize\n'
+    )
+    batch = apply_bulk_adjustments(rows, admin)
+
+    assert batch.status == 'rejected'
+    assert [r['status'] for r in batch.get_results()] == ['skipped', 'error', 'error', 'error']
+    assert db.session.get(User, alice.id).points == 10
+    assert db.session.get(User, bob.id).points == 0
+    assert PointsTransaction.query.filter(PointsTransaction.user_id.in_([alice.id, bob.id])).count() == 0
+
+
+def test_results_download(accounts):
+    """Test the per-row results are downloadable as CSV by an admin"""
+    admin, alice, bob = accounts
+    batch = apply_bulk_adjustments(parse_json_rows([{'user': 'bulk_bob', 'amount': 2, 'reason': 'prize'}]), admin)
+
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+        response = client.get(f'/admin/add-points/bulk/{batch.id}/results.csv')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0].startswith('row,user,user_id,username,amount')
+    assert f'bulk_bob,{bob.id},bulk_bob,2,prize,applied,2,' in lines[1]
@@ -0,0 +1,104 @@
+"""
+Unit tests for conditional GETs on read-only API endpoints
+
+These tests verify that a repeated poll with If-None-Match gets a 304 with the
+same validators, and that points and reward catalog changes produce a new ETag
+"""
+import pytest
+from app import app, db
+import api_usage_buffer
+import api_routes  # noqa: F401
+
+
+@pytest.fixture
+def api_client():
+    """A test client with a fresh read API key"""
+    from models import User, APIKey, APIUsageLog
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='etag_user', email='etag_user@example.com', password_hash='x', points=10)
+        db.session.add(user)
+        db.session.commit()
+        key, raw_key = APIKey.generate_key(user.id, name='etag test')
+        user_id, key_id = user.id, key.id
+
+    yield app.test_client(), {'Authorization': f'Bearer {raw_key}'}, user_id
+
+    with app.app_context():
+        api_usage_buffer.flush_api_usage()
+        APIUsageLog.query.filter_by(api_key_id=key_id).delete()
+        APIKey.query.filter_by(user_id=user_id).delete()
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+
+
+def test_points_poll_returns_304_until_balance_changes(api_client):
+    """Test If-None-Match gets a 304 and a points change gets a new ETag"""
+    from models import User
+
+    client, headers, user_id = api_client
+    first = client.get('/api/v1/user/points', headers=headers)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['X-Poll-Interval'] == '15'
+    assert 'max-age=15' in first.headers['Cache-Control']
+    assert first.get_json()['metadata']['poll_interval'] == 15
+
+    cached = client.get('/api/v1/user/points', headers={**headers, 'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.data == b''
+
+    with app.app_context():
+        db.session.get(User, user_id).points = 25
+        db.session.commit()
+
+    changed = client.get('/api/v1/user/points', headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['data']['points'] == 25
+
+
+def test_user_info_etag_depends_on_profile(api_client):
+    """Test the user info ETag is stable across polls and differs from points"""
+    client, headers, _ = api_client
+    first = client.get('/api/v1/user/info', headers=headers)
+    second = client.get('/api/v1/user/info', headers=headers)
+    points = client.get('/api/v1/user/points', headers=headers)
+
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert first.headers['ETag'] != points.headers['ETag']
+    assert first.headers['Last-Modified']
+
+
+def test_reward_change_bumps_catalog_version(api_client):
+    """Test adding a reward changes the rewards list ETag"""
+    from models import Reward
+
+    client, headers, _ = api_client
+    with app.app_context():
+        reward = Reward(name='etag reward', description='d', points_required=5)
+        db.session.add(reward)
+        db.session.commit()
+        reward_id = reward.id
+
+    try:
+        first = client.get('/api/v1/rewards', headers=headers)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+        assert client.get('/api/v1/rewards', headers={**headers, 'If-None-Match': etag}).status_code == 304
+        paged = client.get('/api/v1/rewards?limit=5', headers={**headers, 'If-None-Match': etag})
+        assert paged.status_code == 200
+
+        with app.app_context():
+            db.session.get(Reward, reward_id).points_required = 7
+            db.session.commit()
+
+        changed = client.get('/api/v1/rewards', headers={**headers, 'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+    finally:
+        with app.app_context():
+            Reward.query.filter_by(id=reward_id).delete()
+            db.session.commit()
@@ -0,0 +1,137 @@
+"""
+Unit tests for the process-local SystemConfig cache
+
+These tests verify that configuration reads are served from memory, that
+SystemConfig.set bumps the version, that changes made by another worker are
+picked up once the version check interval has passed, and the typed accessors
+"""
+import pytest
+from sqlalchemy import event
+from app import app, db
+import config
+import config_cache
+from config_cache import get_config_value
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """An empty cache with a long version check interval"""
+    from models import SystemConfig
+
+    monkeypatch.setattr(config, 'SYSTEM_CONFIG_CACHE_TTL', 3600)
+    app.config['TESTING'] = True
+    with app.app_context():
+        config_cache.clear_config_cache()
+        yield
+        SystemConfig.query.filter(SystemConfig.key.like('cache_test_%')).delete(synchronize_session=False)
+        db.session.commit()
+        config_cache.clear_config_cache()
+
+
+def _count_selects(callback):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        result = callback()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return result, len(statements)
+
+
+def _config_version():
+    from models import SystemConfig, CONFIG_VERSION_KEY
+    return SystemConfig.get_int(CONFIG_VERSION_KEY, 0)
+
+
+def test_reads_are_served_from_memory(cache):
+    """Test only the first read loads the configuration"""
+    from models import SystemConfig
+
+    SystemConfig.set('cache_test_origins', 'https://a.example')
+    assert get_config_value('cache_test_origins') == 'https://a.example'
+
+    value, selects = _count_selects(lambda: [get_config_value('cache_test_origins') for _ in range(50)])
+    assert value[-1] == 'https://a.example'
+    assert selects == 0
+    assert get_config_value('cache_test_missing', 'fallback') == 'fallback'
+
+
+def test_set_bumps_version_and_refreshes_writer(cache):
+    """Test SystemConfig.set increments the version and the writing process sees the new value"""
+    from models import SystemConfig, CONFIG_VERSION_KEY
+
+    SystemConfig.set('cache_test_link', 'one')
+    version = int(SystemConfig.get(CONFIG_VERSION_KEY))
+    assert get_config_value('cache_test_link') == 'one'
+
+    SystemConfig.set('cache_test_link', 'two')
+    assert int(SystemConfig.get(CONFIG_VERSION_KEY)) == version + 1
+    assert get_config_value('cache_test_link') == 'two'
+
+
+def test_other_worker_changes_after_interval(cache, monkeypatch):
+    """Test a change committed elsewhere is seen only after the interval, with one reload"""
+    from models import SystemConfig, CONFIG_VERSION_KEY
+
+    SystemConfig.set('cache_test_remote', 'old')
+    assert get_config_value('cache_test_remote') == 'old'
+
+    # عامل آخر يكتب الإعداد ويزيد الإصدار على اتصاله الخاص
+    table = SystemConfig.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.update().where(table.c.key == 'cache_test_remote').values(value='new'))
+        connection.execute(table.update().where(table.c.key == CONFIG_VERSION_KEY).values(
+            value=db.cast(db.cast(table.c.value, db.Integer) + 1, db.Text)
+        ))
+    assert get_config_value('cache_test_remote') == 'old'
+
+    monkeypatch.setattr(config, 'SYSTEM_CONFIG_CACHE_TTL', 0)
+    value, selects = _count_selects(lambda: get_config_value('cache_test_remote'))
+    assert value == 'new'
+    assert selects == 2
+
+    # الإصدار لم يتغير: التحقق منه فقط دون إعادة التحميل
+    _, selects = _count_selects(lambda: get_config_value('cache_test_remote'))
+    assert selects == 1
+
+
+def test_typed_accessors_and_settings(cache, monkeypatch):
+    """Test typed reads and config.py defaults overridden from the snapshot"""
+    from models import SystemConfig
+    from config_cache import get_setting
+
+    SystemConfig.set('cache_test_int', '42')
+    SystemConfig.set('cache_test_list', 'a, b,,c')
+    SystemConfig.set('cache_test_json', '{"x": 1}')
+    assert SystemConfig.get_int('cache_test_int') == 42
+    assert SystemConfig.get_int('cache_test_list', 7) == 7
+    assert SystemConfig.get_list('cache_test_list') == ['a', 'b', 'c']
+    assert SystemConfig.get_json('cache_test_json') == {'x': 1}
+    assert SystemConfig.get_bool('cache_test_missing', True) is True
+
+    monkeypatch.setattr(config, 'cache_test_flag', False, raising=False)
+    assert get_setting('cache_test_flag') is False
+    SystemConfig.set('cache_test_flag', 'on')
+    assert get_setting('cache_test_flag') is True
+
+
+def test_reward_changes_bump_version(cache):
+    """Test mapper-level writes to system_config also invalidate the snapshot after commit"""
+    from models import Reward, REWARD_CATALOG_VERSION_KEY
+
+    before = _config_version()
+    reward = Reward(name='cache reward', description='d', points_required=1)
+    db.session.add(reward)
+    db.session.commit()
+    try:
+        assert _config_version() == before + 1
+        assert get_config_value(REWARD_CATALOG_VERSION_KEY)
+    finally:
+        db.session.delete(reward)
+        db.session.commit()
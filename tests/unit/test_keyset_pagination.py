@@ -0,0 +1,83 @@
+"""
+Unit tests for keyset pagination
+
+These tests verify that cursor pages walk a list forwards and backwards
+without gaps or duplicates, including rows sharing the same timestamp
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from app import app, db
+from keyset_pagination import keyset_paginate, encode_cursor, decode_cursor
+
+
+@pytest.fixture
+def transactions():
+    """Seven transactions for one user, two of them with the same timestamp"""
+    from models import User, PointsTransaction
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='keyset_user', email='keyset@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        base = datetime(2024, 1, 1)
+        times = [base + timedelta(minutes=i) for i in range(6)] + [base + timedelta(minutes=5)]
+        for position, created_at in enumerate(times):
+            db.session.add(PointsTransaction(
+                user_id=user.id, amount=1, balance_after=position + 1,
+                transaction_type='test', created_at=created_at
+            ))
+        db.session.commit()
+        yield user
+
+        PointsTransaction.query.filter_by(user_id=user.id).delete()
+        db.session.delete(user)
+        db.session.commit()
+
+
+def test_cursor_round_trip():
+    """Test cursors decode to the encoded position and garbage is ignored"""
+    position = (datetime(2024, 1, 1, 12, 30), 42)
+    assert decode_cursor(encode_cursor(position)) == position
+    assert decode_cursor('not-a-cursor') is None
+
+
+def test_pages_walk_forwards_and_backwards(transactions):
+    """Test next and previous cursors cover every row exactly once"""
+    from models import PointsTransaction
+
+    query = PointsTransaction.query.filter_by(user_id=transactions.id)
+
+    def page(**cursor):
+        return keyset_paginate(query, PointsTransaction.created_at, PointsTransaction.id, 3,
+                               count_key=('keyset_test', transactions.id), **cursor)
+
+    first = page()
+    assert first.total == 7
+    assert first.has_prev is False
+    second = page(after=first.next_cursor)
+    third = page(after=second.next_cursor)
+    assert third.has_next is False
+
+    seen = [t.balance_after for p in (first, second, third) for t in p.items]
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+    back = page(before=third.prev_cursor)
+    assert [t.balance_after for t in back.items] == [4, 3, 2]
+    assert [t.balance_after for t in page(before=back.prev_cursor).items] == [7, 6, 5]
+
+
+def test_count_cache_is_bounded(transactions, monkeypatch):
+    """Test the count cache keeps only the most recently used filter sets"""
+    import config
+    import keyset_pagination
+    from models import PointsTransaction
+
+    monkeypatch.setattr(config, 'ADMIN_COUNT_CACHE_SIZE', 2)
+    monkeypatch.setattr(keyset_pagination, '_count_cache', keyset_pagination.OrderedDict())
+    query = PointsTransaction.query.filter_by(user_id=transactions.id)
+
+    for search in ('a', 'b', 'a', 'c'):
+        assert keyset_pagination.get_cached_count(('keyset_lru', search), query) == 7
+    assert list(keyset_pagination._count_cache) == [('keyset_lru', 'a'), ('keyset_lru', 'c')]
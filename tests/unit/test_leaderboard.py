@@ -0,0 +1,106 @@
+"""
+Unit tests for the in-memory leaderboard
+
+These tests verify ranking on the indexable skiplist and that committed
+balance changes are applied to the leaderboard incrementally
+"""
+import random
+
+import pytest
+from app import app, db
+from leaderboard import IndexableSkiplist, Leaderboard, points_leaderboard, rebuild_points_leaderboard
+
+
+def test_skiplist_matches_sorted_list():
+    """Test positions and ranks match a plain sorted list after inserts and removals"""
+    skiplist = IndexableSkiplist()
+    keys = random.sample(range(10000), 500)
+    for key in keys:
+        skiplist.insert(key)
+    for key in keys[:200]:
+        skiplist.remove(key)
+
+    expected = sorted(keys[200:])
+    assert len(skiplist) == len(expected)
+    assert [skiplist[i] for i in range(len(expected))] == expected
+    assert skiplist.slice(10, 20) == expected[10:20]
+    for position, key in enumerate(expected):
+        assert skiplist.rank(key) == position
+
+    with pytest.raises(KeyError):
+        skiplist.remove(keys[0])
+
+
+def test_leaderboard_rank_top_and_around():
+    """Test ordering by points descending with ties broken by user id"""
+    board = Leaderboard()
+    board.load([(1, 'a', 10), (2, 'b', 30), (3, 'c', 20), (4, 'd', 20)])
+
+    assert [entry.user_id for entry in board.top(3)] == [2, 3, 4]
+    assert board.rank(1) == 4
+
+    board.set(1, 25)
+    assert board.rank(1) == 2
+    assert board.top(2)[1].username == 'a'
+    assert [entry.rank for entry in board.around(3, radius=1)] == [2, 3, 4]
+
+    board.remove(2)
+    assert board.rank(2) is None
+    assert board.top(1)[0].user_id == 1
+
+
+def test_committed_points_update_leaderboard():
+    """Test add_points and the atomic increment move the user on the leaderboard after commit"""
+    from models import User, PointsTransaction
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        rebuild_points_leaderboard()
+        user = User(username='leaderboard_user', email='leaderboard@example.com', password_hash='x', points=0)
+        db.session.add(user)
+        db.session.commit()
+        try:
+            assert user.id in points_leaderboard
+
+            user.add_points(1000000, 'test')
+            assert points_leaderboard.rank(user.id) == 1
+            assert points_leaderboard.top(1)[0].points == user.points
+
+            User.increment_points(user.id, 5)
+            db.session.rollback()
+            assert points_leaderboard.top(1)[0].points == 1000000
+
+            User.increment_points(user.id, 5)
+            db.session.commit()
+            assert points_leaderboard.top(1)[0].points == 1000005
+        finally:
+            PointsTransaction.query.filter_by(user_id=user.id).delete()
+            db.session.delete(user)
+            db.session.commit()
+            points_leaderboard.remove(user.id)
+
+
+def test_requests_never_rebuild_a_stale_board(monkeypatch):
+    """Test the board is built by the background refresher and a stale board is served as is"""
+    import leaderboard
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        board = Leaderboard()
+        monkeypatch.setattr(leaderboard, 'points_leaderboard', board)
+        monkeypatch.setattr(leaderboard, '_refresher_thread', None)
+        monkeypatch.setattr(leaderboard, '_refresher_pid', None)
+
+        thread = leaderboard.start_leaderboard_refresher(interval=3600)
+        assert leaderboard.start_leaderboard_refresher() is thread
+        for _ in range(100):
+            if board.built_at is not None:
+                break
+            thread.join(0.05)
+        assert board.built_at is not None
+
+        board.built_at -= 10 * leaderboard.config.LEADERBOARD_REBUILD_INTERVAL
+        stale_at = board.built_at
+        monkeypatch.setattr(leaderboard, 'rebuild_points_leaderboard', lambda: pytest.fail('rebuilt inline'))
+        assert leaderboard.get_points_leaderboard() is board
+        assert board.built_at == stale_at
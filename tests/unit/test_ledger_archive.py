@@ -0,0 +1,124 @@
+"""
+Unit tests for the ledger archive
+
+These tests verify that verified transactions of closed months move to
+compressed archive files and that a user's history still reads through them
+"""
+from datetime import datetime, date
+
+import pytest
+from app import app, db
+import config
+import keyset_pagination
+from ledger_reconcile import reconcile_ledger
+from ledger_archive import archive_closed_months, get_user_transactions_page, get_hot_cutoff
+
+
+@pytest.fixture
+def user(tmp_path, monkeypatch):
+    """User with three old transactions and two recent ones"""
+    from models import (User, PointsTransaction, LedgerCheckpoint, LedgerArchive,
+                        LedgerArchiveUser, PointsRollup)
+
+    monkeypatch.setattr(config, 'LEDGER_ARCHIVE_DIR', str(tmp_path))
+    monkeypatch.setattr(keyset_pagination, '_count_cache', keyset_pagination.OrderedDict())
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='archive_user', email='archive@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        for _ in range(5):
+            user.add_points(1, 'test')
+
+        transactions = PointsTransaction.query.filter_by(user_id=user.id).order_by(PointsTransaction.id).all()
+        for transaction in transactions[:3]:
+            transaction.created_at = datetime(2020, 1, 15)
+        db.session.commit()
+        yield user
+
+        archive_ids = [archive_id for (archive_id,) in db.session.query(LedgerArchiveUser.archive_id).filter_by(user_id=user.id)]
+        LedgerArchiveUser.query.filter_by(user_id=user.id).delete()
+        LedgerArchive.query.filter(LedgerArchive.id.in_(archive_ids)).delete(synchronize_session=False)
+        LedgerCheckpoint.query.filter_by(user_id=user.id).delete()
+        PointsTransaction.query.filter_by(user_id=user.id).delete()
+        PointsRollup.query.filter_by(user_id=user.id).delete()
+        db.session.delete(user)
+        db.session.commit()
+
+
+def test_hot_cutoff():
+    """Test the hot window keeps the current month and the previous ones"""
+    assert get_hot_cutoff(date(2024, 2, 10)) == date(2023, 12, 1)
+
+
+def test_only_verified_closed_months_are_archived(user):
+    """Test unverified rows stay hot and verified rows are moved and read back in order"""
+    from models import PointsTransaction
+
+    assert archive_closed_months() == {}
+
+    reconcile_ledger()
+    summary = archive_closed_months()
+    assert summary['2020-01'] == 3
+    assert PointsTransaction.query.filter_by(user_id=user.id).count() == 2
+
+    page = get_user_transactions_page(user, 4)
+    assert page.total == 5
+    assert [t.balance_after for t in page.items] == [5, 4, 3, 2]
+    assert getattr(page.items[2], 'archived', False) is True
+    assert page.items[2].user is user
+
+    second_page = get_user_transactions_page(user, 4, after=page.next_cursor)
+    assert [t.balance_after for t in second_page.items] == [1]
+    assert second_page.items[0].created_at == datetime(2020, 1, 15)
+    assert second_page.has_next is False
+
+
+def test_reward_rows_stay_hot_and_list_in_order(user):
+    """Test competition_reward rows are never archived and still read between archived rows"""
+    from models import PointsTransaction
+
+    oldest = PointsTransaction.query.filter_by(user_id=user.id).order_by(PointsTransaction.id).first()
+    oldest.transaction_type = 'competition_reward'
+    oldest.related_id = 77
+    db.session.commit()
+
+    reconcile_ledger()
+    assert archive_closed_months()['2020-01'] == 2
+    assert PointsTransaction.query.filter_by(
+        user_id=user.id, transaction_type='competition_reward', related_id=77
+    ).first() is not None
+
+    page = get_user_transactions_page(user, 3)
+    second_page = get_user_transactions_page(user, 3, after=page.next_cursor)
+    assert [t.balance_after for t in page.items + second_page.items] == [5, 4, 3, 2, 1]
+    assert getattr(second_page.items[-1], 'archived', False) is False
+    assert second_page.has_next is False
+
+
+def test_api_transactions_page_through_archive(user):
+    """Test the API transaction list continues from the hot table into the archive"""
+    import api_routes  # noqa: F401
+    import api_usage_buffer
+    from models import APIKey, APIUsageLog
+
+    reconcile_ledger()
+    archive_closed_months()
+    key, raw_key = APIKey.generate_key(user.id, name='archive api test')
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {raw_key}'}
+
+    try:
+        balances, cursor = [], None
+        for _ in range(3):
+            url = '/api/v1/user/transactions?limit=2' + (f'&after={cursor}' if cursor else '')
+            body = client.get(url, headers=headers).get_json()
+            balances += [item['balance_after'] for item in body['data']]
+            cursor = body['metadata']['next_cursor']
+        assert balances == [5, 4, 3, 2, 1]
+        assert cursor is None
+    finally:
+        api_usage_buffer.flush_api_usage()
+        APIUsageLog.query.filter_by(api_key_id=key.id).delete()
+        APIKey.query.filter_by(user_id=user.id).delete()
+        db.session.commit()
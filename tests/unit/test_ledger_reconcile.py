@@ -0,0 +1,77 @@
+"""
+Unit tests for the ledger reconciler
+
+These tests verify that broken balance chains and balance mismatches are
+reported and that clean chains are checkpointed
+"""
+import pytest
+from app import app, db
+from ledger_reconcile import reconcile_ledger, DISCREPANCY_CHAIN, DISCREPANCY_BALANCE
+
+
+@pytest.fixture
+def users():
+    """Two users with a short ledger each"""
+    from models import User, PointsTransaction, LedgerCheckpoint
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        users = [
+            User(username=f'reconcile_user_{i}', email=f'reconcile_{i}@example.com', password_hash='x')
+            for i in range(2)
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+        for user in users:
+            user.add_points(10, 'test')
+            user.use_points(4, 'test')
+        yield users
+
+        user_ids = [user.id for user in users]
+        LedgerCheckpoint.query.filter(LedgerCheckpoint.user_id.in_(user_ids)).delete(synchronize_session=False)
+        PointsTransaction.query.filter(PointsTransaction.user_id.in_(user_ids)).delete(synchronize_session=False)
+        for user in users:
+            db.session.delete(user)
+        db.session.commit()
+
+
+def _user_discrepancies(report, user_ids):
+    return [(d.user_id, d.kind) for d in report.discrepancies if d.user_id in user_ids]
+
+
+def test_clean_ledger_is_checkpointed(users):
+    """Test consistent chains produce no discrepancies and advance the checkpoints"""
+    from models import LedgerCheckpoint
+
+    user_ids = {user.id for user in users}
+    assert _user_discrepancies(reconcile_ledger(), user_ids) == []
+
+    checkpoint = LedgerCheckpoint.query.filter_by(user_id=users[0].id).one()
+    assert checkpoint.balance == 6
+
+    # the next run starts after the checkpoint and only walks new transactions
+    users[0].add_points(1, 'test')
+    report = reconcile_ledger()
+    assert _user_discrepancies(report, user_ids) == []
+    assert LedgerCheckpoint.query.filter_by(user_id=users[0].id).one().balance == 7
+
+
+def test_broken_chain_and_balance_are_reported(users):
+    """Test a tampered balance_after and an off-ledger balance change are reported"""
+    from models import User, PointsTransaction
+
+    first, second = users
+    transaction = PointsTransaction.query.filter_by(user_id=first.id).order_by(PointsTransaction.id).first()
+    transaction.balance_after = 99
+    db.session.execute(
+        db.update(User).where(User.id == second.id).values(points=50)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    report = reconcile_ledger()
+    assert sorted(_user_discrepancies(report, {first.id, second.id})) == sorted([
+        (first.id, DISCREPANCY_CHAIN),
+        (first.id, DISCREPANCY_CHAIN),
+        (second.id, DISCREPANCY_BALANCE),
+    ])
@@ -0,0 +1,62 @@
+"""
+Unit tests for the shared SQLite rate-limit storage
+
+These tests verify that counters are shared between storage instances and
+processes on the same file, so a limit holds across all server workers
+"""
+import multiprocessing
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+from limiter_storage import SQLiteLimiterStorage
+
+
+def _acquire_many(uri, attempts):
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    limit = parse('5 per minute')
+    return sum(1 for _ in range(attempts) if limiter.hit(limit, 'register', '203.0.113.7'))
+
+
+def test_uri_scheme_is_registered(tmp_path):
+    """Test the sqlite:// scheme resolves to the shared storage"""
+    storage = storage_from_string(f'sqlite:///{tmp_path}/limits.sqlite')
+    assert isinstance(storage, SQLiteLimiterStorage)
+    assert storage.check() is True
+
+
+def test_counters_are_shared_between_instances(tmp_path):
+    """Test two workers' storages see and expire the same counter"""
+    uri = f'sqlite:///{tmp_path}/limits.sqlite'
+    first, second = storage_from_string(uri), storage_from_string(uri)
+
+    assert first.incr('key', 60) == 1
+    assert second.incr('key', 60) == 2
+    assert first.get('key') == 2
+    assert first.get_expiry('key') > 0
+
+    assert second.incr('short', 0) == 1
+    assert first.get('short') == 0
+    assert first.incr('short', 60) == 1
+
+    limiter = FixedWindowRateLimiter(first)
+    limit = parse('2 per minute')
+    assert limiter.hit(limit, 'login') is True
+    assert FixedWindowRateLimiter(second).hit(limit, 'login') is True
+    assert limiter.hit(limit, 'login') is False
+
+    assert first.reset() >= 1
+    assert second.get('key') == 0
+
+
+def test_sliding_window_limit_holds_across_processes(tmp_path):
+    """Test four processes share one '5 per minute' budget"""
+    uri = f'sqlite:///{tmp_path}/limits.sqlite'
+    storage_from_string(uri)
+
+    context = multiprocessing.get_context('fork')
+    with context.Pool(4) as pool:
+        acquired = pool.starmap(_acquire_many, [(uri, 5)] * 4)
+
+    assert sum(acquired) == 5
@@ -0,0 +1,72 @@
+"""
+Unit tests for the points ledger
+
+These tests verify that balance changes are applied inside the database
+so stale in-memory balances cannot lose concurrent updates
+"""
+import pytest
+from app import app, db
+
+
+@pytest.fixture
+def users():
+    """Two users with a small balance"""
+    from models import User, PointsTransaction
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        users = [
+            User(username=f'ledger_user_{i}', email=f'ledger_{i}@example.com', password_hash='x', points=10)
+            for i in range(2)
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+        yield users
+
+        user_ids = [user.id for user in users]
+        PointsTransaction.query.filter(PointsTransaction.user_id.in_(user_ids)).delete(synchronize_session=False)
+        for user in users:
+            db.session.delete(user)
+        db.session.commit()
+
+
+def _simulate_concurrent_credit(user, amount):
+    """Credit the user from "another request" without refreshing the loaded object"""
+    from models import User
+
+    db.session.execute(
+        db.update(User).where(User.id == user.id).values(points=User.points + amount)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def test_add_and_use_points_do_not_lose_concurrent_updates(users):
+    """Test balances and balance_after are computed from the database value"""
+    from models import User, PointsTransaction
+
+    user = users[0]
+    _simulate_concurrent_credit(user, 5)
+
+    assert user.add_points(3, 'test') is True
+    assert user.use_points(4, 'test') is True
+    assert user.points == 14
+
+    transactions = PointsTransaction.query.filter_by(user_id=user.id).order_by(PointsTransaction.id).all()
+    assert [t.balance_after for t in transactions] == [18, 14]
+    assert db.session.query(User.points).filter_by(id=user.id).scalar() == 14
+
+
+def test_deductions_require_sufficient_funds(users):
+    """Test use_points and transfer_points refuse to overdraw the sender"""
+    from models import User, PointsTransaction
+
+    sender, receiver = users
+    assert sender.use_points(11, 'test') is False
+    assert User.transfer_points(sender.id, receiver.id, 11, 'test') is False
+
+    assert User.transfer_points(sender.id, receiver.id, 10, 'test') is True
+    assert (sender.points, receiver.points) == (0, 20)
+    assert PointsTransaction.query.filter(
+        PointsTransaction.user_id.in_([sender.id, receiver.id])
+    ).count() == 2
@@ -0,0 +1,67 @@
+"""
+Unit tests for the periodic points rollups
+
+These tests verify that ledger writes are rolled up per period and that
+period leaderboards rank users by points earned in the period
+"""
+from datetime import datetime, date
+
+import pytest
+from app import app, db
+from points_rollup import get_period_start, get_period_leaderboard, get_period_rank, normalize_period
+
+
+def test_period_start():
+    """Test period boundaries for day, week (Monday) and month"""
+    moment = datetime(2024, 5, 16, 13, 30)  # Thursday
+    assert get_period_start('day', moment) == date(2024, 5, 16)
+    assert get_period_start('week', moment) == date(2024, 5, 13)
+    assert get_period_start('month', moment) == date(2024, 5, 1)
+    assert normalize_period('weekly') == 'week'
+    assert normalize_period('year') is None
+
+
+@pytest.fixture
+def users():
+    """Two users with no ledger history"""
+    from models import User, PointsRollup, PointsTransaction
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        users = [
+            User(username=f'rollup_user_{i}', email=f'rollup_{i}@example.com', password_hash='x')
+            for i in range(2)
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+        yield users
+
+        user_ids = [user.id for user in users]
+        PointsRollup.query.filter(PointsRollup.user_id.in_(user_ids)).delete(synchronize_session=False)
+        PointsTransaction.query.filter(PointsTransaction.user_id.in_(user_ids)).delete(synchronize_session=False)
+        for user in users:
+            db.session.delete(user)
+        db.session.commit()
+
+
+def test_transactions_are_rolled_up_per_period(users):
+    """Test earned points accumulate per period while spending only changes the net"""
+    from models import PointsRollup
+
+    first, second = users
+    first.add_points(30, 'test')
+    first.add_points(20, 'test')
+    first.use_points(10, 'test')
+    second.add_points(40, 'test')
+
+    rollup = PointsRollup.query.filter_by(
+        user_id=first.id, period_type='week', period_start=get_period_start('week')
+    ).one()
+    assert rollup.points_earned == 50
+    assert rollup.net_points == 40
+    assert rollup.transactions_count == 3
+    assert PointsRollup.query.filter_by(user_id=first.id).count() == 3
+
+    leaders = [entry.user_id for entry in get_period_leaderboard('month', limit=100)]
+    assert leaders.index(first.id) < leaders.index(second.id)
+    assert get_period_rank('month', second.id) > get_period_rank('month', first.id)
@@ -0,0 +1,148 @@
+"""
+Unit tests for the batch regrading engine
+
+These tests verify that changing the answer key rescores stored answers
+and settles user balances with adjustment transactions
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from app import app, db
+from answer_key import invalidate_answer_key
+from regrade import regrade_competition, REGRADE_TRANSACTION_TYPE
+
+
+@pytest.fixture
+def competition():
+    """Competition with one question answered by two users"""
+    from models import User, Competition, Question, Participation, ParticipationAnswer, PointsTransaction
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        competition = Competition(
+            title='regrade test',
+            description='regrade test',
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=1)
+        )
+        users = [
+            User(username=f'regrade_user_{i}', email=f'regrade_{i}@example.com', password_hash='x', points=10)
+            for i in range(2)
+        ]
+        db.session.add(competition)
+        db.session.add_all(users)
+        db.session.flush()
+
+        question = Question(
+            competition_id=competition.id,
+            text='2 + 2',
+            options=json.dumps(['3', '4']),
+            correct_answer='1'
+        )
+        db.session.add(question)
+        db.session.flush()
+
+        # the first user answered the (old) correct option and was credited 2 points
+        for user, answer, correct in zip(users, ['1', '0'], [True, False]):
+            participation = Participation(
+                user_id=user.id,
+                competition_id=competition.id,
+                completed=True,
+                score=2 if correct else 0,
+                correct_answers=1 if correct else 0,
+                answers_data=json.dumps({str(question.id): answer})
+            )
+            db.session.add(participation)
+            db.session.flush()
+            db.session.add(ParticipationAnswer(
+                participation_id=participation.id,
+                competition_id=competition.id,
+                question_id=question.id,
+                user_id=user.id,
+                answer=answer,
+                is_correct=correct,
+                points_earned=2 if correct else 0
+            ))
+        db.session.commit()
+        yield competition, question, users
+
+        ParticipationAnswer.query.filter_by(competition_id=competition.id).delete()
+        Participation.query.filter_by(competition_id=competition.id).delete()
+        PointsTransaction.query.filter_by(related_id=competition.id, transaction_type=REGRADE_TRANSACTION_TYPE).delete()
+        Question.query.filter_by(competition_id=competition.id).delete()
+        for user in users:
+            db.session.delete(user)
+        db.session.delete(competition)
+        db.session.commit()
+
+
+def test_regrade_after_answer_key_change(competition):
+    """Test fixing the correct answer moves points between participants"""
+    from models import Participation, ParticipationAnswer, PointsTransaction
+
+    competition, question, users = competition
+    question.correct_answer = '0'
+    invalidate_answer_key(competition.id)
+    db.session.commit()
+
+    summary = regrade_competition(competition)
+    assert summary['changed'] == 2
+    assert summary['adjusted_users'] == 2
+    assert summary['points_delta'] == 0
+
+    scores = {
+        p.user_id: (p.score, p.correct_answers)
+        for p in Participation.query.filter_by(competition_id=competition.id)
+    }
+    assert scores[users[0].id] == (0, 0)
+    assert scores[users[1].id] == (2, 1)
+
+    answer = ParticipationAnswer.query.filter_by(user_id=users[1].id, question_id=question.id).first()
+    assert answer.is_correct is True
+    assert answer.correct_answer_text == '3'
+
+    db.session.refresh(users[0])
+    db.session.refresh(users[1])
+    assert users[0].points == 8
+    assert users[1].points == 12
+
+    transactions = PointsTransaction.query.filter_by(
+        related_id=competition.id, transaction_type=REGRADE_TRANSACTION_TYPE
+    ).all()
+    assert sorted(t.amount for t in transactions) == [-2, 2]
+
+    # a second pass with the same key changes nothing
+    assert regrade_competition(competition)['changed'] == 0
+
+
+def test_regrade_runs_from_the_grading_queue(competition):
+    """Test an enqueued regrade is deduplicated while pending and settled by a grading worker"""
+    from models import GradingJob
+    from grading import enqueue_regrade, get_pending_regrade, process_grading_jobs
+
+    competition, question, users = competition
+    question.correct_answer = '0'
+    invalidate_answer_key(competition.id)
+    db.session.commit()
+
+    try:
+        job = enqueue_regrade(competition, users[0])
+        db.session.commit()
+        assert enqueue_regrade(competition, users[0]).id == job.id
+        assert get_pending_regrade(competition.id).id == job.id
+
+        # nothing changes until a worker picks the job up
+        db.session.refresh(users[0])
+        assert users[0].points == 10
+
+        assert process_grading_jobs() == 1
+        assert db.session.get(GradingJob, job.id).status == 'done'
+        assert get_pending_regrade(competition.id) is None
+
+        db.session.refresh(users[0])
+        db.session.refresh(users[1])
+        assert (users[0].points, users[1].points) == (8, 12)
+    finally:
+        GradingJob.query.filter_by(competition_id=competition.id).delete()
+        db.session.commit()
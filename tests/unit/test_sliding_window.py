@@ -0,0 +1,88 @@
+"""
+Unit tests for in-memory sliding-window counters
+
+These tests verify window expiry, distinct-value counting, idle key eviction
+and that API abuse detection runs without database queries
+"""
+import pytest
+from sqlalchemy import event
+from app import app, db
+from sliding_window import SlidingWindowCounter, SlidingWindowSet
+import api_utils
+
+
+def test_counter_slides_with_time():
+    """Test events leave the window bucket by bucket"""
+    counter = SlidingWindowCounter(60, 10)
+    assert counter.add('k', now=0) == 1
+    assert counter.add('k', now=15) == 2
+    assert counter.add('k', amount=3, now=55) == 5
+    assert counter.count('k', now=65) == 4
+    assert counter.count('k', now=75) == 3
+    assert counter.count('k', now=200) == 0
+    assert counter.count('other', now=0) == 0
+
+
+def test_set_counts_distinct_values_in_window():
+    """Test repeated values count once and old values expire"""
+    ips = SlidingWindowSet(3600)
+    assert ips.add(1, '10.0.0.1', now=0) == 1
+    assert ips.add(1, '10.0.0.1', now=10) == 1
+    assert ips.add(1, '10.0.0.2', now=20) == 2
+    assert ips.add(1, '10.0.0.3', now=3605) == 3
+    assert ips.count(1, now=3615) == 2
+    assert ips.count(2, now=0) == 0
+
+
+def test_idle_and_excess_keys_are_evicted():
+    """Test tracked keys stay bounded"""
+    counter = SlidingWindowCounter(60, 1, max_keys=2)
+    counter.add('a', now=0)
+    counter.add('b', now=1)
+    counter.add('c', now=2)
+    assert counter.count('a', now=2) == 0
+    assert counter.count('c', now=2) == 1
+
+    counter.add('d', now=100)
+    assert counter.count('b', now=100) == 0
+
+
+def test_abuse_detection_issues_no_queries():
+    """Test suspicious usage and failed auth thresholds are answered from memory"""
+    class Key:
+        id = 987654
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        api_utils.api_key_calls.reset(Key.id)
+        api_utils.api_key_ips.reset(Key.id)
+        api_utils.failed_auth_attempts.reset('203.0.113.9')
+
+        statements = []
+
+        def count_statements(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statements)
+        try:
+            reasons = [
+                api_utils.detect_suspicious_usage(Key, False, False, '10.0.0.1')
+                for _ in range(api_utils.HIGH_FREQUENCY_CALLS + 5)
+            ]
+            for _ in range(api_utils.FAILED_AUTH_ATTEMPTS - 1):
+                api_utils.log_failed_auth_attempt(None, 'invalid_key_hash', '203.0.113.9')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+
+        assert statements == []
+        assert reasons.count('high_frequency') == 1
+        assert reasons[api_utils.HIGH_FREQUENCY_CALLS] == 'high_frequency'
+
+        api_utils.api_key_ips.reset(Key.id)
+        for index in range(api_utils.MULTIPLE_IPS):
+            assert api_utils.detect_suspicious_usage(Key, True, False, f'10.0.1.{index}') != 'multiple_ips'
+        assert api_utils.detect_suspicious_usage(Key, True, False, '10.0.2.1') == 'multiple_ips'
+
+        api_utils.api_key_calls.reset(Key.id)
+        api_utils.api_key_ips.reset(Key.id)
+        api_utils.failed_auth_attempts.reset('203.0.113.9')
@@ -0,0 +1,96 @@
+"""
+Unit tests for streaming history exports
+
+These tests verify that the transaction export streams hot and archived rows
+in (created_at, id) order as NDJSON or CSV, and resumes from a row's cursor
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from app import app, db
+import config
+import api_usage_buffer
+import api_routes  # noqa: F401
+from ledger_reconcile import reconcile_ledger
+from ledger_archive import archive_closed_months
+from streaming_export import merge_sorted_rows
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    """A user with three archived and two hot transactions, and a read API key"""
+    from models import (User, APIKey, APIUsageLog, PointsTransaction, LedgerCheckpoint,
+                        LedgerArchive, LedgerArchiveUser, PointsRollup)
+
+    monkeypatch.setattr(config, 'LEDGER_ARCHIVE_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'EXPORT_BATCH_SIZE', 2)
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='export_user', email='export_user@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        for _ in range(5):
+            user.add_points(1, 'test')
+        transactions = PointsTransaction.query.filter_by(user_id=user.id).order_by(PointsTransaction.id).all()
+        for transaction in transactions[:3]:
+            transaction.created_at = datetime(2020, 1, 15)
+        db.session.commit()
+        reconcile_ledger()
+        archive_closed_months()
+        key, raw_key = APIKey.generate_key(user.id, name='export test')
+        user_id, key_id = user.id, key.id
+
+    yield app.test_client(), {'Authorization': f'Bearer {raw_key}'}
+
+    with app.app_context():
+        api_usage_buffer.flush_api_usage()
+        APIUsageLog.query.filter_by(api_key_id=key_id).delete()
+        APIKey.query.filter_by(user_id=user_id).delete()
+        archive_ids = [archive_id for (archive_id,) in db.session.query(LedgerArchiveUser.archive_id).filter_by(user_id=user_id)]
+        LedgerArchiveUser.query.filter_by(user_id=user_id).delete()
+        LedgerArchive.query.filter(LedgerArchive.id.in_(archive_ids)).delete(synchronize_session=False)
+        LedgerCheckpoint.query.filter_by(user_id=user_id).delete()
+        PointsTransaction.query.filter_by(user_id=user_id).delete()
+        PointsRollup.query.filter_by(user_id=user_id).delete()
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+
+
+def test_merge_sorted_rows():
+    """Test table rows and archive dicts interleave by (created_at, id)"""
+    hot = [{'id': 2, 'created_at': datetime(2024, 1, 2)}, {'id': 5, 'created_at': datetime(2024, 1, 3)}]
+    archived = [{'id': 1, 'created_at': datetime(2024, 1, 1)}, {'id': 4, 'created_at': datetime(2024, 1, 2)}]
+    assert [row['id'] for row in merge_sorted_rows(iter(hot), iter(archived))] == [1, 2, 4, 5]
+
+
+def test_ndjson_export_includes_archive_and_resumes(exporter):
+    """Test the NDJSON export streams all five rows oldest first and resumes after a cursor"""
+    client, headers = exporter
+    response = client.get('/api/v1/user/transactions/export', headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record['balance_after'] for record in records] == [1, 2, 3, 4, 5]
+    assert records[0]['created_at'] == '2020-01-15T00:00:00'
+
+    resumed = client.get(f'/api/v1/user/transactions/export?since={records[2]["cursor"]}', headers=headers)
+    assert [json.loads(line)['balance_after'] for line in resumed.get_data(as_text=True).splitlines()] == [4, 5]
+
+    from_archive = client.get(f'/api/v1/user/transactions/export?since={records[0]["cursor"]}', headers=headers)
+    assert len(from_archive.get_data(as_text=True).splitlines()) == 4
+
+
+def test_csv_export_and_unknown_format(exporter):
+    """Test the CSV export has a header with a cursor column and unknown formats are rejected"""
+    client, headers = exporter
+    response = client.get('/api/v1/user/transactions/export?format=csv', headers=headers)
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['id', 'amount', 'balance_after', 'transaction_type', 'description', 'created_at', 'cursor']
+    assert len(rows) == 6
+
+    assert client.get('/api/v1/user/transactions/export?format=xml', headers=headers).status_code == 400
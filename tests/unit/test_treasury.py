@@ -0,0 +1,108 @@
+"""
+Unit tests for the sharded admin treasury
+
+These tests verify that admin grants are paid from escrow shards refilled
+in blocks from the central admin account, with every refill and grant recorded
+on a per-shard balance chain
+"""
+import pytest
+from app import app, db
+import config
+import treasury
+
+
+@pytest.fixture
+def accounts():
+    """Central admin with a funded balance and a new user"""
+    from models import User, PointsTransaction, TreasuryShard
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        admin = User(username='treasury_admin', email='treasury_admin@example.com', password_hash='x',
+                     is_admin=True, points=1000)
+        user = User(username='treasury_user', email='treasury_user@example.com', password_hash='x')
+        db.session.add_all([admin, user])
+        db.session.commit()
+        treasury._central_admin_id = None
+        treasury.ensure_treasury_shards()
+        yield admin, user
+
+        PointsTransaction.query.filter(
+            PointsTransaction.user_id.in_([admin.id, user.id])
+        ).delete(synchronize_session=False)
+        TreasuryShard.query.update({'balance': 0})
+        db.session.delete(admin)
+        db.session.delete(user)
+        db.session.commit()
+        treasury._central_admin_id = None
+
+
+def test_admin_grants_are_paid_from_escrow(accounts):
+    """Test the admin row is debited once per refill block, not once per grant"""
+    from models import PointsTransaction
+
+    admin, user = accounts
+    assert treasury.get_treasury_balance() == 1000
+
+    assert user.add_points(2, 'welcome_bonus', from_admin=True) is True
+    assert admin.points == 1000 - config.TREASURY_REFILL_BLOCK
+
+    assert user.add_points(3, 'referral_reward', from_admin=True) is True
+    assert admin.points == 1000 - config.TREASURY_REFILL_BLOCK
+    assert user.points == 5
+    assert treasury.get_treasury_balance() == 995
+
+    rows = PointsTransaction.query.filter_by(user_id=admin.id).order_by(PointsTransaction.id).all()
+    shard_id = rows[1].treasury_shard_id
+    assert shard_id is not None
+    assert [(t.transaction_type, t.treasury_shard_id, t.amount, t.balance_after) for t in rows] == [
+        ('treasury_refill', None, -config.TREASURY_REFILL_BLOCK, 1000 - config.TREASURY_REFILL_BLOCK),
+        ('treasury_refill', shard_id, config.TREASURY_REFILL_BLOCK, config.TREASURY_REFILL_BLOCK),
+        ('admin_deduction_welcome_bonus', shard_id, -2, config.TREASURY_REFILL_BLOCK - 2),
+        ('admin_deduction_referral_reward', shard_id, -3, config.TREASURY_REFILL_BLOCK - 5),
+    ]
+
+    assert treasury.rebalance_treasury() == config.TREASURY_REFILL_BLOCK - 5
+    moved = PointsTransaction.query.filter_by(user_id=admin.id, transaction_type='treasury_rebalance').all()
+    assert sum(t.amount for t in moved) == 0
+
+
+def test_grant_fails_when_treasury_is_empty(accounts):
+    """Test a grant larger than the whole treasury is refused"""
+    admin, user = accounts
+    assert user.add_points(1001, 'welcome_bonus', from_admin=True) is False
+    assert user.add_points(1000, 'welcome_bonus', from_admin=True) is True
+    assert treasury.get_treasury_balance() == 0
+
+
+def test_reconcile_checks_admin_and_shard_chains(accounts):
+    """Test admin and per-shard chains reconcile, and a tampered shard row is reported"""
+    from models import PointsTransaction, LedgerCheckpoint
+    from ledger_reconcile import reconcile_ledger, DISCREPANCY_CHAIN
+
+    admin, user = accounts
+    # opening balance so the admin chain starts from the seeded points
+    db.session.add(PointsTransaction(user_id=admin.id, amount=1000, balance_after=1000,
+                                     transaction_type='admin_adjustment'))
+    db.session.commit()
+    assert user.add_points(2, 'welcome_bonus', from_admin=True) is True
+    assert user.add_points(3, 'referral_reward', from_admin=True) is True
+    treasury.rebalance_treasury()
+
+    try:
+        report = reconcile_ledger(write_checkpoints=False)
+        assert [d for d in report.discrepancies if d.user_id in (admin.id, user.id)] == []
+
+        first = PointsTransaction.query.filter_by(
+            user_id=admin.id, transaction_type='admin_deduction_welcome_bonus'
+        ).one()
+        first.balance_after += 1
+        db.session.commit()
+
+        report = reconcile_ledger(write_checkpoints=False)
+        assert (admin.id, first.id, DISCREPANCY_CHAIN) in [
+            (d.user_id, d.transaction_id, d.kind) for d in report.discrepancies
+        ]
+    finally:
+        LedgerCheckpoint.query.filter(LedgerCheckpoint.user_id.in_([admin.id, user.id])).delete(synchronize_session=False)
+        db.session.commit()
@@ -0,0 +1,219 @@
+"""
+خزينة المشرف المركزي المجزأة
+منح الترحيب والإحالة كانت تخصم من صف المشرف الواحد في كل عملية، فتتسلسل جميع عمليات
+التسجيل على قفل هذا الصف. هنا تُحجز النقاط من حساب المشرف على دفعات في عدة حسابات
+ضمان فرعية (TreasuryShard)، وتخصم كل منحة من حساب فرعي عشوائي بتحديث ذري مشروط.
+
+سجل المعاملات يبقى قابلاً للتسوية صفًا بصف:
+- كل حجز دفعة يُسجل بمعاملتين treasury_refill: خصم من رصيد المشرف نفسه، وإضافة إلى الحساب الفرعي
+- كل منحة تُسجل بمعاملة admin_deduction_* مرتبطة بالحساب الفرعي (treasury_shard_id)
+- إعادة التوزيع تُسجل معاملة treasury_rebalance لكل حساب فرعي تغير رصيده
+
+في معاملات المشرف المركزي المرتبطة بحساب فرعي، balance_after هو رصيد ذلك الحساب الفرعي بعد
+العملية (من RETURNING في نفس التحديث)، وفي معاملاته الأخرى هو User.points كأي مستخدم.
+فتشكل معاملات كل حساب فرعي سلسلة مستقلة تتسلسل على قفل صفه فقط.
+"""
+
+import os
+import random
+import threading
+import time
+from sqlalchemy import func
+from app import app, db
+from models import PointsTransaction, TreasuryShard, User
+import config
+
+# معرف المشرف المركزي ومعرفات الحسابات الفرعية (ذاكرة العملية)
+_central_admin_id = None
+_shard_ids = []
+
+# خيط إعادة التوزيع ومعرف العملية التي بدأته (الخيوط لا تنتقل إلى العمليات الفرعية بعد fork)
+_rebalancer_thread = None
+_rebalancer_pid = None
+_rebalancer_lock = threading.Lock()
+
+
+def get_central_admin_id():
+    """معرف حساب المشرف المركزي الذي تُخصم منه المنح"""
+    global _central_admin_id
+    if _central_admin_id is None:
+        _central_admin_id = db.session.query(User.id).filter_by(is_admin=True).order_by(User.id).limit(1).scalar()
+    return _central_admin_id
+
+
+def ensure_treasury_shards(count=None):
+    """إنشاء الحسابات الفرعية الناقصة (يُستدعى عند بدء التطبيق)"""
+    global _shard_ids
+    count = count or config.TREASURY_SHARDS
+
+    try:
+        existing = {index for (index,) in db.session.query(TreasuryShard.shard_index)}
+        for index in range(count):
+            if index not in existing:
+                db.session.add(TreasuryShard(shard_index=index, balance=0))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في إنشاء حسابات الخزينة الفرعية: {str(e)}")
+
+    _shard_ids = [shard_id for (shard_id,) in db.session.query(TreasuryShard.id).order_by(TreasuryShard.id)]
+    return _shard_ids
+
+
+def _get_shard_ids():
+    global _shard_ids
+    if not _shard_ids:
+        _shard_ids = [shard_id for (shard_id,) in db.session.query(TreasuryShard.id).order_by(TreasuryShard.id)]
+    return _shard_ids
+
+
+def _adjust_shard(shard_id, amount, require_funds=False):
+    """تعديل رصيد حساب فرعي ذريًا، ويُرجع الرصيد الجديد أو None إذا لم يكن كافيًا"""
+    statement = db.update(TreasuryShard).where(TreasuryShard.id == shard_id)
+    if require_funds and amount < 0:
+        statement = statement.where(TreasuryShard.balance >= -amount)
+    return db.session.execute(
+        statement.values(balance=TreasuryShard.balance + amount, updated_at=db.func.now())
+        .returning(TreasuryShard.balance)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+
+
+def get_treasury_balance(admin_id=None):
+    """
+    رصيد الخزينة الكلي (رصيد المشرف + النقاط المحجوزة في الحسابات الفرعية)
+    يقرأ جميع الحسابات الفرعية، لذا يُستخدم للعرض والتقارير فقط وليس في مسار المنح
+    """
+    admin_id = admin_id or get_central_admin_id()
+    if not admin_id:
+        return 0
+    admin_points = db.session.query(User.points).filter_by(id=admin_id).scalar() or 0
+    escrowed = db.session.query(func.coalesce(func.sum(TreasuryShard.balance), 0)).scalar()
+    return admin_points + escrowed
+
+
+def _record_shard_transaction(admin_id, shard_id, amount, balance_after, transaction_type, description):
+    """تسجيل حركة على حساب فرعي ضمن سجل المشرف المركزي (balance_after = رصيد الحساب الفرعي)"""
+    db.session.add(PointsTransaction(
+        user_id=admin_id,
+        treasury_shard_id=shard_id,
+        amount=amount,
+        balance_after=balance_after,
+        transaction_type=transaction_type,
+        description=description
+    ))
+
+
+def _refill_shard(admin_id, shard_id, amount):
+    """
+    حجز دفعة من حساب المشرف في حساب فرعي مع تسجيل طرفي الحجز
+
+    Returns:
+        int: النقاط المحجوزة، أو None إذا لم يكن رصيد المشرف كافيًا
+    """
+    block = max(config.TREASURY_REFILL_BLOCK, amount)
+    admin_balance = User.increment_points(admin_id, -block, require_funds=True)
+    if admin_balance is None and block > amount:
+        block = amount
+        admin_balance = User.increment_points(admin_id, -block, require_funds=True)
+    if admin_balance is None:
+        return None
+
+    db.session.add(PointsTransaction(
+        user_id=admin_id,
+        amount=-block,
+        balance_after=admin_balance,
+        transaction_type='treasury_refill',
+        related_id=shard_id,
+        description=f"حجز {block} كربتو في حساب الخزينة الفرعي #{shard_id}"
+    ))
+    shard_balance = _adjust_shard(shard_id, block)
+    _record_shard_transaction(
+        admin_id, shard_id, block, shard_balance, 'treasury_refill',
+        f"حجز {block} كربتو من حساب المشرف"
+    )
+    app.logger.info(f"تم حجز {block} كربتو من حساب المشرف في الحساب الفرعي #{shard_id}")
+    return block
+
+
+def withdraw_from_treasury(admin_id, amount):
+    """
+    خصم منحة من الخزينة ضمن المعاملة الحالية (لا تنفذ commit)
+    تُجرّب الحسابات الفرعية بدءًا من حساب عشوائي، وعند نفادها يُحجز دفعة جديدة
+    من حساب المشرف في الحساب الفرعي الأول
+
+    Returns:
+        tuple: (معرف الحساب الفرعي أو None عند الخصم من حساب المشرف مباشرة،
+                الرصيد بعد الخصم من RETURNING في نفس التحديث)، أو None إذا لم تكن النقاط كافية
+    """
+    shard_ids = _get_shard_ids()
+    if not shard_ids:
+        # لا توجد حسابات فرعية: الخصم مباشرة من حساب المشرف
+        admin_balance = User.increment_points(admin_id, -amount, require_funds=True)
+        return None if admin_balance is None else (None, admin_balance)
+
+    start = random.randrange(len(shard_ids))
+    order = shard_ids[start:] + shard_ids[:start]
+    for shard_id in order:
+        shard_balance = _adjust_shard(shard_id, -amount, require_funds=True)
+        if shard_balance is not None:
+            return shard_id, shard_balance
+
+    # جميع الحسابات الفرعية لا تكفي: حجز دفعة جديدة من حساب المشرف
+    if _refill_shard(admin_id, order[0], amount) is None:
+        return None
+    return order[0], _adjust_shard(order[0], -amount)
+
+
+def rebalance_treasury():
+    """إعادة توزيع النقاط المحجوزة بالتساوي على الحسابات الفرعية مع تسجيل فرق كل حساب"""
+    try:
+        shards = TreasuryShard.query.order_by(TreasuryShard.id).with_for_update().all()
+        if not shards:
+            return 0
+
+        admin_id = get_central_admin_id()
+        total = sum(shard.balance or 0 for shard in shards)
+        share, remainder = divmod(total, len(shards))
+        for position, shard in enumerate(shards):
+            balance = share + (1 if position < remainder else 0)
+            delta = balance - (shard.balance or 0)
+            shard.balance = balance
+            if delta and admin_id:
+                _record_shard_transaction(
+                    admin_id, shard.id, delta, balance, 'treasury_rebalance', "إعادة توزيع رصيد الخزينة"
+                )
+        db.session.commit()
+        return total
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"خطأ في إعادة توزيع رصيد الخزينة: {str(e)}")
+        return None
+
+
+def _rebalance_loop(interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            rebalance_treasury()
+            db.session.remove()
+
+
+def start_treasury_rebalancer(interval=None):
+    """
+    بدء خيط خلفي يعيد توزيع رصيد الخزينة دوريًا
+    يُستدعى عند استيراد التطبيق وبعد fork في كل عامل gunicorn، ولا يبدأ أكثر من خيط واحد لكل عملية
+    """
+    global _rebalancer_thread, _rebalancer_pid
+    with _rebalancer_lock:
+        if _rebalancer_pid == os.getpid() and _rebalancer_thread is not None and _rebalancer_thread.is_alive():
+            return _rebalancer_thread
+
+        _rebalancer_thread = threading.Thread(
+            target=_rebalance_loop,
+            args=(interval or config.TREASURY_REBALANCE_INTERVAL,),
+            daemon=True
+        )
+        _rebalancer_thread.start()
+        _rebalancer_pid = os.getpid()
+    return _rebalancer_thread
@@ -85,7 +85,8 @@ def main():
             ("show_results_immediately", "BOOLEAN DEFAULT TRUE"),
             ("allow_multiple_attempts", "BOOLEAN DEFAULT FALSE"),
             ("penalty_for_wrong_answers", "INTEGER DEFAULT 0"),
-            ("bonus_points", "INTEGER DEFAULT 0")
+            ("bonus_points", "INTEGER DEFAULT 0"),
+            ("answer_key_version", "INTEGER DEFAULT 1")
         ]
         
         for col_name, col_type in competition_columns:
@@ -126,7 +127,8 @@ def main():
             ("correct_answers", "INTEGER DEFAULT 0"),
             ("bonus_points", "INTEGER DEFAULT 0"),
             ("penalties", "INTEGER DEFAULT 0"),
-            ("time_bonus", "INTEGER DEFAULT 0")
+            ("time_bonus", "INTEGER DEFAULT 0"),
+            ("submission_key", "VARCHAR(64)")
         ]
         
         for col_name, col_type in participation_columns:
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+سكريبت لتحديث جدول grading_job لدعم مهام إعادة التصحيح في الخلفية
+يضيف العمود job_type ويجعل participation_id اختياريًا (مهام إعادة التصحيح تخص المسابقة كاملة)
+"""
+import sys
+import os
+import logging
+
+# تكوين سجل الأحداث
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# التأكد من تنفيذ السكريبت من الدليل الرئيسي للمشروع
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+try:
+    from app import app, db
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
+    logger.info("تم استيراد المكتبات بنجاح")
+except ImportError as e:
+    logger.error(f"خطأ في استيراد المكتبات: {e}")
+    sys.exit(1)
+
+
+def main():
+    """الدالة الرئيسية لتحديث قاعدة البيانات"""
+    with app.app_context():
+        try:
+            logger.info("بدء تحديث جدول grading_job")
+            db.session.execute(text(
+                "ALTER TABLE grading_job ADD COLUMN IF NOT EXISTS job_type VARCHAR(20) NOT NULL DEFAULT 'submission'"
+            ))
+            db.session.execute(text("ALTER TABLE grading_job ALTER COLUMN participation_id DROP NOT NULL"))
+            db.session.commit()
+            logger.info("تم تحديث جدول grading_job بنجاح")
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"خطأ أثناء تحديث قاعدة البيانات: {e}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
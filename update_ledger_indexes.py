@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+سكريبت لإنشاء الفهارس المركبة لجداول points_transaction و purchase_record و referral و reward في قواعد البيانات
+الموجودة (db.create_all لا يضيف فهارس إلى جداول منشأة مسبقًا)
+"""
+import sys
+import os
+import logging
+
+# تكوين سجل الأحداث
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# التأكد من تنفيذ السكريبت من الدليل الرئيسي للمشروع
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+try:
+    from app import app, db
+    from models import PointsTransaction, PurchaseRecord, Referral, Reward
+    from sqlalchemy.exc import SQLAlchemyError
+    logger.info("تم استيراد المكتبات بنجاح")
+except ImportError as e:
+    logger.error(f"خطأ في استيراد المكتبات: {e}")
+    sys.exit(1)
+
+
+def create_missing_indexes():
+    """إنشاء فهارس الجداول غير الموجودة"""
+    created = 0
+    with app.app_context():
+        for model in (PointsTransaction, PurchaseRecord, Referral, Reward):
+            for index in model.__table__.indexes:
+                try:
+                    logger.info(f"إنشاء الفهرس {index.name} إذا لم يكن موجودًا")
+                    index.create(db.engine, checkfirst=True)
+                    created += 1
+                except SQLAlchemyError as e:
+                    logger.error(f"خطأ في إنشاء الفهرس {index.name}: {e}")
+                    raise
+    return created
+
+
+def main():
+    """الدالة الرئيسية لتحديث قاعدة البيانات"""
+    try:
+        count = create_missing_indexes()
+        logger.info(f"تم التحقق من {count} فهرس")
+    except Exception as e:
+        logger.error(f"خطأ أثناء تحديث قاعدة البيانات: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
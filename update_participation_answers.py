@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+سكريبت لإنشاء جدول الإجابات المُصحّحة participation_answer وملئه من بيانات الإجابات
+المخزنة كـ JSON في عمود participation.answers_data للمشاركات المكتملة السابقة
+"""
+import sys
+import os
+import json
+import logging
+
+# تكوين سجل الأحداث
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# التأكد من تنفيذ السكريبت من الدليل الرئيسي للمشروع
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+try:
+    from app import app, db
+    from models import Participation, ParticipationAnswer, Question
+    from answer_key import CompiledQuestion
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
+    logger.info("تم استيراد المكتبات بنجاح")
+except ImportError as e:
+    logger.error(f"خطأ في استيراد المكتبات: {e}")
+    sys.exit(1)
+
+# عدد المشاركات المعالجة في كل دفعة
+BATCH_SIZE = 500
+
+
+def check_column_exists(table, column):
+    """التحقق مما إذا كان العمود موجودًا في الجدول"""
+    with app.app_context():
+        try:
+            query = text(f"""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name = '{table}' AND column_name = '{column}'
+            """)
+            result = db.session.execute(query).fetchone()
+            return result is not None
+        except SQLAlchemyError as e:
+            logger.error(f"خطأ في فحص وجود العمود: {e}")
+            return False
+
+
+def add_column_if_not_exists(table, column, column_type):
+    """إضافة عمود إلى الجدول إذا لم يكن موجودًا"""
+    if not check_column_exists(table, column):
+        with app.app_context():
+            try:
+                logger.info(f"إضافة العمود {column} إلى الجدول {table}")
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+                db.session.commit()
+                logger.info(f"تم إضافة العمود {column} بنجاح")
+                return True
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"خطأ في إضافة العمود: {e}")
+                return False
+    else:
+        logger.info(f"العمود {column} موجود بالفعل في الجدول {table}")
+        return False
+
+
+def load_competition_questions(competition_id):
+    """تجميع جميع أسئلة المسابقة (بما فيها غير النشطة) مع ترتيب الأسئلة النشطة"""
+    questions = Question.query.filter_by(competition_id=competition_id).order_by(Question.order).all()
+    compiled = {question.id: CompiledQuestion(question) for question in questions}
+    active_ids = [question.id for question in questions if question.is_active]
+    return compiled, active_ids
+
+
+def build_answer_rows(participation, compiled, active_ids):
+    """إنشاء صفوف الإجابات المُصحّحة لمشاركة واحدة من بيانات JSON"""
+    try:
+        user_answers = json.loads(participation.answers_data)
+    except (ValueError, TypeError):
+        logger.warning(f"تعذر تحليل بيانات الإجابات للمشاركة #{participation.id}")
+        return []
+    if not isinstance(user_answers, dict):
+        return []
+
+    # الأسئلة النشطة أولاً ثم أي سؤال أُجيب عليه وأصبح غير نشط لاحقًا
+    question_ids = list(active_ids)
+    for key in user_answers:
+        if key.isdigit() and int(key) in compiled and int(key) not in question_ids:
+            question_ids.append(int(key))
+
+    rows = []
+    for position, question_id in enumerate(question_ids):
+        compiled_question = compiled[question_id]
+        row = {
+            'participation_id': participation.id,
+            'competition_id': participation.competition_id,
+            'question_id': question_id,
+            'user_id': participation.user_id,
+            'position': position,
+            'answer': None,
+            'is_correct': False,
+            'points_earned': 0,
+            'user_answer_text': 'لم تتم الإجابة',
+            'correct_answer_text': compiled_question.correct_text,
+            'created_at': participation.completed_at or participation.created_at,
+        }
+        if str(question_id) in user_answers:
+            user_answer = user_answers[str(question_id)]
+            is_correct, points_earned, _ = compiled_question.check(user_answer)
+            row['answer'] = user_answer if isinstance(user_answer, str) else json.dumps(user_answer)
+            row['is_correct'] = is_correct
+            row['points_earned'] = points_earned
+            row['user_answer_text'] = str(compiled_question.answer_text(user_answer))
+        rows.append(row)
+    return rows
+
+
+def backfill_participation_answers():
+    """ملء جدول الإجابات المُصحّحة على دفعات للمشاركات التي لا تملك صفوفًا بعد"""
+    total_participations = 0
+    total_rows = 0
+    competitions = {}
+    last_id = 0
+
+    with app.app_context():
+        while True:
+            # مشاركات مكتملة لم تُنقل بعد (مرتبة حسب المعرف للتقدم على دفعات)
+            already_migrated = db.session.query(ParticipationAnswer.id).filter(
+                ParticipationAnswer.competition_id == Participation.competition_id,
+                ParticipationAnswer.user_id == Participation.user_id
+            ).exists()
+            batch = Participation.query.filter(
+                Participation.id > last_id,
+                Participation.completed == True,
+                Participation.answers_data.isnot(None),
+                ~already_migrated
+            ).order_by(Participation.id).limit(BATCH_SIZE).all()
+
+            if not batch:
+                break
+
+            rows = []
+            seen = set()
+            for participation in batch:
+                # تجاهل المشاركات المكررة لنفس المستخدم في نفس المسابقة
+                participant_key = (participation.competition_id, participation.user_id)
+                if participant_key in seen:
+                    logger.warning(f"تم تجاهل مشاركة مكررة #{participation.id} للمستخدم #{participation.user_id}")
+                    continue
+                seen.add(participant_key)
+
+                if participation.competition_id not in competitions:
+                    competitions[participation.competition_id] = load_competition_questions(participation.competition_id)
+                compiled, active_ids = competitions[participation.competition_id]
+
+                rows.extend(build_answer_rows(participation, compiled, active_ids))
+                total_participations += 1
+
+            try:
+                if rows:
+                    db.session.bulk_insert_mappings(ParticipationAnswer, rows)
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"خطأ في إدخال دفعة الإجابات بعد المشاركة #{last_id}: {e}")
+                raise
+
+            total_rows += len(rows)
+            last_id = batch[-1].id
+            logger.info(f"تمت معالجة {total_participations} مشاركة ({total_rows} إجابة) حتى المشاركة #{last_id}")
+
+    return total_participations, total_rows
+
+
+def main():
+    """الدالة الرئيسية لتحديث قاعدة البيانات"""
+    try:
+        logger.info("بدء إنشاء جدول الإجابات المُصحّحة")
+
+        # إنشاء الجدول إذا لم يكن موجودًا
+        with app.app_context():
+            ParticipationAnswer.__table__.create(db.engine, checkfirst=True)
+
+        # قواعد البيانات التي أُنشئ فيها الجدول قبل إضافة عمود الوقت
+        add_column_if_not_exists('participation_answer', 'time_spent', 'INTEGER')
+
+        # المفتاح الفريد (المسابقة، السؤال، المستخدم) لقواعد البيانات التي أُنشئ فيها الجدول بدونه
+        with app.app_context():
+            db.session.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_participation_answer_question_user
+                ON participation_answer (competition_id, question_id, user_id)
+            """))
+            db.session.commit()
+
+        participations, rows = backfill_participation_answers()
+        logger.info(f"تم نقل {participations} مشاركة ({rows} إجابة) إلى جدول الإجابات المُصحّحة")
+    except Exception as e:
+        logger.error(f"خطأ أثناء تحديث قاعدة البيانات: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
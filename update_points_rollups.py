@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+سكريبت لإنشاء جدول تجميعات النقاط الدورية points_rollup وإعادة بنائه من سجل معاملات النقاط
+يجب تشغيله والتطبيق متوقف، لأن المعاملات الجديدة تُجمَّع تلقائيًا أثناء عمل التطبيق
+"""
+import sys
+import os
+import logging
+
+# تكوين سجل الأحداث
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# التأكد من تنفيذ السكريبت من الدليل الرئيسي للمشروع
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+try:
+    from app import app, db
+    from models import PointsRollup, PointsTransaction
+    from points_rollup import record_transactions_rollup
+    from sqlalchemy.exc import SQLAlchemyError
+    logger.info("تم استيراد المكتبات بنجاح")
+except ImportError as e:
+    logger.error(f"خطأ في استيراد المكتبات: {e}")
+    sys.exit(1)
+
+# عدد المعاملات المعالجة في كل دفعة
+BATCH_SIZE = 5000
+
+
+def rebuild_points_rollups():
+    """حذف التجميعات الحالية وإعادة حسابها من سجل المعاملات على دفعات"""
+    total = 0
+    last_id = 0
+
+    with app.app_context():
+        try:
+            PointsRollup.query.delete()
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"خطأ في حذف التجميعات الحالية: {e}")
+            raise
+
+        while True:
+            batch = db.session.query(
+                PointsTransaction.id,
+                PointsTransaction.user_id,
+                PointsTransaction.amount,
+                PointsTransaction.created_at
+            ).filter(
+                PointsTransaction.id > last_id
+            ).order_by(PointsTransaction.id).limit(BATCH_SIZE).all()
+
+            if not batch:
+                break
+
+            try:
+                record_transactions_rollup([row._asdict() for row in batch])
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"خطأ في تجميع دفعة المعاملات بعد المعاملة #{last_id}: {e}")
+                raise
+
+            total += len(batch)
+            last_id = batch[-1].id
+            logger.info(f"تم تجميع {total} معاملة حتى المعاملة #{last_id}")
+
+    return total
+
+
+def main():
+    """الدالة الرئيسية لتحديث قاعدة البيانات"""
+    try:
+        logger.info("بدء إنشاء جدول تجميعات النقاط الدورية")
+
+        # إنشاء الجدول إذا لم يكن موجودًا
+        with app.app_context():
+            PointsRollup.__table__.create(db.engine, checkfirst=True)
+
+        total = rebuild_points_rollups()
+        logger.info(f"تم تجميع {total} معاملة في جدول التجميعات الدورية")
+    except Exception as e:
+        logger.error(f"خطأ أثناء تحديث قاعدة البيانات: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())